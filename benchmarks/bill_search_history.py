@@ -0,0 +1,115 @@
+"""Bill search latency as the bill record history grows.
+
+Adds months of history before a fixed target month, which always holds the
+same calls, and measures searching a subscriber's bill for that month after
+each step:
+
+    python -m benchmarks.bill_search_history --history 1 4 16
+
+Pass --no-partitions to leave every row in the default partition, as the
+table was before it was partitioned.
+"""
+import argparse
+
+from .common import measure, setup_django, summarize, test_database, \
+    write_results
+
+
+GENERATE_CALLS_SQL = '''
+    INSERT INTO call_call
+        (id, source, destination, started_at, ended_at, duration)
+    SELECT id, lpad((id %% %(subscribers)s)::text, 11, '0'), '10123456789',
+        ended_at - interval '3 minutes', ended_at, interval '3 minutes'
+    FROM generate_series(%(first_id)s, %(last_id)s) id,
+    LATERAL (SELECT %(period)s::timestamptz
+                    + (id %% 27) * interval '1 day'
+                    + (id %% 86400) * interval '1 second' AS ended_at) ended
+'''
+
+GENERATE_BILL_RECORDS_SQL = '''
+    INSERT INTO bill_billrecord (call_id, subscriber, period, price)
+    SELECT id, source, %(period)s::date, 0.63
+    FROM call_call
+    WHERE id BETWEEN %(first_id)s AND %(last_id)s
+'''
+
+
+def generate_month(period, month_index, calls, subscribers):
+    from django.db import connection
+
+    params = {
+        'period': period,
+        'first_id': month_index * calls + 1,
+        'last_id': (month_index + 1) * calls,
+        'subscribers': subscribers,
+    }
+    with connection.cursor() as cursor:
+        cursor.execute(GENERATE_CALLS_SQL, params)
+        cursor.execute(GENERATE_BILL_RECORDS_SQL, params)
+
+
+def search_bill(subscriber, period):
+    from phone_billing.bill.serializers import BillSerializer
+
+    serializer = BillSerializer(data={'subscriber': subscriber,
+                                      'period': f'{period:%m/%Y}'})
+    serializer.is_valid(raise_exception=True)
+    serializer.search_bill_records()
+    return serializer.data
+
+
+def run(history, calls, subscribers, repeat, partitions):
+    from django.db import connection
+
+    from phone_billing.bill.models import BillRecord
+    from phone_billing.bill.partitions import PartitionMaintenance
+    from phone_billing.bill.periods import add_months, get_previous_period
+
+    target = get_previous_period()
+    subscriber = '1'.zfill(11)
+    results = []
+    months = 0
+    for size in sorted(history):
+        while months < size:
+            generate_month(add_months(target, -months), months, calls,
+                           subscribers)
+            months += 1
+
+        if partitions:
+            PartitionMaintenance(months_ahead=0).run()
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE bill_billrecord')
+
+        search_bill(subscriber, target)
+        samples = measure(lambda: search_bill(subscriber, target), repeat)
+        result = dict(months=months, rows=BillRecord.objects.count(),
+                      **summarize(samples))
+        results.append(result)
+        print(f'{result["months"]:>6} months {result["rows"]:>10} rows'
+              f'  p50 {result["p50"]:.2f}ms  p95 {result["p95"]:.2f}ms'
+              f'  p99 {result["p99"]:.2f}ms')
+
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--history', type=int, nargs='+', default=[1, 4, 16],
+                        help='Months of history to measure at.')
+    parser.add_argument('--calls', type=int, default=20000,
+                        help='Calls per month.')
+    parser.add_argument('--subscribers', type=int, default=1000)
+    parser.add_argument('--repeat', type=int, default=200)
+    parser.add_argument('--no-partitions', action='store_true')
+    parser.add_argument('--output', help='Write the results as JSON.')
+    args = parser.parse_args()
+
+    setup_django()
+    with test_database():
+        results = run(args.history, args.calls, args.subscribers,
+                      args.repeat, not args.no_partitions)
+    write_results(args.output, results)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,132 @@
+"""Bill search latency and query counts as the call records dataset grows.
+
+Grows a synthetic dataset, written by the generate_cdrs generator and loaded
+by the import_cdrs importer, to each size in turn (in calls), and measures
+requests to the Subscriber Bill Records endpoint for random subscribers of
+last month after each step:
+
+    python -m benchmarks.bill_search_scale --sizes 10000 100000 1000000 \\
+        --output bill_search_scale.json
+
+Bills are searched from their bill records, the bill cache is cleared
+before every request.
+"""
+import argparse
+import os
+import random
+import tempfile
+import time
+
+from .common import measure, setup_django, summarize, test_database, \
+    write_results
+
+
+def grow(directory, subscribers, target, calls_per_subscriber, period, seed,
+         workers):
+    from phone_billing.bill.partitions import PartitionMaintenance
+    from phone_billing.call.generator import CallRecordGenerator
+    from phone_billing.call.importer import CallRecordImport
+
+    path = os.path.join(directory, f'records_{target}.csv')
+    CallRecordGenerator(
+        path, subscribers=target - subscribers,
+        calls_per_subscriber=calls_per_subscriber, start=period, seed=seed,
+        first_subscriber=subscribers,
+        first_call_id=subscribers * calls_per_subscriber + 1).run()
+
+    started_at = time.monotonic()
+    CallRecordImport([path], name=f'benchmark_{target}',
+                     workers=workers).run()
+    PartitionMaintenance(months_ahead=0).run()
+    os.remove(path)
+    return time.monotonic() - started_at
+
+
+def search_bill(client, subscriber, period):
+    from django.db import connection
+    from django.test.utils import CaptureQueriesContext
+
+    from phone_billing.bill.cache import get_bill_cache
+
+    get_bill_cache().clear()
+    with CaptureQueriesContext(connection) as queries:
+        response = client.get(f'/api/bill/{subscriber}/',
+                              {'period': f'{period:%m/%Y}'})
+    assert response.status_code == 200, response.content
+    return len(queries), len(response.data['bill_records'])
+
+
+def run(sizes, calls_per_subscriber, repeat, seed, workers):
+    from django.db import connection
+    from django.test import Client
+
+    from phone_billing.bill.models import BillRecord
+    from phone_billing.bill.periods import get_previous_period
+    from phone_billing.call.generator import get_subscriber_phone
+    from phone_billing.call.models import CallRecord
+
+    client = Client()
+    period = get_previous_period()
+    rng = random.Random(seed)
+    results = []
+    subscribers = 0
+    with tempfile.TemporaryDirectory() as directory:
+        for size in sorted(sizes):
+            target = max(size // calls_per_subscriber, subscribers + 1)
+            import_seconds = grow(directory, subscribers, target,
+                                  calls_per_subscriber, period, seed,
+                                  workers)
+            subscribers = target
+            with connection.cursor() as cursor:
+                cursor.execute('ANALYZE')
+
+            phones = iter([get_subscriber_phone(rng.randrange(subscribers))
+                           for _ in range(repeat)])
+            searches = []
+            search_bill(client, get_subscriber_phone(0), period)
+            samples = measure(lambda: searches.append(
+                search_bill(client, next(phones), period)), repeat)
+
+            result = dict(
+                calls=subscribers * calls_per_subscriber,
+                call_records=CallRecord.objects.count(),
+                bill_records=BillRecord.objects.count(),
+                subscribers=subscribers,
+                import_seconds=import_seconds,
+                queries=max(queries for queries, _ in searches),
+                bill_size=sum(size for _, size in searches) / len(searches),
+                **summarize(samples))
+            results.append(result)
+            print(f'{result["calls"]:>10} calls {result["bill_records"]:>10}'
+                  f' bill records  p50 {result["p50"]:.2f}ms'
+                  f'  p95 {result["p95"]:.2f}ms  p99 {result["p99"]:.2f}ms'
+                  f'  {result["queries"]} queries')
+
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', type=int, nargs='+',
+                        default=[10000, 100000, 1000000],
+                        help='Numbers of calls to measure at.')
+    parser.add_argument('--calls-per-subscriber', type=int, default=100)
+    parser.add_argument('--repeat', type=int, default=200)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--workers', type=int, default=os.cpu_count(),
+                        help='Import worker processes.')
+    parser.add_argument('--output', help='Write the results as JSON.')
+    args = parser.parse_args()
+
+    setup_django()
+    from django.test.utils import setup_test_environment
+    setup_test_environment()
+
+    with test_database():
+        results = run(args.sizes, args.calls_per_subscriber, args.repeat,
+                      args.seed, args.workers)
+    write_results(args.output, results)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,70 @@
+import json
+import os
+import subprocess
+import sys
+import time
+from contextlib import contextmanager
+
+import django
+
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def setup_django():
+    sys.path.insert(0, ROOT)
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'phone_billing.settings')
+    django.setup()
+
+
+@contextmanager
+def test_database():
+    """Runs the benchmark on a freshly migrated database, like the tests."""
+    from django.db import connection
+
+    old_name = connection.settings_dict['NAME']
+    connection.creation.create_test_db(verbosity=0, autoclobber=True)
+    try:
+        yield
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+
+
+def measure(function, repeat):
+    samples = []
+    for _ in range(repeat):
+        started_at = time.perf_counter()
+        function()
+        samples.append((time.perf_counter() - started_at) * 1000)
+    return samples
+
+
+def percentile(samples, percent):
+    samples = sorted(samples)
+    index = min(len(samples) - 1, int(round(percent / 100 * len(samples))))
+    return samples[index]
+
+
+def summarize(samples):
+    return {
+        'p50': percentile(samples, 50),
+        'p95': percentile(samples, 95),
+        'p99': percentile(samples, 99),
+    }
+
+
+def get_revision():
+    try:
+        return subprocess.check_output(
+            ['git', 'rev-parse', 'HEAD'], cwd=ROOT,
+            stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def write_results(path, results):
+    """Writes results along with the commit they were measured at."""
+    if path:
+        with open(path, 'w') as file:
+            json.dump({'revision': get_revision(), 'results': results}, file,
+                      indent=2, default=str)
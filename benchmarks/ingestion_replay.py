@@ -0,0 +1,189 @@
+"""Ingestion throughput replaying recorded request bodies in-process.
+
+Every line of the replayed file is the JSON body of one POST request, such
+as the NDJSON files written by generate_cdrs. The bodies are posted straight
+to the WSGI application, without a network or a server, from concurrent
+threads or processes:
+
+    python manage.py generate_cdrs traffic.ndjson --subscribers 100
+    python -m benchmarks.ingestion_replay traffic.ndjson --concurrency 1 4
+
+Bodies are split among the clients by call id, so each call's records are
+still posted in order. The tables are emptied before every run.
+"""
+import argparse
+import io
+import json
+import logging
+import time
+from multiprocessing import Pool
+from multiprocessing.pool import ThreadPool
+
+from .common import setup_django, summarize, test_database, write_results
+
+
+POOLS = {'process': Pool, 'thread': ThreadPool}
+
+
+def read_bodies(path, limit=None):
+    bodies = []
+    with open(path, 'rb') as file:
+        for line in file:
+            if line.strip():
+                bodies.append(line.strip())
+            if limit and len(bodies) >= limit:
+                break
+    return bodies
+
+
+def get_call_id(body):
+    data = json.loads(body)
+    if isinstance(data, list):
+        data = data[0] if data else {}
+    return int(data.get('call_id', 0))
+
+
+def count_records(body):
+    data = json.loads(body)
+    return len(data) if isinstance(data, list) else 1
+
+
+def get_environ(endpoint, body):
+    return {
+        'REQUEST_METHOD': 'POST',
+        'PATH_INFO': endpoint,
+        'SCRIPT_NAME': '',
+        'QUERY_STRING': '',
+        'SERVER_NAME': 'testserver',
+        'SERVER_PORT': '80',
+        'SERVER_PROTOCOL': 'HTTP/1.1',
+        'HTTP_HOST': 'testserver',
+        'CONTENT_TYPE': 'application/json',
+        'CONTENT_LENGTH': str(len(body)),
+        'wsgi.input': io.BytesIO(body),
+        'wsgi.errors': io.StringIO(),
+        'wsgi.url_scheme': 'http',
+        'wsgi.version': (1, 0),
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': True,
+        'wsgi.run_once': False,
+    }
+
+
+def post(application, endpoint, body):
+    statuses = []
+    response = application(get_environ(endpoint, body),
+                           lambda status, headers: statuses.append(status))
+    try:
+        for _ in response:
+            pass
+    finally:
+        response.close()
+    return int(statuses[0].split()[0])
+
+
+def replay(task):
+    from django.core.wsgi import get_wsgi_application
+    from django.db import connection
+
+    endpoint, bodies = task
+    application = get_wsgi_application()
+    queries = []
+
+    def count_query(execute, sql, params, many, context):
+        queries.append(sql)
+        return execute(sql, params, many, context)
+
+    results = []
+    try:
+        with connection.execute_wrapper(count_query):
+            for body in bodies:
+                queries.clear()
+                started_at = time.perf_counter()
+                status = post(application, endpoint, body)
+                elapsed = (time.perf_counter() - started_at) * 1000
+                results.append((elapsed, status, len(queries)))
+    finally:
+        connection.close()
+    return results
+
+
+def reset_tables():
+    from django.db import connection
+
+    from phone_billing.bill.cache import get_bill_cache
+
+    with connection.cursor() as cursor:
+        cursor.execute('TRUNCATE call_call CASCADE')
+    get_bill_cache().clear()
+
+
+def run(bodies, endpoint, concurrency_levels, pool_name):
+    from django.db import connections
+
+    call_ids = [get_call_id(body) for body in bodies]
+    records = sum(count_records(body) for body in bodies)
+    results = []
+    for concurrency in sorted(concurrency_levels):
+        reset_tables()
+        tasks = [(endpoint, [body for body, call_id in zip(bodies, call_ids)
+                             if call_id % concurrency == client])
+                 for client in range(concurrency)]
+
+        # Forked clients must open their own database connections.
+        connections.close_all()
+        started_at = time.perf_counter()
+        with POOLS[pool_name](concurrency) as pool:
+            requests = [request for client_requests in pool.map(replay, tasks)
+                        for request in client_requests]
+        elapsed = time.perf_counter() - started_at
+
+        statuses = {}
+        for _, status, _ in requests:
+            statuses[str(status)] = statuses.get(str(status), 0) + 1
+        result = dict(
+            concurrency=concurrency, pool=pool_name, requests=len(requests),
+            records=records, seconds=elapsed,
+            records_per_second=records / elapsed,
+            queries_per_record=sum(queries for _, _, queries in requests)
+            / records,
+            statuses=statuses,
+            **summarize([latency for latency, _, _ in requests]))
+        results.append(result)
+        print(f'{concurrency:>4} {pool_name}s'
+              f'  {result["records_per_second"]:>8.0f} records/s'
+              f'  p50 {result["p50"]:.2f}ms  p95 {result["p95"]:.2f}ms'
+              f'  p99 {result["p99"]:.2f}ms'
+              f'  {result["queries_per_record"]:.1f} queries/record'
+              f'  {statuses}')
+
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('path', help='File with one request body per line.')
+    parser.add_argument('--endpoint', default='/api/call/records/',
+                        help='Path the bodies are posted to.')
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 4],
+                        help='Numbers of concurrent clients to measure at.')
+    parser.add_argument('--pool', choices=sorted(POOLS), default='thread')
+    parser.add_argument('--limit', type=int,
+                        help='Replay only the first bodies of the file.')
+    parser.add_argument('--output', help='Write the results as JSON.')
+    args = parser.parse_args()
+
+    setup_django()
+    from django.test.utils import setup_test_environment
+    setup_test_environment()
+    # Rejected bodies are counted by status instead of logged.
+    logging.getLogger('django.request').setLevel(logging.ERROR)
+
+    bodies = read_bodies(args.path, args.limit)
+    with test_database():
+        results = run(bodies, args.endpoint, args.concurrency, args.pool)
+    write_results(args.output, results)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,147 @@
+"""Nanoseconds and memory per call of the pricing functions.
+
+Prices the sample calls of the initial data through calculate_call_charge,
+get_tariff and BaseTariff.calculate, from short calls to calls crossing the
+06:00 and 22:00 tariff boundaries and calls lasting more than a day:
+
+    python -m benchmarks.pricing --output baseline.json
+    python -m benchmarks.pricing --baseline baseline.json --threshold 0.2
+
+With --baseline, the results are compared with an earlier --output of this
+benchmark and the run fails when any case got slower by more than the
+threshold.
+"""
+import argparse
+import json
+import statistics
+import sys
+import time
+import tracemalloc
+from datetime import datetime, timezone
+
+from .common import setup_django, test_database, write_results
+
+
+# Sample calls 71, 73, 74 and 75 of fixtures/initial_data.json.
+SAMPLE_CALLS = {
+    'short': ('2017-12-12T15:07:13', '2017-12-12T15:14:56'),
+    'crossing_22h': ('2017-12-12T21:57:13', '2017-12-12T22:10:56'),
+    'crossing_06h': ('2017-12-12T04:57:13', '2017-12-12T06:10:56'),
+    'multi_day': ('2017-12-12T21:57:13', '2017-12-13T22:10:56'),
+}
+
+
+def parse(value):
+    return datetime.fromisoformat(value).replace(tzinfo=timezone.utc)
+
+
+def get_cases():
+    from phone_billing.bill.pricing import (StandardTariff,
+                                            calculate_call_charge, get_tariff)
+
+    calls = {name: (parse(start), parse(end))
+             for name, (start, end) in SAMPLE_CALLS.items()}
+    cases = {}
+    for name, (start, end) in calls.items():
+        cases[f'calculate_call_charge_{name}'] = \
+            lambda start=start, end=end: calculate_call_charge(start, end)
+    for name in ('short', 'crossing_22h'):
+        end = calls[name][1]
+        cases[f'get_tariff_{name}'] = lambda end=end: get_tariff(end)
+    for name in ('short', 'multi_day'):
+        duration = calls[name][1] - calls[name][0]
+        cases[f'calculate_{name}'] = \
+            lambda duration=duration: StandardTariff.calculate(duration)
+    return cases
+
+
+def measure_nanoseconds(function, number, repeat):
+    """Median nanoseconds per call over repeat loops of number calls."""
+    samples = []
+    for _ in range(repeat):
+        started_at = time.perf_counter_ns()
+        for _ in range(number):
+            function()
+        samples.append((time.perf_counter_ns() - started_at) / number)
+    return statistics.median(samples)
+
+
+def measure_peak_bytes(function):
+    """Peak memory allocated by Python while the function runs once."""
+    tracemalloc.start()
+    try:
+        function()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def run(number, repeat):
+    from unittest.mock import patch
+
+    from phone_billing.bill.models import TariffPlan
+
+    results = []
+    # Keep the tariff plans loaded for the whole run, rather than measuring
+    # the query checking their version.
+    version = TariffPlan.objects.get_version()
+    with patch.object(type(TariffPlan.objects), 'get_version',
+                      return_value=version):
+        for name, function in get_cases().items():
+            function()
+            result = dict(case=name,
+                          ns_per_call=measure_nanoseconds(function, number,
+                                                          repeat),
+                          peak_bytes=measure_peak_bytes(function))
+            results.append(result)
+            print(f'{name:<36} {result["ns_per_call"]:>10.0f} ns/call'
+                  f'  {result["peak_bytes"]:>6} bytes peak')
+
+    return results
+
+
+def find_regressions(results, path, threshold):
+    with open(path) as file:
+        baseline = {result['case']: result
+                    for result in json.load(file)['results']}
+
+    regressions = []
+    for result in results:
+        previous = baseline.get(result['case'])
+        if previous is None:
+            continue
+        change = result['ns_per_call'] / previous['ns_per_call'] - 1
+        print(f'{result["case"]:<36} {change:>+9.1%} vs baseline')
+        if change > threshold:
+            regressions.append(result['case'])
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--number', type=int, default=10000,
+                        help='Calls per timing loop.')
+    parser.add_argument('--repeat', type=int, default=7,
+                        help='Timing loops per case.')
+    parser.add_argument('--baseline',
+                        help='Results of an earlier run to compare with.')
+    parser.add_argument('--threshold', type=float, default=0.2,
+                        help='Largest allowed slowdown against the baseline, '
+                             'as a fraction.')
+    parser.add_argument('--output', help='Write the results as JSON.')
+    args = parser.parse_args()
+
+    setup_django()
+    with test_database():
+        results = run(args.number, args.repeat)
+    write_results(args.output, results)
+
+    if args.baseline:
+        regressions = find_regressions(results, args.baseline, args.threshold)
+        if regressions:
+            sys.exit(f'Slower than the baseline by more than '
+                     f'{args.threshold:.0%}: {", ".join(regressions)}')
+
+
+if __name__ == '__main__':
+    main()
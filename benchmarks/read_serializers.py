@@ -0,0 +1,114 @@
+"""Rows per second of the DRF and values() read serializers.
+
+Serializes and renders pages of call records and a bill's records both
+through the DRF serializers and through their values() counterparts:
+
+    python -m benchmarks.read_serializers --rows 1000 10000
+"""
+import argparse
+
+from .common import measure, setup_django, summarize, test_database, \
+    write_results
+
+
+GENERATE_CALLS_SQL = '''
+    INSERT INTO call_call
+        (id, source, destination, started_at, ended_at, duration)
+    SELECT id, '00123456789', '10123456789',
+        now() - interval '1 month' - id * interval '1 minute',
+        now() - interval '1 month' - id * interval '1 minute'
+            + interval '3 minutes',
+        interval '3 minutes'
+    FROM generate_series(1, %(rows)s) id
+'''
+
+GENERATE_CALL_RECORDS_SQL = '''
+    INSERT INTO call_callrecord (id, call_id, record_type, timestamp)
+    SELECT id, id, 'start', started_at
+    FROM call_call
+'''
+
+GENERATE_BILL_RECORDS_SQL = '''
+    INSERT INTO bill_billrecord (call_id, subscriber, period, price)
+    SELECT id, source, date_trunc('month', ended_at)::date, 0.63
+    FROM call_call
+'''
+
+
+def generate(rows):
+    from django.db import connection
+
+    with connection.cursor() as cursor:
+        cursor.execute('TRUNCATE call_call CASCADE')
+        cursor.execute(GENERATE_CALLS_SQL, {'rows': rows})
+        cursor.execute(GENERATE_CALL_RECORDS_SQL)
+        cursor.execute(GENERATE_BILL_RECORDS_SQL)
+        cursor.execute('ANALYZE')
+
+
+def get_cases(rows):
+    from django.test import RequestFactory
+    from rest_framework.renderers import JSONRenderer
+
+    from phone_billing.bill.models import BillRecord
+    from phone_billing.bill.serializers import (BillRecordSerializer,
+                                                BillRecordValuesSerializer)
+    from phone_billing.call.models import CallRecord
+    from phone_billing.call.serializers import (CallRecordSerializer,
+                                                CallRecordValuesSerializer)
+
+    render = JSONRenderer().render
+    context = {'request': RequestFactory().get('/api/call/records/')}
+    call_records = CallRecord.objects.order_by('timestamp', 'id')[:rows]
+    bill_records = BillRecord.objects.order_by('id')[:rows]
+
+    def render_values(serializer, queryset):
+        return render([serializer.to_representation(row)
+                       for row in serializer.get_queryset(queryset)])
+
+    return {
+        'call_records_drf': lambda: render(CallRecordSerializer(
+            call_records.select_related('call'), many=True,
+            context=context).data),
+        'call_records_values': lambda: render_values(
+            CallRecordValuesSerializer(context), call_records),
+        # Lists of instances still go through the DRF fields.
+        'bill_records_drf': lambda: render(BillRecordSerializer(
+            list(bill_records.select_related('call')), many=True).data),
+        'bill_records_values': lambda: render_values(
+            BillRecordValuesSerializer(), bill_records),
+    }
+
+
+def run(sizes, repeat):
+    results = []
+    for rows in sorted(sizes):
+        generate(rows)
+        for name, function in get_cases(rows).items():
+            function()
+            samples = measure(function, repeat)
+            result = dict(case=name, rows=rows, **summarize(samples))
+            result['rows_per_second'] = rows / result['p50'] * 1000
+            results.append(result)
+            print(f'{name:<20} {rows:>8} rows  p50 {result["p50"]:.2f}ms'
+                  f'  {result["rows_per_second"]:>10.0f} rows/s')
+
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, nargs='+', default=[1000, 10000],
+                        help='Rows serialized per request.')
+    parser.add_argument('--repeat', type=int, default=20)
+    parser.add_argument('--output', help='Write the results as JSON.')
+    args = parser.parse_args()
+
+    setup_django()
+    with test_database():
+        results = run(args.rows, args.repeat)
+    write_results(args.output, results)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,3 +1,44 @@
 from django.contrib import admin
 
-# Register your models here.
+from .models import BillRecordRevision, Tariff, TariffPlan
+
+
+# Plans in effect or used by bill records are read-only, see
+# TariffPlan.is_locked.
+class TariffInline(admin.TabularInline):
+    model = Tariff
+
+    def has_add_permission(self, request, obj=None):
+        return ((obj is None or not obj.is_locked())
+                and super().has_add_permission(request, obj))
+
+    def has_change_permission(self, request, obj=None):
+        return ((obj is None or not obj.is_locked())
+                and super().has_change_permission(request, obj))
+
+    def has_delete_permission(self, request, obj=None):
+        return ((obj is None or not obj.is_locked())
+                and super().has_delete_permission(request, obj))
+
+
+@admin.register(TariffPlan)
+class TariffPlanAdmin(admin.ModelAdmin):
+    list_display = ('effective_from', 'created_at')
+    inlines = (TariffInline,)
+
+    def get_readonly_fields(self, request, obj=None):
+        if obj is not None and obj.is_locked():
+            return ('effective_from',)
+        return super().get_readonly_fields(request, obj)
+
+    def has_delete_permission(self, request, obj=None):
+        return ((obj is None or not obj.is_locked())
+                and super().has_delete_permission(request, obj))
+
+
+@admin.register(BillRecordRevision)
+class BillRecordRevisionAdmin(admin.ModelAdmin):
+    list_display = ('call_id', 'period', 'old_price', 'new_price',
+                    'reason', 'revised_at')
+    list_filter = ('period',)
+    search_fields = ('call_id',)
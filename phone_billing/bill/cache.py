@@ -0,0 +1,90 @@
+from uuid import uuid4
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+
+from ..metrics import request_metrics
+
+from .periods import is_closed_period
+
+
+def get_bill_cache():
+    return caches[settings.BILL_CACHE_ALIAS]
+
+
+def get_bill_cache_key(subscriber, period):
+    return f'bill:{subscriber}:{period:%Y-%m}'
+
+
+def get_bill_version_key(subscriber, period):
+    return f'bill-version:{subscriber}:{period:%Y-%m}'
+
+
+def get_bill_version(subscriber, period):
+    """Returns a token standing for the current version of a bill.
+
+    The token is dropped whenever the bill is invalidated, and a new one made
+    up by the next request reading it. Read it before the bill, so that a
+    bill changing in between is paired with the former token, which is not
+    matched again, rather than the other way around.
+    """
+    cache = get_bill_cache()
+    key = get_bill_version_key(subscriber, period)
+    version = cache.get(key)
+    if version is None:
+        version = uuid4().hex
+        # Another request may have made one up first.
+        cache.add(key, version, timeout=None)
+        version = cache.get(key, version)
+    return version
+
+
+def get_cached_bill(subscriber, period, version):
+    """Returns the cached (data, last modified) of a bill, if cached at the
+    given version."""
+    if not is_closed_period(period):
+        return None
+
+    entry = get_bill_cache().get(get_bill_cache_key(subscriber, period))
+    if entry is not None and entry['version'] != version:
+        entry = None
+    request_metrics.count_bill_cache_lookup(hit=entry is not None)
+    if entry is None:
+        return None
+    return entry['data'], entry['last_modified']
+
+
+def cache_bill(subscriber, period, version, data, last_modified=None):
+    if is_closed_period(period):
+        get_bill_cache().set(get_bill_cache_key(subscriber, period), {
+            'version': version,
+            'data': data,
+            'last_modified': last_modified,
+        }, settings.BILL_CACHE_TIMEOUT)
+
+
+def invalidate_bills(periods):
+    """Drops the cached bills and versions of (subscriber, period) pairs.
+
+    Keys are deleted once the transaction commits, so a concurrent request
+    can not cache the data being replaced under the new version.
+    """
+    keys = set()
+    for subscriber, period in periods:
+        if period:
+            keys.add(get_bill_cache_key(subscriber, period))
+            keys.add(get_bill_version_key(subscriber, period))
+    if keys:
+        transaction.on_commit(lambda: get_bill_cache().delete_many(keys))
+
+
+def get_bill_cache_stats():
+    """Returns the bill cache hits and misses of every process.
+
+    They are counted with the request metrics rather than in the cache, so
+    that a lookup does not write to it.
+    """
+    counts = request_metrics.get_series(request_metrics.bill_cache_lookups)
+    return {'hits': counts.get(('hit',), 0),
+            'misses': counts.get(('miss',), 0)}
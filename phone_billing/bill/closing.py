@@ -0,0 +1,90 @@
+import json
+import time
+from datetime import timedelta
+from itertools import groupby
+
+from django.db import transaction
+from django.utils import timezone
+from rest_framework.utils.encoders import JSONEncoder
+
+from ..db import bulk_upsert
+from ..parallel import parallel_map
+
+from .cache import invalidate_bills
+from .models import BillRecord, MonthlyBill
+from .periods import get_period_start
+from .serializers import BillSerializer
+
+
+MONTHLY_BILL_FIELDS = ('subscriber', 'period', 'call_count',
+                       'total_duration', 'total_price', 'payload',
+                       'closed_at')
+
+
+def get_period_subscribers(period):
+    return list(BillRecord.objects.filter(period=period).order_by(
+        'subscriber').values_list('subscriber', flat=True).distinct())
+
+
+def render_bill(subscriber, period, bill_records):
+    serializer = BillSerializer(instance={
+        'subscriber': subscriber,
+        'period': period,
+        'bill_records': bill_records,
+    })
+    return json.dumps(serializer.data, cls=JSONEncoder)
+
+
+def close_subscribers(period, subscribers):
+    bill_records = BillRecord.objects.filter(
+        subscriber__in=subscribers, period=period
+    ).select_related('call').order_by('subscriber', 'id')
+
+    closed_at = timezone.now()
+    rows = []
+    for subscriber, records in groupby(bill_records.iterator(),
+                                       key=lambda record: record.subscriber):
+        records = list(records)
+        rows.append((
+            subscriber, period, len(records),
+            sum((record.call.duration for record in records), timedelta()),
+            sum(record.price for record in records),
+            render_bill(subscriber, period, records),
+            closed_at,
+        ))
+
+    with transaction.atomic():
+        bulk_upsert(MonthlyBill, MONTHLY_BILL_FIELDS, rows,
+                    conflict_fields=('subscriber', 'period'))
+        invalidate_bills([(subscriber, period) for subscriber, *_ in rows])
+
+    return len(rows)
+
+
+def run_close_subscribers(args):
+    return close_subscribers(*args)
+
+
+class PeriodClose:
+    def __init__(self, period, workers=1, chunk_size=1000, stdout=None):
+        self.period = get_period_start(period)
+        self.workers = workers
+        self.chunk_size = chunk_size
+        self.stdout = stdout
+
+    def log(self, message):
+        if self.stdout:
+            self.stdout.write(message)
+
+    def run(self):
+        started_at = time.monotonic()
+
+        subscribers = get_period_subscribers(self.period)
+        tasks = [(self.period, subscribers[offset:offset + self.chunk_size])
+                 for offset in range(0, len(subscribers), self.chunk_size)]
+        closed = sum(parallel_map(run_close_subscribers, tasks, self.workers))
+
+        elapsed = max(time.monotonic() - started_at, 1e-6)
+        self.log(f'Closed {closed} bills for {self.period:%m/%Y} in'
+                 f' {elapsed:.1f}s ({closed / elapsed:.0f} bills/s).')
+        return closed
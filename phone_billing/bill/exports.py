@@ -0,0 +1,152 @@
+import csv
+import heapq
+import io
+import json
+import time
+import zlib
+from itertools import groupby
+from operator import itemgetter
+
+from django.conf import settings
+
+from ..streaming import render_json
+
+from .models import BillRecord, MonthlyBill
+from .periods import get_period_start, is_closed_period
+from .serializers import BillRecordValuesSerializer
+
+
+EXPORT_FORMATS = ('csv', 'ndjson')
+
+CSV_HEADER = ('subscriber', 'period', 'id', 'destination', 'call_start_date',
+              'call_start_time', 'call_duration', 'call_price')
+
+# Bytes of uncompressed output gathered before being compressed.
+EXPORT_BUFFER_SIZE = 64 * 1024
+
+
+def get_export_filename(period, file_format):
+    return f'bills-{period:%Y-%m}.{file_format}.gz'
+
+
+class BillExport:
+    """Renders every bill of a period as gzipped CSV or NDJSON.
+
+    Bills are read through server-side cursors, ordered by subscriber, and
+    rendered a subscriber at a time, so memory use does not grow with the
+    period. Like bill searches, closed periods export the monthly bills
+    frozen when they were closed, and the bill records of subscribers
+    without one. CSV files hold one row per bill record, grouped by
+    subscriber, and NDJSON files one bill per line.
+    """
+
+    def __init__(self, period, file_format='csv', chunk_size=None,
+                 stdout=None):
+        if file_format not in EXPORT_FORMATS:
+            raise ValueError(f'Unsupported export format "{file_format}".')
+
+        self.period = get_period_start(period)
+        self.file_format = file_format
+        self.chunk_size = (chunk_size
+                           or settings.STREAMING_RESPONSE_CHUNK_SIZE)
+        self.stdout = stdout
+        self.bills = 0
+        self.records = 0
+
+    def log(self, message):
+        if self.stdout:
+            self.stdout.write(message)
+
+    @property
+    def filename(self):
+        return get_export_filename(self.period, self.file_format)
+
+    def get_live_bills(self, closed_bills):
+        serializer = BillRecordValuesSerializer()
+        rows = BillRecord.objects.filter(period=self.period).exclude(
+            subscriber__in=closed_bills.values('subscriber')
+        ).order_by('subscriber', 'id').values('subscriber',
+                                              *serializer.values)
+        for subscriber, group in groupby(
+                rows.iterator(chunk_size=self.chunk_size),
+                key=itemgetter('subscriber')):
+            yield subscriber, 1, [serializer.to_representation(row)
+                                  for row in group]
+
+    def get_closed_bills(self, closed_bills):
+        payloads = closed_bills.order_by('subscriber').values_list(
+            'subscriber', 'payload')
+        for subscriber, payload in payloads.iterator(
+                chunk_size=self.chunk_size):
+            yield subscriber, 0, json.loads(payload)['bill_records']
+
+    def get_bills(self):
+        if is_closed_period(self.period):
+            closed_bills = MonthlyBill.objects.filter(period=self.period)
+        else:
+            closed_bills = MonthlyBill.objects.none()
+
+        # The bill records are queried first, so a bill closed in between is
+        # read by both queries rather than by neither. Its monthly bill sorts
+        # first, and the bill records following it are skipped.
+        previous = None
+        for subscriber, _, records in heapq.merge(
+                self.get_live_bills(closed_bills),
+                self.get_closed_bills(closed_bills)):
+            if subscriber == previous:
+                continue
+            previous = subscriber
+            self.bills += 1
+            self.records += len(records)
+            yield subscriber, records
+
+    def render_csv(self):
+        period = f'{self.period:%m/%Y}'
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow(CSV_HEADER)
+        for subscriber, records in self.get_bills():
+            writer.writerows(
+                (subscriber, period, *record.values()) for record in records)
+            if buffer.tell() >= EXPORT_BUFFER_SIZE:
+                yield buffer.getvalue().encode()
+                buffer.seek(0)
+                buffer.truncate()
+        yield buffer.getvalue().encode()
+
+    def render_ndjson(self):
+        period = f'{self.period:%m/%Y}'
+        chunk = []
+        size = 0
+        for subscriber, records in self.get_bills():
+            line = render_json({'subscriber': subscriber, 'period': period,
+                                'bill_records': records}) + b'\n'
+            chunk.append(line)
+            size += len(line)
+            if size >= EXPORT_BUFFER_SIZE:
+                yield b''.join(chunk)
+                chunk = []
+                size = 0
+        yield b''.join(chunk)
+
+    def __iter__(self):
+        render = getattr(self, f'render_{self.file_format}')
+        compressor = zlib.compressobj(wbits=16 + zlib.MAX_WBITS)
+        for data in render():
+            compressed = compressor.compress(data)
+            if compressed:
+                yield compressed
+        yield compressor.flush()
+
+    def run(self, path=None):
+        path = path or self.filename
+        started_at = time.monotonic()
+        with open(path, 'wb') as file:
+            for chunk in self:
+                file.write(chunk)
+
+        elapsed = max(time.monotonic() - started_at, 1e-6)
+        self.log(f'Exported {self.bills} bills ({self.records} records) to'
+                 f' {path} in {elapsed:.1f}s'
+                 f' ({self.records / elapsed:.0f} records/s).')
+        return path
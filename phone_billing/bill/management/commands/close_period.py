@@ -0,0 +1,39 @@
+import os
+from datetime import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+
+from ...closing import PeriodClose
+from ...periods import get_previous_period, is_closed_period
+
+
+class Command(BaseCommand):
+    help = ('Builds the monthly bill of every subscriber for a finished'
+            ' period. Running it again rebuilds the bills.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--period', metavar='MM/YYYY',
+                            help='Period to close, defaults to last month.')
+        parser.add_argument('--workers', type=int, default=os.cpu_count(),
+                            help='Number of worker processes.')
+        parser.add_argument('--chunk-size', type=int, default=1000,
+                            help='Number of subscribers closed per task.')
+
+    def get_period(self, value):
+        if value is None:
+            return get_previous_period()
+
+        try:
+            period = datetime.strptime(value, '%m/%Y').date()
+        except ValueError:
+            raise CommandError('Periods must be formatted as MM/YYYY.')
+
+        if not is_closed_period(period):
+            raise CommandError(f'Period {value} has not ended yet.')
+        return period
+
+    def handle(self, *args, **options):
+        period_close = PeriodClose(
+            self.get_period(options['period']), workers=options['workers'],
+            chunk_size=options['chunk_size'], stdout=self.stdout)
+        period_close.run()
@@ -0,0 +1,28 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from ...partitions import PartitionMaintenance
+
+
+class Command(BaseCommand):
+    help = ('Creates the monthly partitions of bill records for the upcoming'
+            ' months and for rows in the default partition, and detaches the'
+            ' expired ones.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--months-ahead', type=int,
+                            default=settings.BILL_RECORD_PARTITIONS_AHEAD,
+                            help='Number of upcoming months to create.')
+        parser.add_argument('--retention-months', type=int,
+                            default=settings.BILL_RECORD_RETENTION_MONTHS,
+                            help='Detach partitions older than this many'
+                                 ' months, keeps every partition if unset.')
+        parser.add_argument('--drop', action='store_true',
+                            help='Drop expired partitions instead of only'
+                                 ' detaching them.')
+
+    def handle(self, *args, **options):
+        PartitionMaintenance(
+            months_ahead=options['months_ahead'],
+            retention_months=options['retention_months'],
+            drop=options['drop'], stdout=self.stdout).run()
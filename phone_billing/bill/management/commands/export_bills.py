@@ -0,0 +1,35 @@
+from datetime import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+
+from ...exports import EXPORT_FORMATS, BillExport
+
+
+class Command(BaseCommand):
+    help = ('Writes every bill of a period to a gzipped CSV or NDJSON file,'
+            ' grouped by subscriber. Closed periods export their monthly'
+            ' bills as they were closed.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--period', metavar='MM/YYYY', required=True,
+                            help='Period to export.')
+        parser.add_argument('--format', dest='file_format', default='csv',
+                            choices=EXPORT_FORMATS,
+                            help='File format of the export.')
+        parser.add_argument('--output',
+                            help='Path of the file to write, by default'
+                                 ' bills-YYYY-MM.<format>.gz.')
+        parser.add_argument('--chunk-size', type=int,
+                            help='Number of bill records fetched at a time'
+                                 ' from the server-side cursor.')
+
+    def get_period(self, value):
+        try:
+            return datetime.strptime(value, '%m/%Y').date()
+        except ValueError:
+            raise CommandError('Periods must be formatted as MM/YYYY.')
+
+    def handle(self, *args, **options):
+        BillExport(self.get_period(options['period']), options['file_format'],
+                   options['chunk_size'], stdout=self.stdout).run(
+                       options['output'])
@@ -0,0 +1,38 @@
+import os
+from datetime import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+
+from ...rebilling import PeriodRebill
+
+
+class Command(BaseCommand):
+    help = ('Prices the bill records of a period again, such as after a'
+            ' pricing fix, keeping the old price of every changed record.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--period', metavar='MM/YYYY', required=True,
+                            help='Period to bill again.')
+        parser.add_argument('--workers', type=int, default=os.cpu_count(),
+                            help='Number of worker processes, each billing'
+                                 ' a range of call ids.')
+        parser.add_argument('--batch-size', type=int, default=5000,
+                            help='Number of bill records priced per'
+                                 ' transaction.')
+        parser.add_argument('--dry-run', action='store_true',
+                            help='List the price changes without saving'
+                                 ' them.')
+        parser.add_argument('--reason', default='',
+                            help='Reason kept along with the old prices.')
+
+    def get_period(self, value):
+        try:
+            return datetime.strptime(value, '%m/%Y').date()
+        except ValueError:
+            raise CommandError('Periods must be formatted as MM/YYYY.')
+
+    def handle(self, *args, **options):
+        PeriodRebill(
+            self.get_period(options['period']), workers=options['workers'],
+            batch_size=options['batch_size'], dry_run=options['dry_run'],
+            reason=options['reason'], stdout=self.stdout).run()
@@ -0,0 +1,23 @@
+import os
+
+from django.core.management.base import BaseCommand
+
+from ...reconciliation import BillingReconciliation
+
+
+class Command(BaseCommand):
+    help = ('Bills every call with both its records but no bill record, such'
+            ' as calls whose billing was lost. Safe to run while call records'
+            ' are being ingested.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=os.cpu_count(),
+                            help='Number of worker processes, each sweeping'
+                                 ' a range of call ids.')
+        parser.add_argument('--chunk-size', type=int, default=10000,
+                            help='Number of calls billed per transaction.')
+
+    def handle(self, *args, **options):
+        BillingReconciliation(
+            workers=options['workers'], chunk_size=options['chunk_size'],
+            stdout=self.stdout).run()
@@ -0,0 +1,35 @@
+import os
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from ...workers import POOLS, BillingWorkers
+
+
+class Command(BaseCommand):
+    help = 'Bills the calls queued by call record ingestion.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=os.cpu_count(),
+                            help='Number of workers draining the queue.')
+        parser.add_argument('--pool', choices=sorted(POOLS),
+                            default='process',
+                            help='Run workers as processes or threads.')
+        parser.add_argument('--batch-size', type=int,
+                            default=settings.BILLING_QUEUE_BATCH_SIZE,
+                            help='Number of calls billed per transaction.')
+        parser.add_argument('--burst', action='store_true',
+                            help='Exit once the queue is empty.')
+
+    def handle(self, *args, **options):
+        workers = BillingWorkers(
+            workers=options['workers'], pool=options['pool'],
+            batch_size=options['batch_size'],
+            max_attempts=settings.BILLING_QUEUE_MAX_ATTEMPTS,
+            poll_interval=settings.BILLING_QUEUE_POLL_INTERVAL,
+            burst=options['burst'], stdout=self.stdout)
+
+        try:
+            workers.run()
+        except KeyboardInterrupt:
+            self.stdout.write('Stopped.')
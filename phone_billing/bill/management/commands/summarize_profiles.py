@@ -0,0 +1,27 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from ....profiling import PROFILE_SORT_KEYS, ProfileSummary
+
+
+class Command(BaseCommand):
+    help = ('Adds up the request profiles saved by the profiling middleware'
+            ' and lists the functions taking the most time.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--directory', default=settings.PROFILING_DIR,
+                            help='Directory the profiles were saved to.')
+        parser.add_argument('--endpoint',
+                            help='Only add up the profiles of this view name,'
+                                 ' e.g. bill:search.')
+        parser.add_argument('--sort', choices=sorted(PROFILE_SORT_KEYS),
+                            default='tottime',
+                            help='Time the functions are ranked by.')
+        parser.add_argument('--limit', type=int, default=20,
+                            help='Number of functions to list.')
+
+    def handle(self, *args, **options):
+        ProfileSummary(
+            directory=options['directory'], endpoint=options['endpoint'],
+            sort=options['sort'], limit=options['limit'],
+            stdout=self.stdout).run()
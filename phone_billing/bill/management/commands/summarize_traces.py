@@ -0,0 +1,21 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from ....tracing import TraceSummary
+
+
+class Command(BaseCommand):
+    help = ('Lists the latency percentiles of every traced stage, from the'
+            ' spans written to the trace files.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--file', default=settings.TRACING_FILE,
+                            help='Trace file, read along with its rotated'
+                                 ' files.')
+        parser.add_argument('--name', action='append', dest='names',
+                            help='Only list spans of this name, can be'
+                                 ' repeated.')
+
+    def handle(self, *args, **options):
+        TraceSummary(path=options['file'], names=options['names'],
+                     stdout=self.stdout).run()
@@ -0,0 +1,71 @@
+# Generated by Django 2.0.4 on 2026-10-18 20:25
+
+from django.db import migrations, models
+import django.db.models.deletion
+from datetime import datetime, time
+from decimal import Decimal
+
+from django.utils.timezone import utc
+
+
+def create_default_plan(apps, schema_editor):
+    TariffPlan = apps.get_model('bill', 'TariffPlan')
+    BillRecord = apps.get_model('bill', 'BillRecord')
+
+    # The tariffs bills were priced with before plans lived in the database.
+    plan = TariffPlan.objects.create(
+        effective_from=datetime(1970, 1, 1, tzinfo=utc))
+    plan.tariffs.create(name='StandardTariff', precedence=0,
+                        start_time=time(6), end_time=time(22),
+                        standing_charge=Decimal('0.36'),
+                        charge_per_minute=Decimal('0.09'))
+    plan.tariffs.create(name='ReducedTariff', precedence=1,
+                        start_time=time(22), end_time=time(6),
+                        standing_charge=Decimal('0.36'),
+                        charge_per_minute=Decimal('0.00'))
+
+    BillRecord.objects.update(tariff_plan=plan)
+
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bill', '0002_auto_20180425_1928'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TariffPlan',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('effective_from', models.DateTimeField(unique=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'ordering': ('effective_from',),
+            },
+        ),
+        migrations.CreateModel(
+            name='Tariff',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=40)),
+                ('precedence', models.PositiveSmallIntegerField(default=0)),
+                ('start_time', models.TimeField()),
+                ('end_time', models.TimeField()),
+                ('standing_charge', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('charge_per_minute', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('plan', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='tariffs', to='bill.TariffPlan')),
+            ],
+            options={
+                'ordering': ('plan', 'precedence'),
+            },
+        ),
+        migrations.AddField(
+            model_name='billrecord',
+            name='tariff_plan',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.PROTECT, to='bill.TariffPlan'),
+        ),
+        migrations.RunPython(create_default_plan, migrations.RunPython.noop),
+    ]
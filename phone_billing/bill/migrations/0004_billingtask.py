@@ -0,0 +1,24 @@
+# Generated by Django 2.0.4 on 2026-10-18 20:28
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('call', '0004_call_timestamps'),
+        ('bill', '0003_tariff_plans'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BillingTask',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('attempts', models.PositiveSmallIntegerField(default=0)),
+                ('enqueued_at', models.DateTimeField(auto_now_add=True)),
+                ('call', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, to='call.Call')),
+            ],
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 2.0.4 on 2026-10-18 20:33
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bill', '0004_billingtask'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MonthlyBill',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('subscriber', models.CharField(max_length=11)),
+                ('period', models.DateField()),
+                ('call_count', models.PositiveIntegerField()),
+                ('total_duration', models.DurationField()),
+                ('total_price', models.DecimalField(decimal_places=2, max_digits=12)),
+                ('payload', models.TextField()),
+                ('closed_at', models.DateTimeField()),
+            ],
+            options={
+                'unique_together': {('subscriber', 'period')},
+            },
+        ),
+    ]
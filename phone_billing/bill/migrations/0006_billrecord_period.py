@@ -0,0 +1,41 @@
+# Generated by Django 2.0.4 on 2026-10-18 21:40
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+BACKFILL_PERIODS_SQL = '''
+    UPDATE bill_billrecord
+    SET subscriber = call_call.source,
+        period = date_trunc('month', call_call.ended_at AT TIME ZONE %s)::date
+    FROM call_call
+    WHERE call_call.id = bill_billrecord.call_id
+'''
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('call', '0004_call_timestamps'),
+        ('bill', '0005_monthlybill'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='billrecord',
+            name='period',
+            field=models.DateField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='billrecord',
+            name='subscriber',
+            field=models.CharField(default='', max_length=11),
+            preserve_default=False,
+        ),
+        migrations.RunSQL([(BACKFILL_PERIODS_SQL, [settings.TIME_ZONE])],
+                          migrations.RunSQL.noop),
+        migrations.AddIndex(
+            model_name='billrecord',
+            index=models.Index(fields=['subscriber', 'period', 'id'], name='billrecord_subscriber_period'),
+        ),
+    ]
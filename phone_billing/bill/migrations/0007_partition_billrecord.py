@@ -0,0 +1,96 @@
+# Generated by Django 2.0.4 on 2026-10-18 22:10
+
+from django.db import migrations
+
+
+MIN_POSTGRESQL_VERSION = 150000
+# Recreates bill_billrecord as a table partitioned by month of period. Every
+# unique index of a partitioned table must include the partition key, so the
+# primary key and the call_id unique constraint become (id, period) and
+# (call_id, period), the latter treating null periods of unfinished calls as
+# equal, which requires PostgreSQL 15 or later. A call is kept from being
+# billed in two periods by bill_billedcall, see 0009_billedcall. Rows land in
+# the default partition until ensure_partitions moves them into monthly ones.
+PARTITION_SQL = '''
+    ALTER SEQUENCE bill_billrecord_id_seq OWNED BY NONE;
+    ALTER TABLE bill_billrecord RENAME TO bill_billrecord_unpartitioned;
+    DROP INDEX billrecord_subscriber_period;
+
+    CREATE TABLE bill_billrecord (
+        id integer NOT NULL DEFAULT nextval('bill_billrecord_id_seq'),
+        price numeric(10, 2) NOT NULL,
+        call_id integer NOT NULL
+            REFERENCES call_call (id) DEFERRABLE INITIALLY DEFERRED,
+        tariff_plan_id integer NULL
+            REFERENCES bill_tariffplan (id) DEFERRABLE INITIALLY DEFERRED,
+        period date NULL,
+        subscriber varchar(11) NOT NULL,
+        UNIQUE (id, period),
+        UNIQUE NULLS NOT DISTINCT (call_id, period)
+    ) PARTITION BY RANGE (period);
+    CREATE TABLE bill_billrecord_default
+        PARTITION OF bill_billrecord DEFAULT;
+
+    CREATE INDEX billrecord_subscriber_period
+        ON bill_billrecord (subscriber, period, id);
+    CREATE INDEX bill_billrecord_tariff_plan_id
+        ON bill_billrecord (tariff_plan_id);
+
+    INSERT INTO bill_billrecord
+        (id, price, call_id, tariff_plan_id, period, subscriber)
+    SELECT id, price, call_id, tariff_plan_id, period, subscriber
+    FROM bill_billrecord_unpartitioned;
+
+    DROP TABLE bill_billrecord_unpartitioned;
+    ALTER SEQUENCE bill_billrecord_id_seq OWNED BY bill_billrecord.id;
+'''
+
+UNPARTITION_SQL = '''
+    ALTER SEQUENCE bill_billrecord_id_seq OWNED BY NONE;
+    ALTER TABLE bill_billrecord RENAME TO bill_billrecord_partitioned;
+    DROP INDEX billrecord_subscriber_period;
+
+    CREATE TABLE bill_billrecord (
+        id integer PRIMARY KEY DEFAULT nextval('bill_billrecord_id_seq'),
+        price numeric(10, 2) NOT NULL,
+        call_id integer NOT NULL UNIQUE
+            REFERENCES call_call (id) DEFERRABLE INITIALLY DEFERRED,
+        tariff_plan_id integer NULL
+            REFERENCES bill_tariffplan (id) DEFERRABLE INITIALLY DEFERRED,
+        period date NULL,
+        subscriber varchar(11) NOT NULL
+    );
+    CREATE INDEX billrecord_subscriber_period
+        ON bill_billrecord (subscriber, period, id);
+    CREATE INDEX bill_billrecord_tariff_plan_id_56f03997
+        ON bill_billrecord (tariff_plan_id);
+
+    INSERT INTO bill_billrecord
+        (id, price, call_id, tariff_plan_id, period, subscriber)
+    SELECT id, price, call_id, tariff_plan_id, period, subscriber
+    FROM bill_billrecord_partitioned;
+
+    DROP TABLE bill_billrecord_partitioned;
+    ALTER SEQUENCE bill_billrecord_id_seq OWNED BY bill_billrecord.id;
+'''
+
+
+def check_postgresql_version(apps, schema_editor):
+    version = schema_editor.connection.pg_version
+    if version < MIN_POSTGRESQL_VERSION:
+        raise RuntimeError(
+            f'Partitioning bill records requires PostgreSQL 15 or later,'
+            f' the database runs {version // 10000}.')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bill', '0006_billrecord_period'),
+    ]
+
+    operations = [
+        migrations.RunPython(check_postgresql_version,
+                             migrations.RunPython.noop),
+        migrations.RunSQL(PARTITION_SQL, UNPARTITION_SQL),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 2.0.4 on 2026-10-18 21:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bill', '0007_partition_billrecord'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BillRecordRevision',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('call_id', models.PositiveIntegerField(db_index=True)),
+                ('period', models.DateField()),
+                ('old_price', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('new_price', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('old_tariff_plan_id', models.IntegerField(blank=True, null=True)),
+                ('new_tariff_plan_id', models.IntegerField(blank=True, null=True)),
+                ('reason', models.CharField(blank=True, max_length=200)),
+                ('revised_at', models.DateTimeField()),
+            ],
+        ),
+    ]
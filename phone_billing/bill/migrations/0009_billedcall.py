@@ -0,0 +1,70 @@
+# Generated by Django 2.0.4 on 2026-10-18 23:40
+
+from django.db import migrations
+
+
+# Partitioned tables can only have unique indexes including the partition
+# key, so bill records are only unique by (call_id, period). bill_billedcall
+# keeps one row per billed call, written by statement triggers in the same
+# transaction as the bill records, so a call can not be billed in two
+# periods. Statement triggers do not fire for statements run on partitions,
+# such as ensure_partitions moving rows out of the default partition.
+GUARD_SQL = '''
+    CREATE TABLE bill_billedcall (call_id integer PRIMARY KEY);
+    INSERT INTO bill_billedcall (call_id)
+    SELECT call_id FROM bill_billrecord;
+
+    CREATE FUNCTION bill_billrecord_guard() RETURNS trigger
+    LANGUAGE plpgsql AS $$
+    BEGIN
+        IF TG_OP = 'INSERT' THEN
+            INSERT INTO bill_billedcall (call_id)
+            SELECT call_id FROM new_rows;
+        ELSIF TG_OP = 'DELETE' THEN
+            DELETE FROM bill_billedcall
+            WHERE call_id IN (SELECT call_id FROM old_rows);
+        ELSE
+            -- Rows moved to another partition keep their call.
+            DELETE FROM bill_billedcall WHERE call_id IN (
+                SELECT call_id FROM old_rows
+                EXCEPT SELECT call_id FROM new_rows);
+            INSERT INTO bill_billedcall (call_id)
+            SELECT call_id FROM new_rows
+            EXCEPT ALL SELECT call_id FROM old_rows;
+        END IF;
+        RETURN NULL;
+    END
+    $$;
+
+    CREATE TRIGGER bill_billrecord_guard_insert
+        AFTER INSERT ON bill_billrecord
+        REFERENCING NEW TABLE AS new_rows
+        FOR EACH STATEMENT EXECUTE FUNCTION bill_billrecord_guard();
+    CREATE TRIGGER bill_billrecord_guard_update
+        AFTER UPDATE ON bill_billrecord
+        REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+        FOR EACH STATEMENT EXECUTE FUNCTION bill_billrecord_guard();
+    CREATE TRIGGER bill_billrecord_guard_delete
+        AFTER DELETE ON bill_billrecord
+        REFERENCING OLD TABLE AS old_rows
+        FOR EACH STATEMENT EXECUTE FUNCTION bill_billrecord_guard();
+'''
+
+UNGUARD_SQL = '''
+    DROP TRIGGER bill_billrecord_guard_insert ON bill_billrecord;
+    DROP TRIGGER bill_billrecord_guard_update ON bill_billrecord;
+    DROP TRIGGER bill_billrecord_guard_delete ON bill_billrecord;
+    DROP FUNCTION bill_billrecord_guard();
+    DROP TABLE bill_billedcall;
+'''
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bill', '0008_billrecordrevision'),
+    ]
+
+    operations = [
+        migrations.RunSQL(GUARD_SQL, UNGUARD_SQL),
+    ]
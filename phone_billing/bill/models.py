@@ -1,8 +1,226 @@
-from django.db import models
+import json
+
+from django.core.exceptions import EmptyResultSet, ValidationError
+from django.db import DatabaseError, connection, models, transaction
+from django.utils import timezone
 
 from ..call.models import Call
+from ..db import bulk_insert, bulk_insert_ignore, bulk_update
+from ..tracing import span, trace
+
+from .cache import invalidate_bills
+from .periods import get_billing_period, get_period_start, is_closed_period
+from .pricing import (BaseTariff, CompiledTariffPlan, calculate_call_charge,
+                      calculate_call_charges, clear_tariff_plans_cache,
+                      from_centavos, get_tariff_plan, get_tariff_plan_ids,
+                      get_tariff_plans, to_centavos)
+
+
+# Billed calls are found in bill_billedcall, which also holds the calls of
+# detached or dropped bill record partitions, so that they are not billed
+# again.
+ENQUEUE_SQL = '''
+    INSERT INTO bill_billingtask (call_id, attempts, enqueued_at)
+    SELECT calls.id, 0, now() FROM ({calls}) calls
+    WHERE NOT EXISTS (
+        SELECT 1 FROM bill_billedcall WHERE call_id = calls.id
+    )
+    ON CONFLICT (call_id) DO NOTHING
+'''
+
+# Skipping locked rows lets concurrent workers take disjoint batches.
+DEQUEUE_SQL = '''
+    DELETE FROM bill_billingtask
+    WHERE id IN (
+        SELECT id FROM bill_billingtask
+        WHERE attempts < %(max_attempts)s
+        ORDER BY id
+        LIMIT %(batch_size)s
+        FOR UPDATE SKIP LOCKED
+    )
+    RETURNING call_id, attempts
+'''
+
+# Digest of the transactions that last wrote the tariff plans and tariffs,
+# changing whenever any of them is created, changed or deleted. The tables
+# hold a handful of rows, so every process reads it before pricing.
+TARIFF_PLANS_VERSION_SQL = '''
+    SELECT md5(string_agg(version, ',' ORDER BY version))
+    FROM (
+        SELECT 'plan:' || id || ':' || xmin::text AS version
+        FROM bill_tariffplan
+        UNION ALL
+        SELECT 'tariff:' || id || ':' || xmin::text FROM bill_tariff
+    ) versions
+'''
+
+# Billed calls whose source or period changed, returning their new values.
+SYNC_BILLED_CALLS_SQL = '''
+    UPDATE bill_billrecord
+    SET subscriber = call_call.source,
+        period = date_trunc('month', call_call.ended_at AT TIME ZONE %s)::date
+    FROM call_call
+    WHERE call_call.id = bill_billrecord.call_id
+      AND bill_billrecord.call_id IN ({calls})
+      AND (bill_billrecord.subscriber, bill_billrecord.period)
+          IS DISTINCT FROM (call_call.source, date_trunc(
+              'month', call_call.ended_at AT TIME ZONE %s)::date)
+    RETURNING bill_billrecord.subscriber, bill_billrecord.period
+'''
+
+# Calls with both records that were never billed, by id after a given one.
+# Calls billed in detached or dropped partitions stay in bill_billedcall.
+# Calls locked by a transaction still writing them are skipped, they are
+# queued for billing when that transaction commits.
+UNBILLED_CALLS_SQL = '''
+    SELECT call_call.id, call_call.source, call_call.started_at,
+        call_call.ended_at
+    FROM call_call
+    WHERE call_call.id > %(after)s AND call_call.id <= %(last)s
+      AND call_call.started_at IS NOT NULL AND call_call.ended_at IS NOT NULL
+      AND NOT EXISTS (
+          SELECT 1 FROM bill_billedcall
+          WHERE bill_billedcall.call_id = call_call.id
+      )
+    ORDER BY call_call.id
+    LIMIT %(chunk_size)s
+    FOR SHARE OF call_call SKIP LOCKED
+'''
+
+# Bill records of a period with the times of their calls, by call id after a
+# given one.
+PERIOD_BILLED_CALLS_SQL = '''
+    SELECT bill_billrecord.call_id, bill_billrecord.subscriber,
+        bill_billrecord.price, bill_billrecord.tariff_plan_id,
+        call_call.started_at, call_call.ended_at
+    FROM bill_billrecord
+    JOIN call_call ON call_call.id = bill_billrecord.call_id
+    WHERE bill_billrecord.period = %(period)s
+      AND bill_billrecord.call_id > %(after)s
+      AND bill_billrecord.call_id <= %(last)s
+      AND call_call.started_at IS NOT NULL AND call_call.ended_at IS NOT NULL
+    ORDER BY bill_billrecord.call_id
+    LIMIT %(batch_size)s
+    {lock}
+'''
+
+
+class TariffPlanManager(models.Manager):
+
+    def get_version(self):
+        with connection.cursor() as cursor:
+            cursor.execute(TARIFF_PLANS_VERSION_SQL)
+            return cursor.fetchone()[0] or 'empty'
+
+
+class TariffPlan(models.Model):
+    objects = TariffPlanManager()
+
+    effective_from = models.DateTimeField(unique=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ('effective_from',)
+
+    def is_locked(self):
+        """Tells whether the plan and its tariffs can no longer change.
+
+        Bill records keep the plan that priced them, so a plan is locked as
+        soon as a bill record refers to it, or once it takes effect if it was
+        created ahead of time. Rates are changed by adding a new plan.
+        """
+        if self.pk is None:
+            return False
+
+        stored = TariffPlan.objects.filter(pk=self.pk).values(
+            'created_at', 'effective_from').first()
+        if stored is None:
+            return False
+        if stored['created_at'] < stored['effective_from'] <= timezone.now():
+            return True
+        return BillRecord.objects.filter(tariff_plan_id=self.pk).exists()
+
+    def check_unlocked(self):
+        if self.is_locked():
+            raise ValidationError(
+                'Tariff plans in effect or used by bill records can not be'
+                ' changed, add a new plan instead.')
+
+    def clean(self):
+        self.check_unlocked()
 
-from .pricing import calculate_call_charge
+    def save(self, *args, **kwargs):
+        self.check_unlocked()
+        super().save(*args, **kwargs)
+        clear_tariff_plans_cache()
+
+    def delete(self, *args, **kwargs):
+        self.check_unlocked()
+        result = super().delete(*args, **kwargs)
+        clear_tariff_plans_cache()
+        return result
+
+    def compile(self):
+        return CompiledTariffPlan(
+            self.id, self.effective_from,
+            [tariff.as_class() for tariff in self.tariffs.all()])
+
+
+class Tariff(models.Model):
+    plan = models.ForeignKey(TariffPlan, related_name='tariffs',
+                             on_delete=models.CASCADE)
+    name = models.CharField(max_length=40)
+    precedence = models.PositiveSmallIntegerField(default=0)
+    start_time = models.TimeField()
+    end_time = models.TimeField()
+    standing_charge = models.DecimalField(max_digits=10, decimal_places=2)
+    charge_per_minute = models.DecimalField(max_digits=10, decimal_places=2)
+
+    class Meta:
+        ordering = ('plan', 'precedence')
+
+    # Compiled plans look tariffs up by the minute of the day, so tariffs
+    # must start and end on whole minutes.
+    def check_times(self):
+        errors = {field: 'Tariffs must start and end on whole minutes.'
+                  for field in ('start_time', 'end_time')
+                  if getattr(self, field).second
+                  or getattr(self, field).microsecond}
+        if errors:
+            raise ValidationError(errors)
+
+    def check_unlocked(self):
+        # Tariffs moved from one plan to another change both.
+        if self.pk is not None:
+            stored = Tariff.objects.filter(pk=self.pk).values_list(
+                'plan_id', flat=True).first()
+            if stored is not None and stored != self.plan_id:
+                TariffPlan(pk=stored).check_unlocked()
+        self.plan.check_unlocked()
+
+    def clean(self):
+        self.check_times()
+        self.check_unlocked()
+
+    def save(self, *args, **kwargs):
+        self.check_times()
+        self.check_unlocked()
+        super().save(*args, **kwargs)
+        clear_tariff_plans_cache()
+
+    def delete(self, *args, **kwargs):
+        self.check_unlocked()
+        result = super().delete(*args, **kwargs)
+        clear_tariff_plans_cache()
+        return result
+
+    def as_class(self):
+        return type(self.name, (BaseTariff,), {
+            'standing_charge': self.standing_charge,
+            'charge_per_minute': self.charge_per_minute,
+            'start_time': self.start_time,
+            'end_time': self.end_time,
+        })
 
 
 class BillRecordManager(models.Manager):
@@ -14,12 +232,289 @@ class BillRecordManager(models.Manager):
 
         return self.create(
             call_id=call.id,
-            price=calculate_call_charge(call.started_at, call.ended_at)
+            subscriber=call.source,
+            period=get_billing_period(call.ended_at),
+            price=calculate_call_charge(call.started_at, call.ended_at),
+            tariff_plan_id=get_tariff_plan(call.ended_at).id
         )
 
+    def create_for_calls(self, call_ids):
+        calls = Call.objects.filter(
+            id__in=call_ids, billrecord__isnull=True,
+            started_at__isnull=False, ended_at__isnull=False
+        ).values_list('id', 'source', 'started_at', 'ended_at')
+        return self.create_for_call_rows(list(calls))
+
+    # Bills (id, source, started_at, ended_at) rows of finished calls.
+    def create_for_call_rows(self, calls):
+        if not calls:
+            return 0
+
+        ids, sources, starts, ends = zip(*calls)
+        end_timestamps = [end.timestamp() for end in ends]
+        plans = get_tariff_plans()
+        prices = calculate_call_charges(
+            [start.timestamp() for start in starts], end_timestamps, plans)
+        plan_ids = get_tariff_plan_ids(end_timestamps, plans)
+
+        periods = [get_billing_period(end) for end in ends]
+
+        rows = list(zip(ids, sources, periods,
+                        [from_centavos(price) for price in prices],
+                        plan_ids))
+        bulk_insert_ignore(self.model, ('call_id', 'subscriber', 'period',
+                                        'price', 'tariff_plan_id'),
+                           rows, conflict_fields=('call_id', 'period'))
+        invalidate_bills(zip(sources, periods))
+        return len(rows)
+
+    def create_for_unbilled_calls(self, after, last, chunk_size):
+        """Bills a chunk of the unbilled calls with ids in (after, last].
+
+        Returns the ids of the calls found and of the ones failing to be
+        billed, which are queued for the billing workers instead.
+        """
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.execute(UNBILLED_CALLS_SQL, {
+                'after': after, 'last': last, 'chunk_size': chunk_size})
+            calls = cursor.fetchall()
+
+            failed = []
+            try:
+                with transaction.atomic():
+                    self.create_for_call_rows(calls)
+            except (DatabaseError, ValueError):
+                for call in calls:
+                    try:
+                        with transaction.atomic():
+                            self.create_for_call_rows([call])
+                    except (DatabaseError, ValueError):
+                        failed.append(call[0])
+                if failed:
+                    BillingTask.objects.enqueue(failed)
+
+        return [call[0] for call in calls], failed
+
+    def reprice(self, period, after, last, batch_size, dry_run=False,
+                reason=''):
+        """Prices a batch of the bill records of a period again, for calls
+        with ids in (after, last], keeping the old prices of the changed ones
+        as revisions.
+
+        Returns the ids of the calls looked at, the (call id, old price, new
+        price, old tariff plan id, new tariff plan id) changes, which are not
+        written on a dry run, and the subscribers whose prices changed.
+        """
+        lock = '' if dry_run else 'FOR UPDATE OF bill_billrecord'
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.execute(PERIOD_BILLED_CALLS_SQL.format(lock=lock), {
+                'period': period, 'after': after, 'last': last,
+                'batch_size': batch_size})
+            rows = cursor.fetchall()
+            if not rows:
+                return [], [], []
+
+            call_ids, subscribers, prices, plan_ids, starts, ends = zip(*rows)
+            end_timestamps = [end.timestamp() for end in ends]
+            plans = get_tariff_plans()
+            new_prices = calculate_call_charges(
+                [start.timestamp() for start in starts], end_timestamps,
+                plans)
+            new_plan_ids = get_tariff_plan_ids(end_timestamps, plans)
+
+            changes = [
+                (call_id, price, from_centavos(new_price), plan_id,
+                 new_plan_id)
+                for call_id, price, new_price, plan_id, new_plan_id in zip(
+                    call_ids, prices, new_prices, plan_ids, new_plan_ids)
+                if (to_centavos(price), plan_id) != (new_price, new_plan_id)]
+
+            changed = {change[0] for change in changes}
+            changed_subscribers = sorted({
+                subscriber
+                for call_id, subscriber in zip(call_ids, subscribers)
+                if call_id in changed})
+
+            if changes and not dry_run:
+                bulk_update(self.model, ('call', 'period'),
+                            ('price', 'tariff_plan'),
+                            [(call_id, period, new_price, new_plan_id)
+                             for call_id, _, new_price, _, new_plan_id
+                             in changes])
+                revised_at = timezone.now()
+                bulk_insert(BillRecordRevision, (
+                    'call_id', 'period', 'old_price', 'new_price',
+                    'old_tariff_plan_id', 'new_tariff_plan_id', 'reason',
+                    'revised_at'), [
+                        (call_id, period, old_price, new_price, old_plan_id,
+                         new_plan_id, reason, revised_at)
+                        for call_id, old_price, new_price, old_plan_id,
+                        new_plan_id in changes])
+                invalidate_bills([(subscriber, period)
+                                  for subscriber in changed_subscribers])
+
+        return list(call_ids), changes, changed_subscribers
+
+    def get_billed_periods(self, call_ids):
+        return list(self.filter(call__in=call_ids).values_list(
+            'subscriber', 'period'))
+
+    def sync_calls(self, call_ids):
+        calls = Call.objects.filter(id__in=call_ids)
+        try:
+            calls_sql, params = calls.values('id').query.sql_with_params()
+        except EmptyResultSet:
+            return []
+
+        time_zone = timezone.get_current_timezone_name()
+        with connection.cursor() as cursor:
+            cursor.execute(SYNC_BILLED_CALLS_SQL.format(calls=calls_sql),
+                           [time_zone, *params, time_zone])
+            return cursor.fetchall()
+
 
 class BillRecord(models.Model):
     objects = BillRecordManager()
 
     call = models.OneToOneField(Call, on_delete=models.CASCADE)
+    # Copies of the call source and of the month it ended in, kept by
+    # sync_calls so bills are searched with a single index range scan.
+    subscriber = models.CharField(max_length=11)
+    period = models.DateField(null=True, blank=True)
     price = models.DecimalField(max_digits=10, decimal_places=2)
+    tariff_plan = models.ForeignKey(TariffPlan, null=True, blank=True,
+                                    on_delete=models.PROTECT)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['subscriber', 'period', 'id'],
+                         name='billrecord_subscriber_period'),
+        ]
+
+    def save(self, *args, **kwargs):
+        if not self.subscriber:
+            self.subscriber = self.call.source
+            if self.call.ended_at:
+                self.period = get_billing_period(self.call.ended_at)
+
+        super().save(*args, **kwargs)
+        invalidate_bills([(self.subscriber, self.period)])
+
+    def delete(self, *args, **kwargs):
+        result = super().delete(*args, **kwargs)
+        invalidate_bills([(self.subscriber, self.period)])
+        return result
+
+
+# The price and tariff plan of a bill record before and after it was billed
+# again, such as by the rebill command.
+class BillRecordRevision(models.Model):
+    call_id = models.PositiveIntegerField(db_index=True)
+    period = models.DateField()
+    old_price = models.DecimalField(max_digits=10, decimal_places=2)
+    new_price = models.DecimalField(max_digits=10, decimal_places=2)
+    old_tariff_plan_id = models.IntegerField(null=True, blank=True)
+    new_tariff_plan_id = models.IntegerField(null=True, blank=True)
+    reason = models.CharField(max_length=200, blank=True)
+    revised_at = models.DateTimeField()
+
+
+class BillingTaskManager(models.Manager):
+
+    def enqueue(self, call_ids):
+        calls = Call.objects.filter(
+            id__in=list(call_ids),
+            started_at__isnull=False, ended_at__isnull=False)
+        try:
+            calls_sql, params = calls.values('id').query.sql_with_params()
+        except EmptyResultSet:
+            return 0
+
+        with connection.cursor() as cursor:
+            cursor.execute(ENQUEUE_SQL.format(calls=calls_sql), params)
+            return cursor.rowcount
+
+    def process(self, batch_size, max_attempts):
+        """Bills a batch of queued calls, returning how many were taken.
+
+        The tasks are deleted in the same transaction that bills them, so a
+        worker dying halfway leaves them queued for the next one.
+        """
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.execute(DEQUEUE_SQL, {'max_attempts': max_attempts,
+                                         'batch_size': batch_size})
+            tasks = dict(cursor.fetchall())
+            if not tasks:
+                return 0
+
+            with trace('billing.batch', calls=len(tasks)):
+                try:
+                    with transaction.atomic():
+                        BillRecord.objects.create_for_calls(tasks)
+                except (DatabaseError, ValueError):
+                    with span('billing.one_by_one'):
+                        self.process_one_by_one(tasks)
+
+            return len(tasks)
+
+    def process_one_by_one(self, tasks):
+        failed = []
+        for call_id, attempts in tasks.items():
+            try:
+                with transaction.atomic():
+                    BillRecord.objects.create_for_calls([call_id])
+            except (DatabaseError, ValueError):
+                failed.append(self.model(call_id=call_id,
+                                         attempts=attempts + 1))
+
+        self.bulk_create(failed)
+
+    def get_depth(self, max_attempts):
+        return self.aggregate(
+            pending=models.Count(
+                'id', filter=models.Q(attempts__lt=max_attempts)),
+            failed=models.Count(
+                'id', filter=models.Q(attempts__gte=max_attempts)),
+            oldest_enqueued_at=models.Min(
+                'enqueued_at', filter=models.Q(attempts__lt=max_attempts)),
+        )
+
+
+class BillingTask(models.Model):
+    objects = BillingTaskManager()
+
+    call = models.OneToOneField(Call, on_delete=models.CASCADE)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    enqueued_at = models.DateTimeField(auto_now_add=True)
+
+
+class MonthlyBillManager(models.Manager):
+
+    # When the bill was closed and its payload, still serialized.
+    def get_closed_bill(self, subscriber, period):
+        if not is_closed_period(period):
+            return None
+
+        return self.filter(
+            subscriber=subscriber, period=get_period_start(period)
+        ).values_list('closed_at', 'payload').first()
+
+    def get_payload(self, subscriber, period):
+        closed_bill = self.get_closed_bill(subscriber, period)
+        return json.loads(closed_bill[1]) if closed_bill is not None else None
+
+
+class MonthlyBill(models.Model):
+    objects = MonthlyBillManager()
+
+    subscriber = models.CharField(max_length=11)
+    period = models.DateField()
+    call_count = models.PositiveIntegerField()
+    total_duration = models.DurationField()
+    total_price = models.DecimalField(max_digits=12, decimal_places=2)
+    # The bill rendered by BillSerializer when the period was closed.
+    payload = models.TextField()
+    closed_at = models.DateTimeField()
+
+    class Meta:
+        unique_together = ('subscriber', 'period')
@@ -0,0 +1,128 @@
+import re
+from datetime import date
+
+from django.db import connection, transaction
+from django.utils import timezone
+
+from .periods import add_months, get_next_period, get_period_start
+
+
+TABLE = 'bill_billrecord'
+DEFAULT_PARTITION = f'{TABLE}_default'
+
+PARTITION_NAME = re.compile(rf'{TABLE}_p(\d{{4}})_(\d{{2}})')
+
+LIST_PARTITIONS_SQL = '''
+    SELECT child.relname
+    FROM pg_inherits
+    JOIN pg_class child ON child.oid = pg_inherits.inhrelid
+    WHERE pg_inherits.inhparent = %s::regclass
+'''
+
+# The new partition is filled with the rows of its period already in the
+# default partition before being attached, which would fail otherwise.
+# Statements run on the partitions leave bill_billedcall untouched, as the
+# moved rows are still billed.
+CREATE_PARTITION_SQL = '''
+    CREATE TABLE {partition}
+        (LIKE {table} INCLUDING DEFAULTS INCLUDING CONSTRAINTS);
+    WITH moved AS (
+        DELETE FROM {default}
+        WHERE period >= %(start)s AND period < %(end)s
+        RETURNING *
+    )
+    INSERT INTO {partition} SELECT * FROM moved;
+    ALTER TABLE {table} ATTACH PARTITION {partition}
+        FOR VALUES FROM (%(start)s) TO (%(end)s);
+'''
+
+
+def get_partition_name(period):
+    return f'{TABLE}_p{period:%Y_%m}'
+
+
+def get_partition_period(name):
+    match = PARTITION_NAME.fullmatch(name)
+    if match:
+        return date(int(match.group(1)), int(match.group(2)), 1)
+
+
+def get_partitions():
+    with connection.cursor() as cursor:
+        cursor.execute(LIST_PARTITIONS_SQL, [TABLE])
+        periods = [get_partition_period(name) for name, in cursor.fetchall()]
+
+    return sorted(period for period in periods if period)
+
+
+def get_default_partition_periods():
+    with connection.cursor() as cursor:
+        cursor.execute(f'SELECT DISTINCT period FROM {DEFAULT_PARTITION}'
+                       f' WHERE period IS NOT NULL')
+        return {get_period_start(period) for period, in cursor.fetchall()}
+
+
+@transaction.atomic
+def create_partition(period):
+    quote = connection.ops.quote_name
+    with connection.cursor() as cursor:
+        cursor.execute(CREATE_PARTITION_SQL.format(
+            table=quote(TABLE), default=quote(DEFAULT_PARTITION),
+            partition=quote(get_partition_name(period))
+        ), {'start': period, 'end': get_next_period(period)})
+
+
+@transaction.atomic
+def detach_partition(period, drop=False):
+    quote = connection.ops.quote_name
+    partition = quote(get_partition_name(period))
+    with connection.cursor() as cursor:
+        cursor.execute(f'ALTER TABLE {quote(TABLE)}'
+                       f' DETACH PARTITION {partition}')
+        # The calls of the partition are kept in bill_billedcall, so that
+        # reconcile_billing and the billing workers do not bill them again.
+        if drop:
+            cursor.execute(f'DROP TABLE {partition}')
+
+
+class PartitionMaintenance:
+    def __init__(self, months_ahead=3, retention_months=None, drop=False,
+                 stdout=None):
+        self.months_ahead = months_ahead
+        self.retention_months = retention_months
+        self.drop = drop
+        self.stdout = stdout
+
+    def log(self, message):
+        if self.stdout:
+            self.stdout.write(message)
+
+    def get_expiry(self, current_period):
+        if self.retention_months is None:
+            return None
+        return add_months(current_period, -self.retention_months)
+
+    def run(self):
+        current_period = get_period_start(timezone.localdate())
+        expiry = self.get_expiry(current_period)
+        existing = set(get_partitions())
+
+        # Months with rows in the default partition, and the upcoming ones.
+        wanted = get_default_partition_periods()
+        wanted.update(add_months(current_period, months)
+                      for months in range(self.months_ahead + 1))
+
+        created = sorted(period for period in wanted - existing
+                         if expiry is None or period >= expiry)
+        for period in created:
+            create_partition(period)
+            self.log(f'Created {get_partition_name(period)}.')
+
+        expired = sorted(period for period in existing
+                         if expiry is not None and period < expiry)
+        for period in expired:
+            detach_partition(period, drop=self.drop)
+            action = 'Dropped' if self.drop else 'Detached'
+            self.log(f'{action} {get_partition_name(period)}.')
+
+        return created, expired
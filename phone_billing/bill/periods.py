@@ -0,0 +1,37 @@
+from datetime import date, datetime
+
+from django.utils import timezone
+
+
+def get_period_start(period):
+    return date(period.year, period.month, 1)
+
+
+def get_billing_period(ended_at):
+    return get_period_start(timezone.localtime(ended_at))
+
+
+def add_months(period, months):
+    index = period.year * 12 + period.month - 1 + months
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def get_next_period(period):
+    return add_months(period, 1)
+
+
+def get_previous_period():
+    return add_months(timezone.localdate(), -1)
+
+
+def get_period_range(period):
+    """Returns the aware datetimes where a period starts and the next one
+    starts, in the current time zone."""
+    start, end = get_period_start(period), get_next_period(period)
+    return (timezone.make_aware(datetime(start.year, start.month, 1)),
+            timezone.make_aware(datetime(end.year, end.month, 1)))
+
+
+def is_closed_period(period):
+    today = timezone.localdate()
+    return (period.year, period.month) < (today.year, today.month)
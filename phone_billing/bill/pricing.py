@@ -1,19 +1,148 @@
+from bisect import bisect_right
 from datetime import time
 from decimal import Decimal
 
+import numpy as np
+
+
+MICROSECONDS_PER_SECOND = 1000000
+SECONDS_PER_DAY = 86400
+MINUTES_PER_DAY = 1440
+
 
 def calculate_call_charge(call_start, call_end):
     Tariff = get_tariff(call_end)
     return Tariff.calculate(call_end - call_start)
 
 
+# Vectorized calculate_call_charge, taking epoch seconds and returning prices
+# in centavos.
+def calculate_call_charges(call_starts, call_ends, plans=None):
+    starts = to_microseconds(call_starts)
+    ends = to_microseconds(call_ends)
+
+    called_minutes = (ends - starts) // (60 * MICROSECONDS_PER_SECOND)
+    minutes_of_day = ends // (60 * MICROSECONDS_PER_SECOND) % MINUTES_PER_DAY
+
+    standing_charges = np.zeros(len(ends), dtype=np.int64)
+    charges_per_minute = np.zeros(len(ends), dtype=np.int64)
+    plans = plans or get_tariff_plans()
+    plan_indexes = plans.get_plan_indexes(ends)
+    for plan_index in np.unique(plan_indexes):
+        plan = plans.get_plan_by_index(plan_index)
+        in_plan = plan_indexes == plan_index
+        tariff_indexes = plan.minute_table[minutes_of_day[in_plan]]
+        if (tariff_indexes < 0).any():
+            raise ValueError('No tariff is applicable to some of the calls.')
+
+        standing_charges[in_plan] = plan.standing_charges[tariff_indexes]
+        charges_per_minute[in_plan] = plan.charges_per_minute[tariff_indexes]
+
+    return standing_charges + charges_per_minute * called_minutes
+
+
+def get_tariff_plan_ids(call_ends, plans=None):
+    plans = plans or get_tariff_plans()
+    plan_indexes = plans.get_plan_indexes(to_microseconds(call_ends))
+    return [plans.get_plan_by_index(index).id for index in plan_indexes]
+
+
+def to_microseconds(epoch_seconds):
+    epoch_seconds = np.asarray(epoch_seconds, dtype=np.float64)
+    return np.rint(epoch_seconds * MICROSECONDS_PER_SECOND).astype(np.int64)
+
+
+def to_centavos(value):
+    centavos = value * 100
+    if centavos != centavos.to_integral_value():
+        raise ValueError(f'{value} can not be represented in centavos.')
+    return int(centavos)
+
+
+def from_centavos(centavos):
+    return Decimal(int(centavos)).scaleb(-2)
+
+
+def get_seconds_of_day(value):
+    return value.hour * 3600 + value.minute * 60 + value.second
+
+
 def get_tariff(call_dt):
-    call_time = call_dt.time()
+    return get_tariff_plan(call_dt).get_tariff(call_dt)
+
+
+def get_tariff_plan(call_dt):
+    return get_tariff_plans().get_plan(call_dt)
+
 
-    if StandardTariff.is_applicable(call_time):
-        return StandardTariff
-    elif ReducedTariff.is_applicable(call_time):
-        return ReducedTariff
+_tariff_plans_cache = {'plans': None, 'version': None}
+
+
+def get_tariff_plans():
+    """Returns the compiled tariff plans, reloaded whenever any process
+    changed them since they were compiled."""
+    from .models import TariffPlan
+
+    # Read before the plans, so that plans changed in between are compiled
+    # under the former version and reloaded on the next call.
+    version = TariffPlan.objects.get_version()
+    if version != _tariff_plans_cache['version']:
+        plans = TariffPlan.objects.prefetch_related('tariffs')
+        _tariff_plans_cache['plans'] = TariffPlanSet(
+            [plan.compile() for plan in plans])
+        _tariff_plans_cache['version'] = version
+
+    return _tariff_plans_cache['plans']
+
+
+def clear_tariff_plans_cache():
+    _tariff_plans_cache['version'] = None
+
+
+class TariffPlanSet:
+    def __init__(self, plans):
+        self.plans = sorted(plans, key=lambda plan: plan.effective_from)
+        self.effective_from = [plan.effective_from for plan in self.plans]
+        self.effective_from_microseconds = to_microseconds(
+            [effective_from.timestamp()
+             for effective_from in self.effective_from])
+
+    def get_plan(self, call_dt):
+        index = bisect_right(self.effective_from, call_dt)
+        return self.plans[index - 1] if index else DEFAULT_TARIFF_PLAN
+
+    def get_plan_indexes(self, call_ends):
+        return np.searchsorted(self.effective_from_microseconds, call_ends,
+                               side='right') - 1
+
+    def get_plan_by_index(self, index):
+        return self.plans[index] if index >= 0 else DEFAULT_TARIFF_PLAN
+
+
+class CompiledTariffPlan:
+    def __init__(self, id, effective_from, tariffs):
+        self.id = id
+        self.effective_from = effective_from
+        self.tariffs = tuple(tariffs)
+
+        self.standing_charges = np.array(
+            [to_centavos(Tariff.standing_charge) for Tariff in self.tariffs],
+            dtype=np.int64)
+        self.charges_per_minute = np.array(
+            [to_centavos(Tariff.charge_per_minute) for Tariff in self.tariffs],
+            dtype=np.int64)
+
+        # Index of the applicable tariff for every minute of the day, or -1.
+        self.minute_table = np.full(MINUTES_PER_DAY, -1, dtype=np.int64)
+        seconds_of_day = np.arange(MINUTES_PER_DAY) * 60
+        for index, Tariff in enumerate(self.tariffs):
+            applicable = Tariff.get_applicable_mask(seconds_of_day)
+            self.minute_table[applicable & (self.minute_table < 0)] = index
+
+    def get_tariff(self, call_dt):
+        index = self.minute_table[call_dt.hour * 60 + call_dt.minute]
+        if index >= 0:
+            return self.tariffs[index]
 
 
 class BaseTariff:
@@ -29,6 +158,15 @@ class BaseTariff:
         else:
             return call_time < cls.end_time or call_time >= cls.start_time
 
+    @classmethod
+    def get_applicable_mask(cls, seconds_of_day):
+        start = get_seconds_of_day(cls.start_time)
+        end = get_seconds_of_day(cls.end_time)
+        if start < end:
+            return (start <= seconds_of_day) & (seconds_of_day < end)
+        else:
+            return (seconds_of_day < end) | (seconds_of_day >= start)
+
     @classmethod
     def calculate(cls, call_duration):
         called_minutes = cls.get_called_minutes(call_duration)
@@ -50,3 +188,9 @@ class ReducedTariff(BaseTariff):
     charge_per_minute = Decimal('0.00')
     start_time = time(22)
     end_time = time(6)
+
+
+# Tariffs in order of precedence, used when no tariff plan is in effect.
+TARIFFS = (StandardTariff, ReducedTariff)
+
+DEFAULT_TARIFF_PLAN = CompiledTariffPlan(None, None, TARIFFS)
@@ -0,0 +1,106 @@
+import time
+
+from django.db import transaction
+from django.db.models import Max, Min
+
+from ..parallel import get_id_ranges, parallel_map
+
+from .closing import close_subscribers
+from .models import BillRecord, MonthlyBill
+from .periods import get_period_start
+from .pricing import clear_tariff_plans_cache
+
+
+def rebuild_monthly_bills(period, subscribers):
+    """Closes again the monthly bills the subscribers already have."""
+    # Locked so that workers rebuilding the same bill render it one after
+    # the other, each seeing the prices the others committed.
+    closed = list(MonthlyBill.objects.select_for_update().filter(
+        period=period, subscriber__in=subscribers
+    ).order_by('subscriber').values_list('subscriber', flat=True))
+    if not closed:
+        return 0
+    return close_subscribers(period, closed)
+
+
+def rebill_range(period, after, last, batch_size, dry_run, reason):
+    """Prices the bill records of calls with ids in (after, last] again, a
+    batch at a time, along with the monthly bills they change.
+
+    Returns how many records were looked at and changed, and how many
+    monthly bills were rebuilt. The changes themselves are only kept on a
+    dry run, to be listed.
+    """
+    checked = changed = rebuilt = 0
+    changes = []
+    while True:
+        with transaction.atomic():
+            call_ids, batch_changes, subscribers = BillRecord.objects.reprice(
+                period, after, last, batch_size, dry_run, reason)
+            if subscribers and not dry_run:
+                rebuilt += rebuild_monthly_bills(period, subscribers)
+        if not call_ids:
+            return checked, changed, rebuilt, changes
+        checked += len(call_ids)
+        changed += len(batch_changes)
+        if dry_run:
+            changes += batch_changes
+        after = call_ids[-1]
+
+
+def run_rebill_range(args):
+    return rebill_range(*args)
+
+
+class PeriodRebill:
+    def __init__(self, period, workers=1, batch_size=5000, dry_run=False,
+                 reason='', stdout=None):
+        self.period = get_period_start(period)
+        self.workers = workers
+        self.batch_size = batch_size
+        self.dry_run = dry_run
+        self.reason = reason
+        self.stdout = stdout
+
+    def log(self, message):
+        if self.stdout:
+            self.stdout.write(message)
+
+    def log_change(self, change):
+        call_id, old_price, new_price, old_plan_id, new_plan_id = change
+        message = f'Call {call_id}: {old_price} -> {new_price}'
+        if old_plan_id != new_plan_id:
+            message += f' (tariff plan {old_plan_id} -> {new_plan_id})'
+        self.log(message)
+
+    def run(self):
+        started_at = time.monotonic()
+        # Prices with the tariff plans as they are now.
+        clear_tariff_plans_cache()
+
+        bounds = BillRecord.objects.filter(period=self.period).aggregate(
+            first=Min('call_id'), last=Max('call_id'))
+        tasks = []
+        if bounds['first'] is not None:
+            tasks = [(self.period, after, last, self.batch_size, self.dry_run,
+                      self.reason)
+                     for after, last in get_id_ranges(
+                         bounds['first'], bounds['last'], self.workers)]
+        results = parallel_map(run_rebill_range, tasks, self.workers)
+        checked = changed = rebuilt = 0
+        for range_checked, range_changed, range_rebuilt, changes in results:
+            checked += range_checked
+            changed += range_changed
+            rebuilt += range_rebuilt
+            for change in changes:
+                self.log_change(change)
+
+        elapsed = max(time.monotonic() - started_at, 1e-6)
+        action = 'Would rebill' if self.dry_run else 'Rebilled'
+        self.log(f'{action} {changed} of {checked} bill records for'
+                 f' {self.period:%m/%Y} in {elapsed:.1f}s'
+                 f' ({checked / elapsed:.0f} records/s).')
+        if rebuilt:
+            self.log(f'Rebuilt {rebuilt} monthly bills, once per batch'
+                     f' changing them.')
+        return checked, changed, rebuilt
@@ -1,6 +1,27 @@
-from .models import BillRecord
+from contextlib import contextmanager
+
+from .cache import invalidate_bills
+from .models import BillingTask, BillRecord
 
 
 def bill_call_record(instance):
-    if (instance.call.start_record and instance.call.end_record):
-        BillRecord.objects.create_for_call(instance.call)
+    if instance.call.started_at and instance.call.ended_at:
+        BillingTask.objects.enqueue([instance.call_id])
+
+
+def bill_calls(call_ids):
+    return BillRecord.objects.create_for_calls(call_ids)
+
+
+def enqueue_billing(call_ids):
+    return BillingTask.objects.enqueue(call_ids)
+
+
+@contextmanager
+def changing_billed_calls(call_ids):
+    """Syncs the bill records of calls changed inside the block with them,
+    invalidating their cached bills both before and after the change."""
+    periods = BillRecord.objects.get_billed_periods(call_ids)
+    yield
+    periods += BillRecord.objects.sync_calls(call_ids)
+    invalidate_bills(periods)
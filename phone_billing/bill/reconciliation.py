@@ -0,0 +1,58 @@
+import time
+
+from django.db.models import Max, Min
+
+from ..call.models import Call
+from ..parallel import get_id_ranges, parallel_map
+
+from .models import BillRecord
+
+
+def reconcile_range(after, last, chunk_size):
+    """Bills the unbilled calls with ids in (after, last], a chunk at a
+    time, returning how many were found and how many failed."""
+    found = failed = 0
+    while True:
+        call_ids, failed_ids = BillRecord.objects.create_for_unbilled_calls(
+            after, last, chunk_size)
+        if not call_ids:
+            return found, failed
+        found += len(call_ids)
+        failed += len(failed_ids)
+        after = call_ids[-1]
+
+
+def run_reconcile_range(args):
+    return reconcile_range(*args)
+
+
+class BillingReconciliation:
+    def __init__(self, workers=1, chunk_size=10000, stdout=None):
+        self.workers = workers
+        self.chunk_size = chunk_size
+        self.stdout = stdout
+
+    def log(self, message):
+        if self.stdout:
+            self.stdout.write(message)
+
+    def run(self):
+        started_at = time.monotonic()
+
+        bounds = Call.objects.aggregate(first=Min('id'), last=Max('id'))
+        if bounds['first'] is None:
+            self.log('No calls to reconcile.')
+            return 0, 0
+
+        tasks = [(after, last, self.chunk_size) for after, last in
+                 get_id_ranges(bounds['first'], bounds['last'], self.workers)]
+        results = parallel_map(run_reconcile_range, tasks, self.workers)
+        found = sum(found for found, _ in results)
+        failed = sum(failed for _, failed in results)
+
+        elapsed = max(time.monotonic() - started_at, 1e-6)
+        self.log(f'Billed {found - failed} unbilled calls in {elapsed:.1f}s'
+                 f' ({(found - failed) / elapsed:.0f} calls/s).')
+        if failed:
+            self.log(f'Queued {failed} calls failing to be billed.')
+        return found - failed, failed
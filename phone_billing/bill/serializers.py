@@ -1,12 +1,51 @@
 from datetime import timedelta
 from rest_framework import serializers
 
+from django.db.models import QuerySet
 from django.utils import timezone
+from django.utils.duration import duration_string
 
-from ..call.models import Call, CallRecord
 from ..call.serializers import PhoneField
 
 from .models import BillRecord
+from .periods import get_period_start
+
+
+# Read-only BillRecordSerializer for rows of BillRecord values().
+class BillRecordValuesSerializer:
+    values = ('id', 'call__destination', 'call__started_at',
+              'call__duration', 'price')
+
+    def get_queryset(self, queryset):
+        return queryset.values(*self.values)
+
+    def to_representation(self, row):
+        start_date = start_time = duration = None
+        if row['call__started_at'] is not None:
+            started_at = timezone.localtime(row['call__started_at'])
+            start_date = started_at.strftime('%d/%m/%Y')
+            start_time = started_at.strftime('%H:%M:%S')
+        if row['call__duration'] is not None:
+            duration = duration_string(row['call__duration'])
+
+        return {
+            'id': row['id'],
+            'destination': row['call__destination'],
+            'call_start_date': start_date,
+            'call_start_time': start_time,
+            'call_duration': duration,
+            'call_price': '{:f}'.format(row['price']),
+        }
+
+
+class BillRecordListSerializer(serializers.ListSerializer):
+    def to_representation(self, data):
+        if not isinstance(data, QuerySet):
+            return super().to_representation(data)
+
+        serializer = BillRecordValuesSerializer()
+        return [serializer.to_representation(row)
+                for row in serializer.get_queryset(data)]
 
 
 class BillRecordSerializer(serializers.ModelSerializer):
@@ -23,6 +62,8 @@ class BillRecordSerializer(serializers.ModelSerializer):
         model = BillRecord
         fields = ('id', 'destination', 'call_start_date', 'call_start_time',
                   'call_duration', 'call_price')
+        # Querysets of bill records are serialized from their values().
+        list_serializer_class = BillRecordListSerializer
 
 
 class BillSerializer(serializers.Serializer):
@@ -31,9 +72,6 @@ class BillSerializer(serializers.Serializer):
                                    required=False)
     bill_records = BillRecordSerializer(many=True, read_only=True)
 
-    def filter_calls_by_subscriber(self):
-        return Call.objects.filter(source=self.validated_data['subscriber'])
-
     def get_period(self):
         if not self.validated_data.get('period'):
             today = timezone.now().date()
@@ -42,19 +80,16 @@ class BillSerializer(serializers.Serializer):
 
         return self.validated_data['period']
 
-    def filter_calls_by_period(self, calls):
-        period = self.get_period()
-        return CallRecord.objects.filter(
-            record_type='end', timestamp__month=period.month,
-            timestamp__year=period.year, call__in=calls
-        ).values_list('call', flat=True)
-
     def filter_bill_records(self):
-        calls = self.filter_calls_by_subscriber()
-        calls = self.filter_calls_by_period(calls)
-
-        return BillRecord.objects.filter(call__in=calls)
+        return BillRecord.objects.filter(
+            subscriber=self.validated_data['subscriber'],
+            period=get_period_start(self.get_period())
+        ).select_related('call').order_by('id')
 
     def search_bill_records(self):
         records = self.filter_bill_records()
         self.validated_data['bill_records'] = records
+
+
+class BillExportSerializer(serializers.Serializer):
+    period = serializers.DateField(format='%m/%Y', input_formats=['%m/%Y'])
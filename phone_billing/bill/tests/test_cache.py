@@ -0,0 +1,141 @@
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+from unittest.mock import patch
+
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from django.utils.timezone import utc
+
+from ...call.batch import CallRecordBatch
+from ...call.models import Call, CallRecord
+from ...metrics import request_metrics
+
+from ..cache import (cache_bill, get_bill_cache, get_bill_cache_key,
+                     get_bill_cache_stats, get_bill_version, get_cached_bill,
+                     invalidate_bills)
+from ..models import BillingTask, BillRecord
+
+
+# TestCase never commits, so invalidations run as soon as they are requested.
+run_on_commit = patch('phone_billing.bill.cache.transaction.on_commit',
+                      lambda callback: callback())
+
+
+@override_settings(METRICS_DIR=None)
+class BillCacheTestCase(TestCase):
+    def setUp(self):
+        get_bill_cache().clear()
+        self.addCleanup(get_bill_cache().clear)
+        request_metrics.clear()
+        self.addCleanup(request_metrics.clear)
+        self.period = date(2018, 2, 1)
+
+    def test_cache_key(self):
+        self.assertEquals(get_bill_cache_key('00123456789', self.period),
+                          'bill:00123456789:2018-02')
+
+    def test_cache_bill(self):
+        self.assertIsNone(get_cached_bill('00123456789', self.period, 'v1'))
+
+        cache_bill('00123456789', self.period, 'v1', {'test': 'test'},
+                   datetime(2018, 3, 1, tzinfo=utc))
+
+        self.assertEquals(get_cached_bill('00123456789', self.period, 'v1'),
+                          ({'test': 'test'}, datetime(2018, 3, 1, tzinfo=utc)))
+        self.assertEquals(get_bill_cache_stats(), {'hits': 1, 'misses': 1})
+
+    def test_other_versions_are_not_served(self):
+        cache_bill('00123456789', self.period, 'v1', {'test': 'test'})
+
+        self.assertIsNone(get_cached_bill('00123456789', self.period, 'v2'))
+        self.assertEquals(get_bill_cache_stats(), {'hits': 0, 'misses': 1})
+
+    def test_open_periods_are_not_cached(self):
+        today = timezone.localdate()
+
+        cache_bill('00123456789', today, 'v1', {'test': 'test'})
+
+        self.assertIsNone(get_cached_bill('00123456789', today, 'v1'))
+        self.assertEquals(get_bill_cache_stats(), {'hits': 0, 'misses': 0})
+
+    @run_on_commit
+    def test_bill_version(self):
+        version = get_bill_version('00123456789', self.period)
+
+        self.assertEquals(get_bill_version('00123456789', self.period),
+                          version)
+        self.assertNotEqual(get_bill_version('00987654321', self.period),
+                            version)
+
+        invalidate_bills([('00123456789', self.period)])
+
+        self.assertNotEqual(get_bill_version('00123456789', self.period),
+                            version)
+
+
+@run_on_commit
+class BillCacheInvalidationTestCase(TestCase):
+    def setUp(self):
+        get_bill_cache().clear()
+        self.addCleanup(get_bill_cache().clear)
+
+        self.subscriber = '00123456789'
+        self.end = datetime(2018, 2, 10, 12, tzinfo=utc)
+        self.start = self.end - timedelta(minutes=5)
+        self.call = Call.objects.create(id=1, source=self.subscriber,
+                                        destination='10123456789')
+        CallRecord.objects.create(id=1, call=self.call, record_type='start',
+                                  timestamp=self.start)
+        CallRecord.objects.create(id=2, call=self.call, record_type='end',
+                                  timestamp=self.end)
+
+        self.cache_bill(self.end)
+
+    def cache_bill(self, period):
+        cache_bill(self.subscriber, period,
+                   get_bill_version(self.subscriber, period), {'test': 'test'})
+
+    def get_cached_bill(self, period):
+        return get_cached_bill(self.subscriber, period,
+                               get_bill_version(self.subscriber, period))
+
+    def assertInvalidated(self, period):
+        self.assertIsNone(self.get_cached_bill(period))
+
+    def test_invalidated_when_billed(self):
+        BillingTask.objects.process(batch_size=10, max_attempts=1)
+
+        self.assertInvalidated(self.end)
+
+    def test_invalidated_when_bill_record_changes(self):
+        BillingTask.objects.process(batch_size=10, max_attempts=1)
+        self.cache_bill(self.end)
+
+        record = BillRecord.objects.get()
+        record.price = Decimal('1')
+        record.save()
+
+        self.assertInvalidated(self.end)
+
+    def test_invalidated_in_both_periods_when_call_moves(self):
+        BillingTask.objects.process(batch_size=10, max_attempts=1)
+        self.cache_bill(self.end)
+        new_end = datetime(2018, 3, 1, 0, 1, tzinfo=utc)
+        self.cache_bill(new_end)
+
+        batch = CallRecordBatch([{'id': 2, 'type': 'end', 'call_id': 1,
+                                  'timestamp': new_end.timestamp()}])
+        batch.validate()
+        batch.save()
+
+        self.assertInvalidated(self.end)
+        self.assertInvalidated(new_end)
+
+    def test_other_periods_are_kept(self):
+        other_period = datetime(2018, 1, 10, tzinfo=utc)
+        self.cache_bill(other_period)
+
+        BillingTask.objects.process(batch_size=10, max_attempts=1)
+
+        self.assertEquals(self.get_cached_bill(other_period),
+                          ({'test': 'test'}, None))
@@ -0,0 +1,201 @@
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+from io import StringIO
+from unittest.mock import patch
+
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.test import TestCase
+from django.urls import reverse
+from django.utils.http import http_date
+from django.utils.timezone import utc
+from rest_framework.test import APITestCase
+
+from ...call.models import Call, CallRecord
+
+from ..cache import cache_bill, get_bill_cache
+from ..closing import PeriodClose, close_subscribers, get_period_subscribers
+from ..models import BillRecord, MonthlyBill
+from ..periods import get_next_period, get_period_range, get_previous_period
+
+from .utils import memory_bill_cache
+
+
+class ClosedPeriodTestMixin:
+    def setUp(self):
+        get_bill_cache().clear()
+        self.addCleanup(get_bill_cache().clear)
+
+        self.period = date(2018, 2, 1)
+        self.create_call(1, '00123456789', datetime(2018, 2, 1, 0, 0, 5),
+                         minutes=3, price='0.63')
+        self.create_call(2, '00123456789', datetime(2018, 2, 28, 23, 59),
+                         minutes=10, price='1.26')
+        self.create_call(3, '10123456789', datetime(2018, 2, 10, 12),
+                         minutes=1, price='0.45')
+        self.create_call(4, '00123456789', datetime(2018, 3, 1, 0, 1),
+                         minutes=1, price='0.36')
+
+    def create_call(self, id, source, ended_at, minutes, price):
+        ended_at = ended_at.replace(tzinfo=utc)
+        call = Call.objects.create(id=id, source=source,
+                                   destination='20123456789')
+        CallRecord.objects.create(id=id * 2, call=call, record_type='start',
+                                  timestamp=ended_at - timedelta(
+                                      minutes=minutes))
+        CallRecord.objects.create(id=id * 2 + 1, call=call,
+                                  record_type='end', timestamp=ended_at)
+        BillRecord.objects.create(call=call, price=Decimal(price))
+
+
+class PeriodsTestCase(TestCase):
+    def test_get_next_period(self):
+        self.assertEquals(get_next_period(date(2018, 2, 15)),
+                          date(2018, 3, 1))
+        self.assertEquals(get_next_period(date(2018, 12, 1)),
+                          date(2019, 1, 1))
+
+    @patch('phone_billing.bill.periods.timezone.localdate')
+    def test_get_previous_period(self, mocked_localdate):
+        mocked_localdate.return_value = date(2018, 3, 31)
+        self.assertEquals(get_previous_period(), date(2018, 2, 1))
+
+        mocked_localdate.return_value = date(2018, 1, 15)
+        self.assertEquals(get_previous_period(), date(2017, 12, 1))
+
+    def test_get_period_range(self):
+        self.assertEquals(get_period_range(date(2018, 2, 15)), (
+            datetime(2018, 2, 1, tzinfo=utc),
+            datetime(2018, 3, 1, tzinfo=utc),
+        ))
+
+
+class CloseSubscribersTestCase(ClosedPeriodTestMixin, TestCase):
+    def test_get_period_subscribers(self):
+        self.assertEquals(get_period_subscribers(self.period),
+                          ['00123456789', '10123456789'])
+
+    def test_close_subscribers(self):
+        closed = close_subscribers(self.period, ['00123456789'])
+
+        self.assertEquals(closed, 1)
+        bill = MonthlyBill.objects.get()
+        self.assertEquals(bill.subscriber, '00123456789')
+        self.assertEquals(bill.period, self.period)
+        self.assertEquals(bill.call_count, 2)
+        self.assertEquals(bill.total_duration, timedelta(minutes=13))
+        self.assertEquals(bill.total_price, Decimal('1.89'))
+
+        payload = MonthlyBill.objects.get_payload('00123456789', self.period)
+        self.assertEquals(payload['period'], '02/2018')
+        self.assertEquals(
+            [record['call_price'] for record in payload['bill_records']],
+            ['0.63', '1.26'])
+
+    def test_close_again_rebuilds_bills(self):
+        close_subscribers(self.period, ['00123456789'])
+        BillRecord.objects.filter(call_id=1).update(price=Decimal('1.00'))
+
+        close_subscribers(self.period, ['00123456789'])
+
+        self.assertEquals(MonthlyBill.objects.get().total_price,
+                          Decimal('2.26'))
+
+    def test_period_close(self):
+        closed = PeriodClose(self.period, chunk_size=1).run()
+
+        self.assertEquals(closed, 2)
+        self.assertEquals(MonthlyBill.objects.count(), 2)
+
+    def test_open_periods_have_no_payload(self):
+        self.assertIsNone(
+            MonthlyBill.objects.get_payload('00123456789', date.today()))
+
+
+class ClosePeriodCommandTestCase(ClosedPeriodTestMixin, TestCase):
+    def test_command(self):
+        stdout = StringIO()
+
+        call_command('close_period', period='02/2018', workers=1,
+                     stdout=stdout)
+
+        self.assertEquals(MonthlyBill.objects.count(), 2)
+        self.assertIn('Closed 2 bills for 02/2018', stdout.getvalue())
+
+    def test_invalid_period(self):
+        with self.assertRaises(CommandError):
+            call_command('close_period', period='2018-02', workers=1)
+
+    def test_open_period(self):
+        with self.assertRaises(CommandError):
+            call_command('close_period',
+                         period=date.today().strftime('%m/%Y'), workers=1)
+
+
+@memory_bill_cache
+class ClosedPeriodViewTestCase(ClosedPeriodTestMixin, APITestCase):
+    def setUp(self):
+        super().setUp()
+        self.url = reverse('bill:search', args=['00123456789'])
+
+    def test_snapshot_matches_live_bill(self):
+        live = self.client.get(self.url, {'period': '02/2018'})
+        get_bill_cache().clear()
+
+        close_subscribers(self.period, ['00123456789'])
+        snapshot = self.client.get(self.url, {'period': '02/2018'})
+
+        self.assertEquals(snapshot.content, live.content)
+
+    def test_closed_period_is_one_lookup(self):
+        close_subscribers(self.period, ['00123456789'])
+
+        with self.assertNumQueries(1):
+            response = self.client.get(self.url, {'period': '02/2018'})
+
+        self.assertEquals(len(response.data['bill_records']), 2)
+
+    def test_closed_bill_is_not_modified(self):
+        close_subscribers(self.period, ['00123456789'])
+        response = self.client.get(self.url, {'period': '02/2018'})
+        closed_at = MonthlyBill.objects.get().closed_at
+        self.assertEquals(response['Last-Modified'],
+                          http_date(closed_at.timestamp()))
+
+        with self.assertNumQueries(0):
+            not_modified = self.client.get(
+                self.url, {'period': '02/2018'},
+                HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEquals(not_modified.status_code, 304)
+
+        not_modified = self.client.get(
+            self.url, {'period': '02/2018'},
+            HTTP_IF_MODIFIED_SINCE=response['Last-Modified'])
+        self.assertEquals(not_modified.status_code, 304)
+
+    @patch('phone_billing.bill.cache.transaction.on_commit',
+           lambda callback: callback())
+    def test_closing_again_changes_the_etag(self):
+        close_subscribers(self.period, ['00123456789'])
+        etag = self.client.get(self.url, {'period': '02/2018'})['ETag']
+
+        close_subscribers(self.period, ['00123456789'])
+        response = self.client.get(self.url, {'period': '02/2018'},
+                                   HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEquals(response.status_code, 200)
+        self.assertEquals(response['Last-Modified'], http_date(
+            MonthlyBill.objects.get().closed_at.timestamp()))
+
+    def test_bill_cached_at_another_version_is_not_served(self):
+        close_subscribers(self.period, ['00123456789'])
+        cache_bill('00123456789', self.period, 'former', {'stale': True})
+
+        response = self.client.get(self.url, {'period': '02/2018'})
+
+        self.assertEquals(len(response.data['bill_records']), 2)
+
+    def test_falls_back_to_live_bill(self):
+        response = self.client.get(self.url, {'period': '02/2018'})
+
+        self.assertEquals(len(response.data['bill_records']), 2)
@@ -0,0 +1,171 @@
+import csv
+import gzip
+import io
+import json
+import os
+import tempfile
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.test import TestCase
+from django.urls import reverse
+from django.utils.timezone import utc
+from rest_framework.test import APITestCase
+
+from ...call.models import Call
+
+from ..exports import BillExport
+from ..models import BillRecord, MonthlyBill
+
+
+class BillExportTestCaseMixin:
+    def setUp(self):
+        self.period = date(2018, 2, 1)
+        self.create_call(1, '00123456789', datetime(2018, 2, 1, 12), '0.63')
+        self.create_call(2, '00987654321', datetime(2018, 2, 2, 12), '0.45')
+        self.create_call(3, '00123456789', datetime(2018, 2, 3, 12), '0.36')
+        self.create_call(4, '00123456789', datetime(2018, 3, 1, 12), '0.99')
+
+    def create_call(self, id, source, ended_at, price):
+        ended_at = ended_at.replace(tzinfo=utc)
+        call = Call.objects.create(
+            id=id, source=source, destination='10123456789',
+            started_at=ended_at - timedelta(minutes=3), ended_at=ended_at,
+            duration=timedelta(minutes=3))
+        BillRecord.objects.create(call=call, price=Decimal(price))
+
+    def read_csv(self, data):
+        return list(csv.reader(io.StringIO(gzip.decompress(data).decode())))
+
+    def read_ndjson(self, data):
+        return [json.loads(line)
+                for line in gzip.decompress(data).decode().splitlines()]
+
+
+class BillExportTestCase(BillExportTestCaseMixin, TestCase):
+    def test_csv(self):
+        export = BillExport(self.period, 'csv', chunk_size=1)
+
+        rows = self.read_csv(b''.join(export))
+
+        self.assertEquals(rows[0], [
+            'subscriber', 'period', 'id', 'destination', 'call_start_date',
+            'call_start_time', 'call_duration', 'call_price'])
+        self.assertEquals([row[:2] + row[4:] for row in rows[1:]], [
+            ['00123456789', '02/2018', '01/02/2018', '11:57:00', '00:03:00',
+             '0.63'],
+            ['00123456789', '02/2018', '03/02/2018', '11:57:00', '00:03:00',
+             '0.36'],
+            ['00987654321', '02/2018', '02/02/2018', '11:57:00', '00:03:00',
+             '0.45'],
+        ])
+        self.assertEquals((export.bills, export.records), (2, 3))
+
+    def test_ndjson(self):
+        bills = self.read_ndjson(b''.join(BillExport(self.period, 'ndjson')))
+
+        self.assertEquals(
+            [(bill['subscriber'], bill['period'],
+              [record['call_price'] for record in bill['bill_records']])
+             for bill in bills],
+            [('00123456789', '02/2018', ['0.63', '0.36']),
+             ('00987654321', '02/2018', ['0.45'])])
+        self.assertEquals(bills[0]['bill_records'][0]['call_duration'],
+                          '00:03:00')
+
+    def test_closed_period(self):
+        MonthlyBill.objects.create(
+            subscriber='00123456789', period=self.period, call_count=1,
+            total_duration=timedelta(minutes=3), total_price=Decimal('0.99'),
+            payload=json.dumps({
+                'subscriber': '00123456789', 'period': '02/2018',
+                'bill_records': [{
+                    'id': 1, 'destination': '10123456789',
+                    'call_start_date': '01/02/2018',
+                    'call_start_time': '11:57:00',
+                    'call_duration': '00:03:00', 'call_price': '0.99',
+                }],
+            }),
+            closed_at=datetime(2018, 3, 1, tzinfo=utc))
+        export = BillExport(self.period, 'ndjson')
+
+        bills = self.read_ndjson(b''.join(export))
+
+        self.assertEquals(
+            [(bill['subscriber'],
+              [record['call_price'] for record in bill['bill_records']])
+             for bill in bills],
+            [('00123456789', ['0.99']), ('00987654321', ['0.45'])])
+        self.assertEquals((export.bills, export.records), (2, 2))
+
+    def test_empty_period(self):
+        export = BillExport(date(2018, 1, 1), 'ndjson')
+
+        self.assertEquals(self.read_ndjson(b''.join(export)), [])
+        self.assertEquals(export.bills, 0)
+
+    def test_unsupported_format(self):
+        with self.assertRaises(ValueError):
+            BillExport(self.period, 'xml')
+
+    def test_command(self):
+        path = os.path.join(tempfile.mkdtemp(), 'bills.csv.gz')
+        stdout = io.StringIO()
+
+        call_command('export_bills', period='02/2018', output=path,
+                     stdout=stdout)
+
+        with open(path, 'rb') as file:
+            self.assertEquals(len(self.read_csv(file.read())), 4)
+        self.assertIn('Exported 2 bills (3 records)', stdout.getvalue())
+
+    def test_command_with_bad_period(self):
+        with self.assertRaises(CommandError):
+            call_command('export_bills', period='2018-02')
+
+
+class BillExportViewTestCase(BillExportTestCaseMixin, APITestCase):
+    def setUp(self):
+        super().setUp()
+        self.admin = User.objects.create_user('admin', is_staff=True)
+
+    def get(self, file_format, **params):
+        return self.client.get(
+            reverse('bill:export', kwargs={'file_format': file_format}),
+            params)
+
+    def test_export(self):
+        self.client.force_authenticate(self.admin)
+
+        response = self.get('ndjson', period='02/2018')
+
+        self.assertEquals(response.status_code, 200)
+        self.assertEquals(response['Content-Type'], 'application/gzip')
+        self.assertEquals(response['Content-Disposition'],
+                          'attachment; filename="bills-2018-02.ndjson.gz"')
+        bills = self.read_ndjson(b''.join(response.streaming_content))
+        self.assertEquals([bill['subscriber'] for bill in bills],
+                          ['00123456789', '00987654321'])
+
+    def test_bad_period(self):
+        self.client.force_authenticate(self.admin)
+
+        response = self.get('csv', period='2018-02')
+
+        self.assertEquals(response.status_code, 400)
+        self.assertIn('period', response.data)
+
+    def test_unsupported_format(self):
+        self.client.force_authenticate(self.admin)
+
+        self.assertEquals(self.get('xml', period='02/2018').status_code, 404)
+
+    def test_requires_staff(self):
+        self.assertIn(self.get('csv', period='02/2018').status_code,
+                      (401, 403))
+
+        self.client.force_authenticate(User.objects.create_user('user'))
+        self.assertEquals(self.get('csv', period='02/2018').status_code, 403)
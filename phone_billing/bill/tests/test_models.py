@@ -1,12 +1,18 @@
+from datetime import date, datetime, time, timedelta
 from decimal import Decimal
 from unittest.mock import patch, Mock
 
 from django.db.utils import IntegrityError
 from django.test import TestCase
+from django.utils import timezone
+from django.utils.timezone import utc
 
 from ...call.models import Call
 
-from ..models import BillRecord
+from ..models import BillingTask, BillRecord, TariffPlan
+from ..receivers import changing_billed_calls
+from ..pricing import (calculate_call_charge, clear_tariff_plans_cache,
+                       get_tariff_plans)
 
 
 class BillRecordTestCase(TestCase):
@@ -30,14 +36,31 @@ class BillRecordTestCase(TestCase):
 
         mock_call = Mock()
         mock_call.id = self.call.id
-        mock_call.started_at = 'started_at'
-        mock_call.ended_at = 'ended_at'
+        mock_call.source = self.call.source
+        mock_call.started_at = timezone.now() - timedelta(minutes=5)
+        mock_call.ended_at = timezone.now()
 
         record = BillRecord.objects.create_for_call(mock_call)
         self.assertEquals(record.call, self.call)
         self.assertEquals(record.price, Decimal('1'))
 
-        mocked_service.assert_called_once_with('started_at', 'ended_at')
+        mocked_service.assert_called_once_with(mock_call.started_at,
+                                               mock_call.ended_at)
+
+    def test_create_for_call_records_tariff_plan(self):
+        self.addCleanup(clear_tariff_plans_cache)
+        plan = TariffPlan.objects.create(
+            effective_from=timezone.now() - timedelta(days=1))
+        plan.tariffs.create(name='Flat', start_time=time(0),
+                            end_time=time(0), standing_charge=Decimal('1'),
+                            charge_per_minute=Decimal('0.00'))
+        self.call.started_at = timezone.now() - timedelta(minutes=5)
+        self.call.ended_at = timezone.now()
+
+        record = BillRecord.objects.create_for_call(self.call)
+
+        self.assertEquals(record.tariff_plan, plan)
+        self.assertEquals(record.price, Decimal('1'))
 
     def test_create_for_call_manager_when_bill_already_created(self):
         old_record = BillRecord.objects.create(call=self.call,
@@ -55,3 +78,210 @@ class BillRecordTestCase(TestCase):
 
         with self.assertRaises(IntegrityError):
             other_record.save()
+
+
+class CreateForCallsTestCase(TestCase):
+
+    def setUp(self):
+        self.end = timezone.now()
+        self.start = self.end - timedelta(minutes=5)
+
+        for id in (1, 2):
+            Call.objects.create(id=id, source='00123456789',
+                                destination='10123456789',
+                                started_at=self.start, ended_at=self.end,
+                                duration=self.end - self.start)
+
+    @patch('phone_billing.bill.models.calculate_call_charges')
+    def test_creates_records_for_completed_calls(self, mocked_service):
+        mocked_service.return_value = [100, 136]
+
+        created = BillRecord.objects.create_for_calls([1, 2])
+
+        self.assertEquals(created, 2)
+        self.assertEquals(
+            sorted(BillRecord.objects.values_list('price', flat=True)),
+            [Decimal('1.00'), Decimal('1.36')])
+        mocked_service.assert_called_once_with(
+            [self.start.timestamp()] * 2, [self.end.timestamp()] * 2,
+            get_tariff_plans())
+
+    def test_creates_records_with_scalar_prices(self):
+        BillRecord.objects.create_for_calls([1])
+
+        self.assertEquals(BillRecord.objects.get().price,
+                          calculate_call_charge(self.start, self.end))
+
+    def test_records_tariff_plan(self):
+        self.addCleanup(clear_tariff_plans_cache)
+        plan = TariffPlan.objects.create(
+            effective_from=self.end - timedelta(seconds=1))
+        plan.tariffs.create(name='Flat', start_time=time(0),
+                            end_time=time(0), standing_charge=Decimal('1'),
+                            charge_per_minute=Decimal('0.00'))
+        Call.objects.filter(id=2).update(
+            ended_at=self.end - timedelta(seconds=2))
+
+        BillRecord.objects.create_for_calls([1, 2])
+
+        self.assertEquals(BillRecord.objects.get(call_id=1).tariff_plan, plan)
+        self.assertNotEquals(
+            BillRecord.objects.get(call_id=2).tariff_plan, plan)
+        self.assertEquals(BillRecord.objects.get(call_id=1).price,
+                          Decimal('1.00'))
+
+    def test_skips_incomplete_calls(self):
+        Call.objects.filter(id=2).update(ended_at=None, duration=None)
+
+        BillRecord.objects.create_for_calls([1, 2])
+
+        self.assertEquals(
+            list(BillRecord.objects.values_list('call_id', flat=True)), [1])
+
+    def test_does_not_touch_billed_calls(self):
+        old_record = BillRecord.objects.create(call_id=1, price=Decimal('1'))
+
+        created = BillRecord.objects.create_for_calls([1, 2])
+
+        self.assertEquals(created, 1)
+        old_record.refresh_from_db()
+        self.assertEquals(old_record.price, Decimal('1'))
+
+
+class BillingTaskTestCase(TestCase):
+
+    def setUp(self):
+        self.end = timezone.now()
+        self.start = self.end - timedelta(minutes=5)
+
+        for id in (1, 2, 3):
+            Call.objects.create(id=id, source='00123456789',
+                                destination='10123456789',
+                                started_at=self.start, ended_at=self.end,
+                                duration=self.end - self.start)
+
+    def test_enqueue_completed_calls(self):
+        Call.objects.filter(id=3).update(ended_at=None, duration=None)
+
+        enqueued = BillingTask.objects.enqueue([1, 2, 3])
+
+        self.assertEquals(enqueued, 2)
+        self.assertEquals(
+            sorted(BillingTask.objects.values_list('call_id', flat=True)),
+            [1, 2])
+
+    def test_enqueue_is_idempotent(self):
+        BillingTask.objects.enqueue([1])
+
+        self.assertEquals(BillingTask.objects.enqueue([1, 2]), 1)
+        self.assertEquals(BillingTask.objects.count(), 2)
+
+    def test_enqueue_skips_billed_calls(self):
+        BillRecord.objects.create(call_id=1, price=Decimal('1'))
+
+        BillingTask.objects.enqueue([1, 2])
+
+        self.assertEquals(BillingTask.objects.get().call_id, 2)
+
+    def test_enqueue_nothing(self):
+        self.assertEquals(BillingTask.objects.enqueue([]), 0)
+
+    def test_process(self):
+        BillingTask.objects.enqueue([1, 2, 3])
+        get_tariff_plans()
+
+        # Tariff plans are only reloaded if their version changed.
+        with self.assertNumQueries(8):
+            processed = BillingTask.objects.process(batch_size=2,
+                                                    max_attempts=5)
+
+        self.assertEquals(processed, 2)
+        self.assertEquals(BillRecord.objects.count(), 2)
+        self.assertEquals(BillingTask.objects.get().call_id, 3)
+
+    def test_process_empty_queue(self):
+        self.assertEquals(
+            BillingTask.objects.process(batch_size=2, max_attempts=5), 0)
+
+    def test_process_already_billed_calls(self):
+        BillingTask.objects.enqueue([1])
+        BillRecord.objects.create(call_id=1, price=Decimal('1'))
+
+        BillingTask.objects.process(batch_size=2, max_attempts=5)
+
+        self.assertEquals(BillingTask.objects.count(), 0)
+        self.assertEquals(BillRecord.objects.get().price, Decimal('1'))
+
+    def test_process_requeues_failed_calls(self):
+        BillingTask.objects.enqueue([1, 2])
+        create_for_calls = BillRecord.objects.create_for_calls
+
+        def fail_for_call_2(call_ids):
+            if 2 in call_ids:
+                raise ValueError('No tariff is applicable.')
+            return create_for_calls(call_ids)
+
+        with patch.object(BillRecord.objects, 'create_for_calls',
+                          side_effect=fail_for_call_2):
+            BillingTask.objects.process(batch_size=2, max_attempts=5)
+
+        self.assertEquals(BillRecord.objects.get().call_id, 1)
+        task = BillingTask.objects.get()
+        self.assertEquals(task.call_id, 2)
+        self.assertEquals(task.attempts, 1)
+
+    def test_process_skips_exhausted_calls(self):
+        BillingTask.objects.create(call_id=1, attempts=5)
+
+        self.assertEquals(
+            BillingTask.objects.process(batch_size=2, max_attempts=5), 0)
+        self.assertEquals(BillRecord.objects.count(), 0)
+
+    def test_get_depth(self):
+        BillingTask.objects.enqueue([1, 2])
+        BillingTask.objects.create(call_id=3, attempts=5)
+
+        depth = BillingTask.objects.get_depth(max_attempts=5)
+
+        self.assertEquals(depth['pending'], 2)
+        self.assertEquals(depth['failed'], 1)
+        self.assertIsNotNone(depth['oldest_enqueued_at'])
+
+
+class SyncCallsTestCase(TestCase):
+
+    def setUp(self):
+        self.end = datetime(2018, 2, 28, 23, 59, tzinfo=utc)
+        self.call = Call.objects.create(
+            id=1, source='00123456789', destination='10123456789',
+            started_at=self.end - timedelta(minutes=5), ended_at=self.end,
+            duration=timedelta(minutes=5))
+        BillRecord.objects.create_for_calls([1])
+
+    def test_bill_records_have_subscriber_and_period(self):
+        record = BillRecord.objects.get()
+
+        self.assertEquals(record.subscriber, '00123456789')
+        self.assertEquals(record.period, date(2018, 2, 1))
+
+    def test_sync_calls(self):
+        Call.objects.filter(id=1).update(
+            source='20123456789', ended_at=self.end + timedelta(minutes=2))
+
+        changed = BillRecord.objects.sync_calls([1])
+
+        self.assertEquals(changed, [('20123456789', date(2018, 3, 1))])
+        record = BillRecord.objects.get()
+        self.assertEquals(record.subscriber, '20123456789')
+        self.assertEquals(record.period, date(2018, 3, 1))
+
+    def test_sync_unchanged_calls(self):
+        self.assertEquals(BillRecord.objects.sync_calls([1]), [])
+        self.assertEquals(BillRecord.objects.sync_calls([]), [])
+
+    def test_changing_billed_calls(self):
+        with changing_billed_calls([1]):
+            Call.objects.filter(id=1).update(
+                ended_at=self.end + timedelta(minutes=2))
+
+        self.assertEquals(BillRecord.objects.get().period, date(2018, 3, 1))
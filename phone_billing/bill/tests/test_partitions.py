@@ -0,0 +1,152 @@
+from datetime import date, datetime, timedelta
+from io import StringIO
+
+from django.core.management import call_command
+from django.db import IntegrityError, connection, transaction
+from django.test import TestCase
+from django.utils import timezone
+from django.utils.timezone import utc
+
+from ...call.models import Call
+
+from ..models import BillingTask, BillRecord
+from ..partitions import (PartitionMaintenance, get_partition_name,
+                          get_partitions)
+from ..periods import add_months, get_period_start
+from ..reconciliation import BillingReconciliation
+from ..serializers import BillSerializer
+
+
+class PartitionMaintenanceTestCase(TestCase):
+
+    def setUp(self):
+        self.current_period = get_period_start(timezone.localdate())
+        self.create_billed_call(1, datetime(2018, 2, 10, tzinfo=utc))
+        self.create_billed_call(2, datetime(2018, 3, 10, tzinfo=utc))
+
+    def create_billed_call(self, id, ended_at):
+        Call.objects.create(id=id, source='00123456789',
+                            destination='10123456789',
+                            started_at=ended_at - timedelta(minutes=5),
+                            ended_at=ended_at, duration=timedelta(minutes=5))
+        BillRecord.objects.create_for_calls([id])
+
+    def get_billed_calls(self):
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT call_id FROM bill_billedcall'
+                           ' ORDER BY call_id')
+            return [call_id for call_id, in cursor.fetchall()]
+
+    def get_partition(self, call_id):
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT tableoid::regclass::text'
+                           ' FROM bill_billrecord WHERE call_id = %s',
+                           [call_id])
+            return cursor.fetchone()[0]
+
+    def test_creates_partitions(self):
+        created, expired = PartitionMaintenance(months_ahead=1).run()
+
+        self.assertEquals(created, [
+            date(2018, 2, 1), date(2018, 3, 1), self.current_period,
+            add_months(self.current_period, 1),
+        ])
+        self.assertEquals(expired, [])
+        self.assertEquals(get_partitions(), created)
+
+    def test_moves_rows_out_of_default_partition(self):
+        self.assertEquals(self.get_partition(1), 'bill_billrecord_default')
+
+        PartitionMaintenance(months_ahead=0).run()
+
+        self.assertEquals(self.get_partition(1), 'bill_billrecord_p2018_02')
+        self.assertEquals(self.get_partition(2), 'bill_billrecord_p2018_03')
+        self.assertEquals(BillRecord.objects.count(), 2)
+
+    def test_moving_rows_keeps_calls_billed(self):
+        PartitionMaintenance(months_ahead=0).run()
+
+        self.assertEquals(self.get_billed_calls(), [1, 2])
+
+    def test_call_is_billed_once(self):
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            BillRecord.objects.create(
+                call_id=1, subscriber='00123456789',
+                period=date(2018, 3, 1), price=0)
+
+        self.assertEquals(BillRecord.objects.filter(call_id=1).count(), 1)
+
+    def test_deleted_bill_record_unbills_the_call(self):
+        BillRecord.objects.get(call_id=1).delete()
+
+        self.assertEquals(self.get_billed_calls(), [2])
+
+    def test_is_idempotent(self):
+        PartitionMaintenance(months_ahead=0).run()
+
+        self.assertEquals(PartitionMaintenance(months_ahead=0).run(),
+                          ([], []))
+
+    def test_detaches_expired_partitions(self):
+        PartitionMaintenance(months_ahead=0).run()
+
+        retention = (self.current_period.year - 2018) * 12 + (
+            self.current_period.month - 3)
+        _, expired = PartitionMaintenance(
+            months_ahead=0, retention_months=retention).run()
+
+        self.assertEquals(expired, [date(2018, 2, 1)])
+        self.assertEquals(
+            list(BillRecord.objects.values_list('call_id', flat=True)), [2])
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT COUNT(*) FROM bill_billrecord_p2018_02')
+            self.assertEquals(cursor.fetchone()[0], 1)
+
+    def test_drops_expired_partitions(self):
+        PartitionMaintenance(months_ahead=0).run()
+
+        PartitionMaintenance(months_ahead=0, retention_months=0,
+                             drop=True).run()
+
+        self.assertNotIn(get_partition_name(date(2018, 2, 1)),
+                         connection.introspection.table_names())
+        self.assertEquals(self.get_billed_calls(), [1, 2])
+
+    def test_expired_calls_are_not_billed_again(self):
+        PartitionMaintenance(months_ahead=0).run()
+        retention = (self.current_period.year - 2018) * 12 + (
+            self.current_period.month - 3)
+        PartitionMaintenance(months_ahead=0, retention_months=retention).run()
+        PartitionMaintenance(months_ahead=0, retention_months=0,
+                             drop=True).run()
+
+        self.assertEquals(BillingReconciliation().run(), (0, 0))
+        self.assertEquals(BillingTask.objects.enqueue([1, 2]), 0)
+        self.assertEquals(BillRecord.objects.count(), 0)
+
+    def test_bill_search(self):
+        PartitionMaintenance(months_ahead=0).run()
+
+        serializer = BillSerializer(data={'subscriber': '00123456789',
+                                          'period': '02/2018'})
+        self.assertTrue(serializer.is_valid())
+
+        records = serializer.filter_bill_records()
+        self.assertEquals([record.call_id for record in records], [1])
+
+    def test_moving_calls_between_partitions(self):
+        PartitionMaintenance(months_ahead=0).run()
+        Call.objects.filter(id=1).update(
+            ended_at=datetime(2018, 3, 1, 0, 1, tzinfo=utc))
+
+        BillRecord.objects.sync_calls([1])
+
+        self.assertEquals(self.get_partition(1), 'bill_billrecord_p2018_03')
+        self.assertEquals(self.get_billed_calls(), [1, 2])
+
+    def test_command(self):
+        stdout = StringIO()
+
+        call_command('ensure_partitions', months_ahead=0, stdout=stdout)
+
+        self.assertIn('Created bill_billrecord_p2018_02.', stdout.getvalue())
@@ -1,11 +1,23 @@
+import random
 from datetime import time, datetime, timedelta
 from decimal import Decimal
 from unittest.mock import patch, Mock
 
+import numpy as np
+from django.core.exceptions import ValidationError
+from django.db import transaction
 from django.test import TestCase
+from django.utils import timezone
+from django.utils.timezone import utc
 
+from ...call.models import Call
+
+from ..models import BillRecord, Tariff, TariffPlan
 from ..pricing import (BaseTariff, StandardTariff, ReducedTariff,
-                       get_tariff, calculate_call_charge)
+                       get_tariff, get_tariff_plan, get_tariff_plans,
+                       clear_tariff_plans_cache, calculate_call_charge,
+                       calculate_call_charges, to_centavos, from_centavos,
+                       CompiledTariffPlan, DEFAULT_TARIFF_PLAN)
 
 
 class BaseTariffTestCase(TestCase):
@@ -93,33 +105,164 @@ class ReducedTariffTestCase(TestCase):
         self.assertEquals(ReducedTariff.end_time, time(6))
 
 
+def create_tariff_plan(effective_from, charge_per_minute='0.09'):
+    plan = TariffPlan.objects.create(effective_from=effective_from)
+    plan.tariffs.create(name='Day', precedence=0, start_time=time(6),
+                        end_time=time(22), standing_charge=Decimal('0.36'),
+                        charge_per_minute=Decimal(charge_per_minute))
+    plan.tariffs.create(name='Night', precedence=1, start_time=time(22),
+                        end_time=time(6), standing_charge=Decimal('0.36'),
+                        charge_per_minute=Decimal('0.00'))
+    return plan
+
+
+class CompiledTariffPlanTestCase(TestCase):
+    def test_minute_table(self):
+        plan = CompiledTariffPlan(None, None, (StandardTariff, ReducedTariff))
+
+        self.assertEquals(plan.minute_table[6 * 60 - 1], 1)
+        self.assertEquals(plan.minute_table[6 * 60], 0)
+        self.assertEquals(plan.minute_table[22 * 60 - 1], 0)
+        self.assertEquals(plan.minute_table[22 * 60], 1)
+
+    def test_first_applicable_tariff_wins(self):
+        class AllDayTariff(BaseTariff):
+            charge_per_minute = Decimal('0.01')
+            start_time = time(0)
+            end_time = time(0)
+
+        plan = CompiledTariffPlan(None, None, (ReducedTariff, AllDayTariff))
+
+        self.assertEquals(plan.get_tariff(datetime(2018, 1, 1, 23)),
+                          ReducedTariff)
+        self.assertEquals(plan.get_tariff(datetime(2018, 1, 1, 12)),
+                          AllDayTariff)
+
+    def test_no_applicable_tariff(self):
+        plan = CompiledTariffPlan(None, None, (StandardTariff,))
+
+        self.assertIsNone(plan.get_tariff(datetime(2018, 1, 1, 23)))
+
+
+class TariffPlanLockTestCase(TestCase):
+    def setUp(self):
+        self.addCleanup(clear_tariff_plans_cache)
+
+    def test_plan_created_ahead_is_locked_once_in_effect(self):
+        plan = create_tariff_plan(timezone.now() + timedelta(days=1))
+        self.assertFalse(plan.is_locked())
+
+        TariffPlan.objects.filter(id=plan.id).update(
+            created_at=timezone.now() - timedelta(days=2),
+            effective_from=timezone.now() - timedelta(seconds=1))
+
+        self.assertTrue(plan.is_locked())
+        tariff = plan.tariffs.get(name='Day')
+        tariff.charge_per_minute = Decimal('0.20')
+        with self.assertRaises(ValidationError):
+            tariff.save()
+        with self.assertRaises(ValidationError):
+            plan.tariffs.create(name='Flat', start_time=time(0),
+                                end_time=time(0), standing_charge=0,
+                                charge_per_minute=0)
+        with self.assertRaises(ValidationError):
+            plan.delete()
+
+    def test_plan_used_by_bill_records_is_locked(self):
+        plan = create_tariff_plan(datetime(2018, 3, 1, tzinfo=utc))
+        self.assertFalse(plan.is_locked())
+
+        call = Call.objects.create(id=1, source='00123456789',
+                                   destination='10123456789')
+        BillRecord.objects.create(call=call, price=Decimal('0.36'),
+                                  tariff_plan=plan)
+
+        self.assertTrue(plan.is_locked())
+        with self.assertRaises(ValidationError):
+            plan.tariffs.get(name='Night').delete()
+
+    def test_tariffs_start_and_end_on_whole_minutes(self):
+        plan = TariffPlan.objects.create(
+            effective_from=timezone.now() + timedelta(days=1))
+
+        with self.assertRaises(ValidationError) as context:
+            plan.tariffs.create(name='Day', start_time=time(6, 0, 30),
+                                end_time=time(22), standing_charge=0,
+                                charge_per_minute=0)
+
+        self.assertEquals(list(context.exception.message_dict),
+                          ['start_time'])
+
+
 class GetTariffTestCase(TestCase):
-    @patch.object(ReducedTariff, 'is_applicable')
-    @patch.object(StandardTariff, 'is_applicable')
-    def test_standard_tariff_if_applicable(self, standard_applicable,
-                                           reduced_applicable):
-        standard_applicable.return_value = True
-        reduced_applicable.return_value = False
+    def setUp(self):
+        self.addCleanup(clear_tariff_plans_cache)
+
+    def test_standard_tariff_by_day(self):
+        Tariff = get_tariff(datetime(2018, 1, 1, 12, tzinfo=utc))
+
+        self.assertEquals(Tariff.__name__, 'StandardTariff')
+        self.assertEquals(Tariff.charge_per_minute, Decimal('0.09'))
+
+    def test_reduced_tariff_by_night(self):
+        Tariff = get_tariff(datetime(2018, 1, 1, 23, tzinfo=utc))
+
+        self.assertEquals(Tariff.__name__, 'ReducedTariff')
+        self.assertEquals(Tariff.charge_per_minute, Decimal('0.00'))
+
+    def test_uses_plan_in_effect_at_call_end(self):
+        plan = create_tariff_plan(datetime(2018, 3, 1, tzinfo=utc), '0.10')
+
+        before = datetime(2018, 2, 28, 23, 59, 59, tzinfo=utc)
+        after = datetime(2018, 3, 1, 12, tzinfo=utc)
 
-        self.assertEquals(get_tariff(datetime.now()), StandardTariff)
+        self.assertNotEquals(get_tariff_plan(before).id, plan.id)
+        self.assertEquals(get_tariff_plan(after).id, plan.id)
+        self.assertEquals(get_tariff(after).charge_per_minute,
+                          Decimal('0.10'))
 
-    @patch.object(ReducedTariff, 'is_applicable')
-    @patch.object(StandardTariff, 'is_applicable')
-    def test_standard_tariff_if_both_applicable(self, standard_applicable,
-                                                reduced_applicable):
-        standard_applicable.return_value = True
-        reduced_applicable.return_value = True
+    def test_default_plan_without_plans(self):
+        TariffPlan.objects.all().delete()
 
-        self.assertEquals(get_tariff(datetime.now()), StandardTariff)
+        call_dt = datetime(2018, 1, 1, 12, tzinfo=utc)
+        self.assertIs(get_tariff_plan(call_dt), DEFAULT_TARIFF_PLAN)
+        self.assertEquals(get_tariff(call_dt), StandardTariff)
 
-    @patch.object(ReducedTariff, 'is_applicable')
-    @patch.object(StandardTariff, 'is_applicable')
-    def test_reduced_tariff_if_applicable(self, standard_applicable,
-                                          reduced_applicable):
-        standard_applicable.return_value = False
-        reduced_applicable.return_value = True
+    def test_plans_are_cached(self):
+        plans = get_tariff_plans()
 
-        self.assertEquals(get_tariff(datetime.now()), ReducedTariff)
+        with self.assertNumQueries(1):
+            self.assertIs(get_tariff_plans(), plans)
+
+    # Rows keep the transaction id that wrote them, so the change is made in
+    # a savepoint, as another process would, without clearing the cache.
+    def test_plans_changed_by_other_processes_are_reloaded(self):
+        plan = create_tariff_plan(datetime(2018, 3, 1, tzinfo=utc))
+        get_tariff_plans()
+
+        with transaction.atomic():
+            Tariff.objects.filter(plan=plan, name='Day').update(
+                charge_per_minute=Decimal('0.20'))
+
+        self.assertEquals(
+            get_tariff(datetime(2018, 3, 1, 12, tzinfo=utc)).charge_per_minute,
+            Decimal('0.20'))
+
+    def test_cache_is_cleared_on_change(self):
+        get_tariff_plans()
+
+        plan = create_tariff_plan(datetime(2018, 3, 1, tzinfo=utc))
+        call_dt = datetime(2018, 3, 1, 12, tzinfo=utc)
+        self.assertEquals(get_tariff_plan(call_dt).id, plan.id)
+
+        tariff = plan.tariffs.get(name='Day')
+        tariff.charge_per_minute = Decimal('0.20')
+        tariff.save()
+        self.assertEquals(get_tariff(call_dt).charge_per_minute,
+                          Decimal('0.20'))
+
+        plan.delete()
+        self.assertNotEquals(get_tariff_plan(call_dt).id, plan.id)
 
 
 class CalculateCallChargeTestCase(TestCase):
@@ -135,3 +278,104 @@ class CalculateCallChargeTestCase(TestCase):
 
         mocked_get_tariff.assert_called_once_with(call_end)
         MockedTariff.calculate.assert_called_once_with(call_end - call_start)
+
+
+class CalculateCallChargesTestCase(TestCase):
+    # Sample calls from the specification with their expected prices.
+    SAMPLE_CALLS = (
+        ('2017-12-12 15:07:13', '2017-12-12 15:14:56', '0.99'),
+        ('2017-12-12 22:47:56', '2017-12-12 22:50:56', '0.36'),
+        ('2017-12-12 21:57:13', '2017-12-12 22:10:56', '0.36'),
+        ('2017-12-12 04:57:13', '2017-12-12 06:10:56', '6.93'),
+        ('2017-12-12 21:57:13', '2017-12-13 22:10:56', '0.36'),
+        ('2017-12-12 15:07:58', '2017-12-12 15:12:56', '0.72'),
+    )
+
+    def to_datetime(self, value):
+        return datetime.strptime(value, '%Y-%m-%d %H:%M:%S').replace(
+            tzinfo=utc)
+
+    def test_sample_calls(self):
+        starts = [self.to_datetime(start).timestamp()
+                  for start, _, _ in self.SAMPLE_CALLS]
+        ends = [self.to_datetime(end).timestamp()
+                for _, end, _ in self.SAMPLE_CALLS]
+
+        prices = calculate_call_charges(starts, ends)
+
+        self.assertEquals(
+            [from_centavos(price) for price in prices],
+            [Decimal(price) for _, _, price in self.SAMPLE_CALLS])
+
+    def test_empty_arrays(self):
+        self.assertEquals(len(calculate_call_charges([], [])), 0)
+
+    def test_no_applicable_tariff(self):
+        self.addCleanup(clear_tariff_plans_cache)
+        plan = create_tariff_plan(datetime(1971, 1, 1, tzinfo=utc))
+        plan.tariffs.filter(name='Day').update(end_time=time(21))
+        clear_tariff_plans_cache()
+
+        call_end = datetime(1971, 1, 1, 21, 30, tzinfo=utc).timestamp()
+        with self.assertRaises(ValueError):
+            calculate_call_charges([call_end - 60], [call_end])
+
+    def test_uses_plan_in_effect_at_call_end(self):
+        self.addCleanup(clear_tariff_plans_cache)
+        create_tariff_plan(datetime(2018, 3, 1, tzinfo=utc), '0.10')
+
+        ends = [datetime(2018, 2, 28, 12, tzinfo=utc).timestamp(),
+                datetime(2018, 3, 1, 12, tzinfo=utc).timestamp()]
+        prices = calculate_call_charges([end - 600 for end in ends], ends)
+
+        self.assertEquals(prices.tolist(), [126, 136])
+
+    def test_matches_calculate_call_charge(self):
+        generator = random.Random(75)
+        epoch = datetime(2017, 12, 1, tzinfo=utc)
+        boundaries = [hours * 3600 * 10 ** 6 for hours in (0, 6, 22, 24)]
+
+        starts, ends = [], []
+        for _ in range(5000):
+            end = generator.randrange(30 * 86400 * 10 ** 6)
+            if generator.random() < 0.3:
+                # Calls ending around the tariff boundaries.
+                day = end - end % (86400 * 10 ** 6)
+                end = (day + generator.choice(boundaries)
+                       + generator.randint(-10 ** 6, 10 ** 6))
+            duration = generator.choice([
+                generator.randrange(120 * 10 ** 6),
+                generator.randrange(3 * 3600 * 10 ** 6),
+                generator.randrange(3 * 86400 * 10 ** 6),
+            ])
+            starts.append(end - duration)
+            ends.append(end)
+
+        def to_datetime(value):
+            return epoch + timedelta(microseconds=value)
+
+        expected = [
+            to_centavos(calculate_call_charge(to_datetime(start),
+                                              to_datetime(end)))
+            for start, end in zip(starts, ends)
+        ]
+
+        prices = calculate_call_charges(
+            [to_datetime(start).timestamp() for start in starts],
+            [to_datetime(end).timestamp() for end in ends])
+
+        self.assertEquals(prices.tolist(), expected)
+
+
+class CentavosTestCase(TestCase):
+    def test_to_centavos(self):
+        self.assertEquals(to_centavos(Decimal('0.36')), 36)
+        self.assertEquals(to_centavos(Decimal('1')), 100)
+
+    def test_to_centavos_requires_centavo_precision(self):
+        with self.assertRaises(ValueError):
+            to_centavos(Decimal('0.005'))
+
+    def test_from_centavos(self):
+        self.assertEquals(from_centavos(np.int64(693)), Decimal('6.93'))
+        self.assertEquals(str(from_centavos(0)), '0.00')
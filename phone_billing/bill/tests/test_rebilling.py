@@ -0,0 +1,133 @@
+import json
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+from io import StringIO
+from unittest.mock import patch
+
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.test import TestCase
+from django.utils.timezone import utc
+
+from ...call.models import Call
+
+from ..cache import (cache_bill, get_bill_cache, get_bill_version,
+                     get_cached_bill)
+from ..models import BillRecord, BillRecordRevision, MonthlyBill
+from ..pricing import get_tariff_plan
+from ..rebilling import PeriodRebill
+
+
+class PeriodRebillTestCase(TestCase):
+    def setUp(self):
+        get_bill_cache().clear()
+        self.addCleanup(get_bill_cache().clear)
+
+        self.period = date(2018, 2, 1)
+        # Priced 0.63, 0.36 and 0.45 by the default tariffs.
+        self.create_call(1, datetime(2018, 2, 1, 12), minutes=3, price='9.99')
+        self.create_call(2, datetime(2018, 2, 10, 23), minutes=3,
+                         price='0.36')
+        self.create_call(3, datetime(2018, 2, 20, 12), minutes=1,
+                         price='0.00')
+        self.create_call(4, datetime(2018, 3, 1, 12), minutes=3,
+                         price='9.99')
+
+    def create_call(self, id, ended_at, minutes, price):
+        ended_at = ended_at.replace(tzinfo=utc)
+        call = Call.objects.create(
+            id=id, source='00123456789', destination='10123456789',
+            started_at=ended_at - timedelta(minutes=minutes),
+            ended_at=ended_at, duration=timedelta(minutes=minutes))
+        BillRecord.objects.create(
+            call=call, price=Decimal(price),
+            tariff_plan_id=get_tariff_plan(ended_at).id)
+
+    def get_prices(self):
+        return dict(BillRecord.objects.values_list('call_id', 'price'))
+
+    @patch('phone_billing.bill.cache.transaction.on_commit',
+           lambda function: function())
+    def test_rebill(self):
+        cache_bill('00123456789', self.period,
+                   get_bill_version('00123456789', self.period),
+                   {'cached': True})
+
+        result = PeriodRebill(self.period, batch_size=2, reason='Fix').run()
+
+        self.assertEquals(result, (3, 2, 0))
+        self.assertEquals(self.get_prices(), {
+            1: Decimal('0.63'), 2: Decimal('0.36'), 3: Decimal('0.45'),
+            4: Decimal('9.99'),
+        })
+        self.assertEquals(
+            list(BillRecordRevision.objects.order_by('call_id').values_list(
+                'call_id', 'period', 'old_price', 'new_price', 'reason')), [
+                (1, self.period, Decimal('9.99'), Decimal('0.63'), 'Fix'),
+                (3, self.period, Decimal('0.00'), Decimal('0.45'), 'Fix'),
+            ])
+        self.assertIsNone(get_cached_bill(
+            '00123456789', self.period,
+            get_bill_version('00123456789', self.period)))
+
+        self.assertEquals(PeriodRebill(self.period).run(), (3, 0, 0))
+        self.assertEquals(BillRecordRevision.objects.count(), 2)
+
+    def test_dry_run(self):
+        stdout = StringIO()
+
+        result = PeriodRebill(self.period, dry_run=True, stdout=stdout).run()
+
+        self.assertEquals(result, (3, 2, 0))
+        self.assertEquals(self.get_prices()[1], Decimal('9.99'))
+        self.assertFalse(BillRecordRevision.objects.exists())
+        output = stdout.getvalue()
+        self.assertIn('Call 1: 9.99 -> 0.63', output)
+        self.assertIn('Would rebill 2 of 3 bill records for 02/2018', output)
+
+    @patch('phone_billing.bill.cache.transaction.on_commit',
+           lambda function: function())
+    def test_closed_period(self):
+        closed_at = datetime(2018, 3, 1, tzinfo=utc)
+        for subscriber in ('00123456789', '00987654321'):
+            MonthlyBill.objects.create(
+                subscriber=subscriber, period=self.period, call_count=3,
+                total_duration=timedelta(minutes=7),
+                total_price=Decimal('10.35'), payload='{}',
+                closed_at=closed_at)
+        cache_bill('00123456789', self.period,
+                   get_bill_version('00123456789', self.period),
+                   {'cached': True})
+        stdout = StringIO()
+
+        result = PeriodRebill(self.period, batch_size=2, stdout=stdout).run()
+
+        self.assertEquals(result, (3, 2, 2))
+        bill = MonthlyBill.objects.get(subscriber='00123456789',
+                                       period=self.period)
+        self.assertEquals(bill.total_price, Decimal('1.44'))
+        records = json.loads(bill.payload)['bill_records']
+        self.assertEquals(records[0]['call_price'], '0.63')
+        self.assertGreater(bill.closed_at, closed_at)
+        self.assertEquals(MonthlyBill.objects.get(
+            subscriber='00987654321', period=self.period).payload, '{}')
+        self.assertIsNone(get_cached_bill(
+            '00123456789', self.period,
+            get_bill_version('00123456789', self.period)))
+        self.assertIn('Rebuilt 2 monthly bills', stdout.getvalue())
+
+    def test_empty_period(self):
+        self.assertEquals(PeriodRebill(date(2018, 1, 1)).run(), (0, 0, 0))
+
+    def test_command(self):
+        stdout = StringIO()
+
+        call_command('rebill', '--period', '03/2018', '--workers', '1',
+                     '--reason', 'Fix', stdout=stdout)
+
+        self.assertIn('Rebilled 1 of 1 bill records for 03/2018',
+                      stdout.getvalue())
+        self.assertEquals(self.get_prices()[4], Decimal('0.63'))
+
+        with self.assertRaises(CommandError):
+            call_command('rebill', '--period', '2018-03')
@@ -5,7 +5,7 @@ from django.utils import timezone
 
 from ...call.models import Call, CallRecord
 
-from ..models import BillRecord
+from ..models import BillingTask
 from ..receivers import bill_call_record
 
 
@@ -22,26 +22,26 @@ class BillCallRecordReceiverTestCase(TestCase):
                                                     timestamp=now,
                                                     record_type='end')
 
-    @patch.object(BillRecord.objects, 'create_for_call')
+    @patch.object(BillingTask.objects, 'enqueue')
     def test_bill_call_record_receiver_with_created_end_record(self, mocked_manager):
         bill_call_record(instance=self.call.end_record)
 
-        mocked_manager.assert_called_once_with(self.call)
+        mocked_manager.assert_called_once_with([self.call.id])
 
-    @patch.object(BillRecord.objects, 'create_for_call')
+    @patch.object(BillingTask.objects, 'enqueue')
     def test_bill_call_record_receiver_with_created_start_record(self, mocked_manager):
         bill_call_record(instance=self.call.start_record)
 
-        mocked_manager.assert_called_once_with(self.call)
+        mocked_manager.assert_called_once_with([self.call.id])
 
-    @patch.object(BillRecord.objects, 'create_for_call')
+    @patch.object(BillingTask.objects, 'enqueue')
     def test_bill_call_record_receiver_with_no_end_record(self, mocked_manager):
         self.end_record.delete()
         bill_call_record(instance=self.call.start_record)
 
         mocked_manager.assert_not_called()
 
-    @patch.object(BillRecord.objects, 'create_for_call')
+    @patch.object(BillingTask.objects, 'enqueue')
     def test_bill_call_record_receiver_with_no_start_record(self, mocked_manager):
         self.start_record.delete()
         bill_call_record(instance=self.call.end_record)
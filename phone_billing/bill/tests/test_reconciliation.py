@@ -0,0 +1,73 @@
+from datetime import timedelta
+from decimal import Decimal
+from io import StringIO
+from unittest.mock import patch
+
+from django.core.management import call_command
+from django.test import TestCase
+from django.utils import timezone
+
+from ...call.models import Call
+from ...parallel import get_id_ranges
+
+from ..models import BillingTask, BillRecord
+from ..reconciliation import BillingReconciliation
+
+
+class BillingReconciliationTestCase(TestCase):
+
+    def setUp(self):
+        end = (timezone.now() - timedelta(days=1)).replace(hour=12)
+        start = end - timedelta(minutes=5)
+
+        for id in range(1, 8):
+            Call.objects.create(id=id, source='00123456789',
+                                destination='10123456789',
+                                started_at=start, ended_at=end,
+                                duration=end - start)
+        # Unfinished and already billed calls are left alone.
+        Call.objects.create(id=8, source='00123456789',
+                            destination='10123456789', started_at=start)
+        BillRecord.objects.create_for_calls([7])
+
+    def test_bills_unbilled_calls(self):
+        billed, failed = BillingReconciliation(chunk_size=2).run()
+
+        self.assertEquals((billed, failed), (6, 0))
+        self.assertEquals(
+            sorted(BillRecord.objects.values_list('call_id', flat=True)),
+            list(range(1, 8)))
+        self.assertEquals(BillRecord.objects.get(call_id=1).price,
+                          Decimal('0.81'))
+
+        self.assertEquals(BillingReconciliation().run(), (0, 0))
+
+    def test_queues_failing_calls(self):
+        original = BillRecord.objects.create_for_call_rows
+
+        def create_for_call_rows(calls):
+            if any(call[0] == 3 for call in calls):
+                raise ValueError('No tariff is applicable.')
+            return original(calls)
+
+        with patch.object(BillRecord.objects, 'create_for_call_rows',
+                          side_effect=create_for_call_rows):
+            billed, failed = BillingReconciliation(chunk_size=4).run()
+
+        self.assertEquals((billed, failed), (5, 1))
+        self.assertFalse(BillRecord.objects.filter(call_id=3).exists())
+        self.assertEquals(
+            list(BillingTask.objects.values_list('call_id', flat=True)), [3])
+
+    def test_get_id_ranges(self):
+        self.assertEquals(get_id_ranges(1, 10, 3),
+                          [(0, 4), (4, 8), (8, 10)])
+        self.assertEquals(get_id_ranges(1, 2, 4), [(0, 1), (1, 2)])
+
+    def test_command(self):
+        stdout = StringIO()
+
+        call_command('reconcile_billing', '--workers', '1', stdout=stdout)
+
+        self.assertIn('Billed 6 unbilled calls', stdout.getvalue())
+        self.assertEquals(BillRecord.objects.count(), 7)
@@ -2,13 +2,16 @@ from datetime import timedelta
 from decimal import Decimal
 from unittest.mock import patch
 
+from django.db import connection
 from django.test import TestCase
 from django.utils import timezone
+from rest_framework.renderers import JSONRenderer
 
 from ...call.models import Call, CallRecord
 
-from ..models import BillRecord
-from ..serializers import BillRecordSerializer, BillSerializer, PhoneField
+from ..models import BillingTask, BillRecord
+from ..serializers import (BillRecordSerializer, BillRecordValuesSerializer,
+                           BillSerializer, PhoneField)
 
 
 class BillRecordSerializerTestCase(TestCase):
@@ -24,6 +27,7 @@ class BillRecordSerializerTestCase(TestCase):
                                   timestamp=start, call=call)
         CallRecord.objects.create(id=2, record_type='end',
                                   timestamp=end, call=call)
+        BillingTask.objects.process(batch_size=10, max_attempts=1)
 
         self.record = BillRecord.objects.get(call=call)
 
@@ -51,6 +55,45 @@ class BillRecordSerializerTestCase(TestCase):
         self.assertIsInstance(serializer.fields['destination'], PhoneField)
 
 
+class BillRecordValuesSerializerTestCase(TestCase):
+    def setUp(self):
+        end = timezone.now()
+        calls = [
+            Call(id=1, source='00123456789', destination='10123456789',
+                 started_at=end - timedelta(hours=26, seconds=3),
+                 ended_at=end, duration=timedelta(hours=26, seconds=3)),
+            Call(id=2, source='00123456789', destination='1012345678',
+                 started_at=end, ended_at=end, duration=timedelta()),
+            Call(id=3, source='00123456789', destination='10123456789'),
+        ]
+        for call, price in zip(calls, ('0.36', '12345678.90', '0.00')):
+            call.save()
+            BillRecord.objects.create(call=call, price=Decimal(price))
+
+    def assertMatchesBillRecordSerializer(self):
+        queryset = BillRecord.objects.select_related('call').order_by('id')
+        data = BillRecordSerializer(list(queryset), many=True).data
+
+        serializer = BillRecordValuesSerializer()
+        rows = [serializer.to_representation(row)
+                for row in serializer.get_queryset(queryset)]
+
+        self.assertEquals(JSONRenderer().render(rows),
+                          JSONRenderer().render(data))
+        # Querysets are serialized from their values() by default.
+        self.assertEquals(
+            JSONRenderer().render(BillRecordSerializer(queryset,
+                                                       many=True).data),
+            JSONRenderer().render(data))
+
+    def test_matches_bill_record_serializer(self):
+        self.assertMatchesBillRecordSerializer()
+
+    def test_matches_bill_record_serializer_in_local_time(self):
+        with timezone.override('America/Sao_Paulo'):
+            self.assertMatchesBillRecordSerializer()
+
+
 class BillSerializerTestCase(TestCase):
     def setUp(self):
         self.now = timezone.now()
@@ -107,60 +150,60 @@ class BillSerializerTestCase(TestCase):
         self.assertEquals(serializer.validated_data['period'],
                           self.last_month.date())
 
-    def test_filter_calls_by_subscriber(self):
+    def test_filter_bill_records(self):
         serializer = BillSerializer(data={'subscriber': self.subscriber})
-
         self.assertTrue(serializer.is_valid())
 
-        calls = serializer.filter_calls_by_subscriber()
-
-        call_ids = calls.values_list('id', flat=True)
-        self.assertIn(1, call_ids)
-        self.assertIn(1, call_ids)
-        self.assertNotIn(3, call_ids)
-
-    def test_filter_calls_by_period_default(self):
-        serializer = BillSerializer(data={'subscriber': self.subscriber})
-
-        self.assertTrue(serializer.is_valid())
-
-        calls = serializer.filter_calls_by_period(Call.objects.all())
+        records = serializer.filter_bill_records()
 
-        call_ids = calls.values_list('id', flat=True)
-        self.assertNotIn(1, call_ids)
-        self.assertIn(2, call_ids)
-        self.assertNotIn(3, call_ids)
+        self.assertEquals([record.call.id for record in records], [2])
 
-    def test_filter_calls_by_period(self):
+    def test_filter_bill_records_by_period(self):
         serializer = BillSerializer(data={
             'subscriber': self.subscriber, 'period': self.now.strftime('%m/%Y')
         })
-
         self.assertTrue(serializer.is_valid())
 
-        calls = serializer.filter_calls_by_period(Call.objects.all())
-
-        call_ids = calls.values_list('id', flat=True)
-        self.assertIn(1, call_ids)
-        self.assertNotIn(2, call_ids)
-        self.assertIn(3, call_ids)
+        records = serializer.filter_bill_records()
 
-    @patch.object(BillSerializer, 'filter_calls_by_subscriber')
-    @patch.object(BillSerializer, 'filter_calls_by_period')
-    def test_filter_bill_records(self, period_filter, subscriber_filter):
-        period_filter.return_value = Call.objects.filter(id=1)
+        self.assertEquals([record.call.id for record in records], [1])
 
+    def test_filter_bill_records_uses_period_index(self):
         serializer = BillSerializer(data={'subscriber': self.subscriber})
         self.assertTrue(serializer.is_valid())
+        sql, params = serializer.filter_bill_records().query.sql_with_params()
 
-        records = serializer.filter_bill_records()
+        with connection.cursor() as cursor:
+            # The test tables are too small for the planner to prefer them.
+            cursor.execute('SET LOCAL enable_seqscan = off')
+            cursor.execute(f'EXPLAIN {sql}', params)
+            plan = '\n'.join(row[0] for row in cursor.fetchall())
+
+        # Partitions name their copies of the index after its columns.
+        self.assertIn('subscriber_period', plan)
+        self.assertNotIn('Seq Scan on bill_billrecord', plan)
+
+    def test_search_query_count(self):
+        serializer = BillSerializer(data={'subscriber': self.subscriber})
+
+        with self.assertNumQueries(1):
+            self.assertTrue(serializer.is_valid())
+            serializer.search_bill_records()
+            self.assertEquals(len(serializer.data['bill_records']), 1)
 
-        record = records[0]
-        self.assertIsInstance(record, BillRecord)
-        self.assertEquals(record.call.id, 1)
+    def test_serialization_query_count_does_not_depend_on_calls(self):
+        for id in range(4, 10):
+            self.create_call_and_records(id, self.subscriber,
+                                         '10123456789', self.now)
+
+        serializer = BillSerializer(data={
+            'subscriber': self.subscriber, 'period': self.now.strftime('%m/%Y')
+        })
+        self.assertTrue(serializer.is_valid())
+        serializer.search_bill_records()
 
-        subscriber_filter.assert_called_once_with()
-        period_filter.assert_called_once_with(subscriber_filter.return_value)
+        with self.assertNumQueries(1):
+            self.assertEquals(len(serializer.data['bill_records']), 7)
 
     @patch.object(BillSerializer, 'filter_bill_records')
     def test_search_bill_records(self, mocked_filter):
@@ -1,8 +1,21 @@
 from unittest.mock import patch
 
+from datetime import date, timedelta
+
+from django.test import override_settings
 from django.urls import reverse
+from django.utils import timezone
 from rest_framework.test import APITestCase
 
+from ...call.models import Call
+from ...metrics import request_metrics
+
+from ..cache import get_bill_cache
+from ..models import BillRecord
+from ..receivers import changing_billed_calls
+
+from .utils import memory_bill_cache
+
 
 class BillSearchViewTestCase(APITestCase):
     def setUp(self):
@@ -13,6 +26,8 @@ class BillSearchViewTestCase(APITestCase):
     def test_success(self, MockedSerializer):
         mock_serializer = MockedSerializer.return_value
         mock_serializer.is_valid.return_value = True
+        mock_serializer.validated_data = {'subscriber': self.subscriber}
+        mock_serializer.get_period.return_value = timezone.localdate()
         mock_serializer.data = {'test': 'test'}
 
         response = self.client.get(self.url)
@@ -28,6 +43,8 @@ class BillSearchViewTestCase(APITestCase):
     def test_success_with_period_param(self, MockedSerializer):
         mock_serializer = MockedSerializer.return_value
         mock_serializer.is_valid.return_value = True
+        mock_serializer.validated_data = {'subscriber': self.subscriber}
+        mock_serializer.get_period.return_value = timezone.localdate()
         mock_serializer.data = {'test': 'test'}
 
         response = self.client.get(self.url, {'period': '04/2018'})
@@ -52,3 +69,178 @@ class BillSearchViewTestCase(APITestCase):
         MockedSerializer.assert_called_once_with(
             data={'subscriber': self.subscriber})
         mock_serializer.is_valid.assert_called_once_with()
+
+
+@override_settings(METRICS_DIR=None)
+class BillSearchViewCacheTestCase(APITestCase):
+    def setUp(self):
+        self.subscriber = '00123456789'
+        self.url = reverse('bill:search', args=[self.subscriber])
+        get_bill_cache().clear()
+        self.addCleanup(get_bill_cache().clear)
+        request_metrics.clear()
+        self.addCleanup(request_metrics.clear)
+
+    @patch('phone_billing.bill.views.BillSerializer')
+    def test_closed_period_is_cached(self, MockedSerializer):
+        mock_serializer = MockedSerializer.return_value
+        mock_serializer.is_valid.return_value = True
+        mock_serializer.validated_data = {'subscriber': self.subscriber}
+        mock_serializer.get_period.return_value = date(2018, 2, 1)
+        mock_serializer.data = {'test': 'test'}
+
+        self.client.get(self.url, {'period': '02/2018'})
+        response = self.client.get(self.url, {'period': '02/2018'})
+
+        self.assertEquals(response.data, {'test': 'test'})
+        mock_serializer.search_bill_records.assert_called_once_with()
+
+        response = self.client.get(reverse('bill:cache'))
+        self.assertEquals(response.data, {'hits': 1, 'misses': 1})
+
+    @patch('phone_billing.bill.views.BillSerializer')
+    def test_cached_bill_queries(self, MockedSerializer):
+        mock_serializer = MockedSerializer.return_value
+        mock_serializer.is_valid.return_value = True
+        mock_serializer.validated_data = {'subscriber': self.subscriber}
+        mock_serializer.get_period.return_value = date(2018, 2, 1)
+        mock_serializer.data = {'test': 'test'}
+        self.client.get(self.url, {'period': '02/2018'})
+
+        # The bill version and the cached bill, nothing is written.
+        with self.assertNumQueries(2):
+            response = self.client.get(self.url, {'period': '02/2018'})
+
+        self.assertEquals(response.data, {'test': 'test'})
+
+    @patch('phone_billing.bill.views.BillSerializer')
+    def test_open_period_is_not_cached(self, MockedSerializer):
+        mock_serializer = MockedSerializer.return_value
+        mock_serializer.is_valid.return_value = True
+        mock_serializer.validated_data = {'subscriber': self.subscriber}
+        mock_serializer.get_period.return_value = timezone.localdate()
+        mock_serializer.data = {'test': 'test'}
+
+        self.client.get(self.url)
+        self.client.get(self.url)
+
+        self.assertEquals(mock_serializer.search_bill_records.call_count, 2)
+
+
+@override_settings(STREAMING_RESPONSE_CHUNK_SIZE=2)
+class BillSearchViewStreamTestCase(APITestCase):
+    def setUp(self):
+        self.subscriber = '00123456789'
+        self.url = reverse('bill:search', args=[self.subscriber])
+        end = timezone.now().replace(microsecond=0)
+        for id in (1, 2, 3):
+            Call.objects.create(id=id, source=self.subscriber,
+                                destination='10123456789',
+                                started_at=end - timedelta(minutes=id),
+                                ended_at=end, duration=timedelta(minutes=id))
+        BillRecord.objects.create_for_calls([1, 2, 3])
+        self.period = timezone.localdate().strftime('%m/%Y')
+
+    def test_streamed_bill_matches_the_response(self):
+        response = self.client.get(self.url, {'period': self.period})
+        streamed = self.client.get(self.url, {'period': self.period,
+                                              'stream': 'true'})
+
+        self.assertEquals(streamed.status_code, 200)
+        self.assertTrue(streamed.streaming)
+        self.assertEquals(b''.join(streamed.streaming_content),
+                          response.content)
+
+    def test_streamed_empty_bill(self):
+        BillRecord.objects.all().delete()
+
+        response = self.client.get(self.url, {'period': self.period})
+        streamed = self.client.get(self.url, {'period': self.period,
+                                              'stream': '1'})
+
+        self.assertEquals(b''.join(streamed.streaming_content),
+                          response.content)
+
+
+# TestCase never commits, so invalidations run as soon as they are requested.
+@patch('phone_billing.bill.cache.transaction.on_commit',
+       lambda callback: callback())
+@memory_bill_cache
+class BillSearchViewConditionalTestCase(APITestCase):
+    def setUp(self):
+        get_bill_cache().clear()
+        self.addCleanup(get_bill_cache().clear)
+
+        self.subscriber = '00123456789'
+        self.url = reverse('bill:search', args=[self.subscriber])
+        end = timezone.now().replace(microsecond=0)
+        for id in (1, 2):
+            Call.objects.create(id=id, source=self.subscriber,
+                                destination='10123456789',
+                                started_at=end - timedelta(minutes=id),
+                                ended_at=end, duration=timedelta(minutes=id))
+        BillRecord.objects.create_for_calls([1, 2])
+        self.params = {'period': timezone.localdate().strftime('%m/%Y')}
+
+    def get_etag(self, **params):
+        return self.client.get(self.url, dict(self.params, **params))['ETag']
+
+    def test_not_modified(self):
+        etag = self.get_etag()
+
+        with self.assertNumQueries(0):
+            response = self.client.get(self.url, self.params,
+                                       HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEquals(response.status_code, 304)
+        self.assertEquals(response['ETag'], etag)
+        self.assertFalse(response.has_header('Last-Modified'))
+        self.assertEquals(response.content, b'')
+
+    def test_etag_is_strong(self):
+        self.assertRegex(self.get_etag(), r'^"[0-9a-f]{40}"$')
+
+    def test_streamed_bill_has_the_same_etag(self):
+        self.assertEquals(self.get_etag(stream='true'), self.get_etag())
+
+    def test_changed_bill_record(self):
+        etag = self.get_etag()
+        record = BillRecord.objects.get(call_id=1)
+        record.price = 1
+        record.save()
+
+        response = self.client.get(self.url, self.params,
+                                   HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEquals(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_changed_call(self):
+        etag = self.get_etag()
+        with changing_billed_calls([2]):
+            Call.objects.filter(id=2).update(destination='10987654321')
+
+        response = self.client.get(self.url, self.params,
+                                   HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEquals(response.status_code, 200)
+        self.assertIn('10987654321',
+                      [record['destination']
+                       for record in response.data['bill_records']])
+
+    def test_deleted_bill_record(self):
+        etag = self.get_etag()
+        BillRecord.objects.get(call_id=2).delete()
+
+        self.assertNotEqual(self.get_etag(), etag)
+
+
+class BillingQueueViewTestCase(APITestCase):
+    @patch('phone_billing.bill.views.get_queue_stats')
+    def test_success(self, mocked_stats):
+        mocked_stats.return_value = {'pending': 2, 'failed': 0, 'lag': 1.5}
+
+        response = self.client.get(reverse('bill:queue'))
+
+        self.assertEquals(response.status_code, 200)
+        self.assertEquals(response.data, mocked_stats.return_value)
@@ -0,0 +1,54 @@
+from datetime import timedelta
+from io import StringIO
+
+from django.core.management import call_command
+from django.test import TestCase
+from django.utils import timezone
+
+from ...call.models import Call
+
+from ..models import BillingTask, BillRecord
+from ..workers import BillingWorkers, get_queue_stats
+
+
+class BillingWorkersTestCase(TestCase):
+
+    def setUp(self):
+        end = timezone.now()
+        start = end - timedelta(minutes=5)
+
+        for id in range(1, 6):
+            Call.objects.create(id=id, source='00123456789',
+                                destination='10123456789',
+                                started_at=start, ended_at=end,
+                                duration=end - start)
+        BillingTask.objects.enqueue(range(1, 6))
+
+    def test_burst_drains_the_queue(self):
+        billed = BillingWorkers(workers=1, batch_size=2, burst=True).run()
+
+        self.assertEquals(billed, 5)
+        self.assertEquals(BillingTask.objects.count(), 0)
+        self.assertEquals(BillRecord.objects.count(), 5)
+
+    def test_get_queue_stats(self):
+        stats = get_queue_stats(max_attempts=5)
+
+        self.assertEquals(stats['pending'], 5)
+        self.assertEquals(stats['failed'], 0)
+        self.assertGreaterEqual(stats['lag'], 0)
+
+    def test_empty_queue_has_no_lag(self):
+        BillingTask.objects.all().delete()
+
+        self.assertEquals(get_queue_stats(max_attempts=5)['lag'], 0)
+
+    def test_command(self):
+        stdout = StringIO()
+
+        call_command('run_billing_workers', workers=1, burst=True,
+                     stdout=stdout)
+
+        self.assertEquals(BillRecord.objects.count(), 5)
+        self.assertIn('5 pending', stdout.getvalue())
+        self.assertIn('Processed 5 calls', stdout.getvalue())
@@ -0,0 +1,13 @@
+from django.conf import settings
+from django.test import override_settings
+
+
+# Keeps the bills cache in memory, for tests counting the queries of a bill
+# rather than those of the database cache.
+memory_bill_cache = override_settings(CACHES={
+    **settings.CACHES,
+    settings.BILL_CACHE_ALIAS: {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'bills',
+    },
+})
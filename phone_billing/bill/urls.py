@@ -1,8 +1,13 @@
 from django.urls import path
 
 
-from .views import BillSearchView
+from .views import (BillCacheView, BillExportView, BillingQueueView,
+                    BillSearchView)
 
 urlpatterns = [
+    path('cache/', BillCacheView.as_view(), name='cache'),
+    path('export/<str:file_format>/', BillExportView.as_view(),
+         name='export'),
+    path('queue/', BillingQueueView.as_view(), name='queue'),
     path('<str:subscriber>/', BillSearchView.as_view(), name='search'),
 ]
@@ -1,8 +1,25 @@
+import json
+
+from django.conf import settings
+from django.http import Http404, StreamingHttpResponse
+from rest_framework.permissions import IsAdminUser
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework.status import HTTP_400_BAD_REQUEST
 
-from .serializers import BillSerializer
+from ..conditional import (get_etag, get_not_modified_response,
+                           set_validators)
+from ..streaming import (get_streaming_response, is_stream_requested,
+                         stream_json_object)
+from ..tracing import span
+
+from .cache import (cache_bill, get_bill_cache_stats, get_bill_version,
+                    get_cached_bill)
+from .exports import EXPORT_FORMATS, BillExport
+from .models import MonthlyBill
+from .serializers import (BillExportSerializer, BillRecordValuesSerializer,
+                          BillSerializer)
+from .workers import get_queue_stats
 
 
 class BillSearchView(APIView):
@@ -16,8 +33,86 @@ class BillSearchView(APIView):
     def get(self, request, subscriber, format=None):
         search_data = self.get_search_data(request, subscriber)
         serializer = BillSerializer(data=search_data)
-        if serializer.is_valid():
-            serializer.search_bill_records()
-            return Response(serializer.data)
+        with span('bill_search.validate'):
+            is_valid = serializer.is_valid()
+        if is_valid:
+            subscriber = serializer.validated_data['subscriber']
+            period = serializer.get_period()
+
+            # The version is read first, and the ETag and the body of cached
+            # bills come along with it.
+            version = get_bill_version(subscriber, period)
+            etag = get_etag(request, subscriber, f'{period:%Y-%m}', version)
+            with span('bill_search.cache', period=period):
+                cached_bill = get_cached_bill(subscriber, period, version)
+            if cached_bill is not None:
+                data, last_modified = cached_bill
+            else:
+                with span('bill_search.monthly_bill'):
+                    closed_bill = MonthlyBill.objects.get_closed_bill(
+                        subscriber, period)
+                last_modified = closed_bill[0] if closed_bill else None
+
+            response = get_not_modified_response(request, etag,
+                                                 last_modified)
+            if response is not None:
+                return response
+
+            if cached_bill is None:
+                if closed_bill is not None:
+                    data = json.loads(closed_bill[1])
+                elif is_stream_requested(request):
+                    return set_validators(self.stream_bill(serializer), etag)
+                else:
+                    with span('bill_search.records'):
+                        serializer.search_bill_records()
+                    with span('bill_search.serialize'):
+                        data = serializer.data
+                cache_bill(subscriber, period, version, data, last_modified)
+
+            return set_validators(Response(data), etag, last_modified)
 
         return Response(serializer.errors, status=HTTP_400_BAD_REQUEST)
+
+    # Bills streamed from their records are not cached, as that would take
+    # the whole bill in memory.
+    def stream_bill(self, serializer):
+        data = serializer.to_representation(
+            dict(serializer.validated_data, bill_records=[]))
+        records_serializer = BillRecordValuesSerializer()
+        rows = records_serializer.get_queryset(
+            serializer.filter_bill_records()).iterator(
+                chunk_size=settings.STREAMING_RESPONSE_CHUNK_SIZE)
+        return get_streaming_response(stream_json_object(
+            data, 'bill_records', rows, records_serializer.to_representation))
+
+
+class BillingQueueView(APIView):
+    def get(self, request, format=None):
+        return Response(get_queue_stats(settings.BILLING_QUEUE_MAX_ATTEMPTS))
+
+
+class BillCacheView(APIView):
+    def get(self, request, format=None):
+        return Response(get_bill_cache_stats())
+
+
+class BillExportView(APIView):
+    """Streams every bill of a period as a gzipped CSV or NDJSON file."""
+
+    permission_classes = (IsAdminUser,)
+
+    def get(self, request, file_format, format=None):
+        if file_format not in EXPORT_FORMATS:
+            raise Http404
+
+        serializer = BillExportSerializer(data=request.query_params)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=HTTP_400_BAD_REQUEST)
+
+        export = BillExport(serializer.validated_data['period'], file_format)
+        response = StreamingHttpResponse(export,
+                                         content_type='application/gzip')
+        response['Content-Disposition'] = (
+            f'attachment; filename="{export.filename}"')
+        return response
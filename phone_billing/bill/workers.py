@@ -0,0 +1,86 @@
+import time
+from multiprocessing import Pool
+from multiprocessing.pool import ThreadPool
+
+from django.db import connection, connections
+from django.utils import timezone
+
+from .models import BillingTask
+
+
+POOLS = {'process': Pool, 'thread': ThreadPool}
+
+
+def get_queue_stats(max_attempts):
+    stats = BillingTask.objects.get_depth(max_attempts)
+    oldest_enqueued_at = stats.pop('oldest_enqueued_at')
+    stats['lag'] = ((timezone.now() - oldest_enqueued_at).total_seconds()
+                    if oldest_enqueued_at else 0)
+    return stats
+
+
+def drain_queue(batch_size, max_attempts, poll_interval, burst):
+    billed = 0
+    while True:
+        processed = BillingTask.objects.process(batch_size, max_attempts)
+        billed += processed
+        if processed:
+            continue
+        if burst:
+            return billed
+        time.sleep(poll_interval)
+
+
+def run_drain_queue(args):
+    try:
+        return drain_queue(*args)
+    finally:
+        # Pool threads would otherwise leave their connections open.
+        connection.close()
+
+
+class BillingWorkers:
+    def __init__(self, workers=1, pool='process', batch_size=500,
+                 max_attempts=5, poll_interval=1, burst=False,
+                 log_interval=10, stdout=None):
+        self.workers = workers
+        self.pool = pool
+        self.batch_size = batch_size
+        self.max_attempts = max_attempts
+        self.poll_interval = poll_interval
+        self.burst = burst
+        self.log_interval = log_interval
+        self.stdout = stdout
+
+    def log(self, message):
+        if self.stdout:
+            self.stdout.write(message)
+
+    def log_queue_stats(self):
+        stats = get_queue_stats(self.max_attempts)
+        self.log(f'Queue: {stats["pending"]} pending, {stats["failed"]}'
+                 f' failed, {stats["lag"]:.1f}s lag.')
+
+    def run(self):
+        self.log_queue_stats()
+        started_at = time.monotonic()
+        args = (self.batch_size, self.max_attempts, self.poll_interval,
+                self.burst)
+
+        if self.workers <= 1:
+            billed = drain_queue(*args)
+        else:
+            # Forked workers must open their own database connections.
+            connections.close_all()
+            with POOLS[self.pool](self.workers) as pool:
+                result = pool.map_async(run_drain_queue,
+                                        [args] * self.workers)
+                while not result.ready():
+                    result.wait(self.log_interval)
+                    self.log_queue_stats()
+                billed = sum(result.get())
+
+        elapsed = max(time.monotonic() - started_at, 1e-6)
+        self.log(f'Processed {billed} calls in {elapsed:.1f}s'
+                 f' ({billed / elapsed:.0f} calls/s).')
+        return billed
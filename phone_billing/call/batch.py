@@ -0,0 +1,112 @@
+from django.db import transaction
+from django.db.models import Q
+from rest_framework import serializers
+
+from ..bill.receivers import changing_billed_calls, enqueue_billing
+from ..db import bulk_upsert
+
+from .models import Call, CallRecord
+from .serializers import (CallRecordBatchItemSerializer,
+                          MISSING_CALL_MESSAGE, UNIQUE_RECORD_TYPE_MESSAGE)
+
+
+class CallRecordBatch:
+    def __init__(self, data):
+        self.data = data
+        self.valid_items = []
+        self.results = [None] * len(data)
+        self.calls = {}
+        self.records = {}
+        # Calls the records of the batch are moved away from.
+        self.previous_call_ids = set()
+
+    def add_result(self, index, status, errors=None):
+        item = self.data[index]
+        result = {
+            'index': index,
+            'id': item.get('id') if isinstance(item, dict) else None,
+            'status': status,
+        }
+        if errors is not None:
+            result['errors'] = errors
+
+        self.results[index] = result
+
+    def validate(self):
+        serializer = CallRecordBatchItemSerializer()
+        for index, item in enumerate(self.data):
+            try:
+                validated_data = serializer.run_validation(item)
+            except serializers.ValidationError as exc:
+                self.add_result(index, 'error', exc.detail)
+            else:
+                self.valid_items.append((index, validated_data))
+
+        self.validate_relations()
+
+    def get_current_state(self):
+        ids = {data['id'] for _, data in self.valid_items}
+        call_ids = {data['call_id'] for _, data in self.valid_items}
+
+        records = CallRecord.objects.filter(
+            Q(id__in=ids) | Q(call_id__in=call_ids)
+        ).values_list('id', 'call_id', 'record_type')
+        calls = Call.objects.filter(id__in=call_ids).values_list(
+            'id', flat=True)
+
+        return records, set(calls)
+
+    def validate_relations(self):
+        records, known_calls = self.get_current_state()
+        record_slots = {id: (call_id, record_type)
+                        for id, call_id, record_type in records}
+        slot_owners = {slot: id for id, slot in record_slots.items()}
+
+        for index, data in self.valid_items:
+            id, call_id = data['id'], data['call_id']
+            call_data = data.get('call', {})
+            has_call_data = ('source' in call_data
+                             and 'destination' in call_data)
+            slot = (call_id, data['record_type'])
+
+            if slot_owners.get(slot, id) != id:
+                self.add_result(index, 'error', {
+                    'non_field_errors': [UNIQUE_RECORD_TYPE_MESSAGE]})
+                continue
+
+            if call_id not in known_calls and not has_call_data:
+                self.add_result(index, 'error', {
+                    'call_id': [MISSING_CALL_MESSAGE.format(call_id)]})
+                continue
+
+            if has_call_data:
+                known_calls.add(call_id)
+                self.calls[call_id] = (call_id, call_data['source'],
+                                       call_data['destination'])
+
+            previous_slot = record_slots.get(id)
+            if previous_slot and previous_slot[0] != call_id:
+                self.previous_call_ids.add(previous_slot[0])
+            if previous_slot and slot_owners.get(previous_slot) == id:
+                del slot_owners[previous_slot]
+            slot_owners[slot] = id
+            record_slots[id] = slot
+
+            self.records[id] = (id, call_id, data['record_type'],
+                                data['timestamp'])
+            self.add_result(index, 'updated' if previous_slot else 'created')
+
+    @transaction.atomic
+    def save(self):
+        call_ids = {call_id for _, call_id, _, _ in self.records.values()}
+        call_ids |= self.previous_call_ids
+        with changing_billed_calls(call_ids):
+            bulk_upsert(Call, ('id', 'source', 'destination'),
+                        list(self.calls.values()))
+            bulk_upsert(CallRecord,
+                        ('id', 'call_id', 'record_type', 'timestamp'),
+                        list(self.records.values()))
+            Call.objects.sync_timestamps(call_ids)
+
+        enqueue_billing(call_ids)
+        return self.results
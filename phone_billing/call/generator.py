@@ -0,0 +1,185 @@
+import csv
+import gzip
+import json
+import time
+from datetime import date
+
+import numpy as np
+
+from ..bill.periods import add_months, get_period_range
+from ..bill.pricing import TARIFFS, get_seconds_of_day
+
+
+CSV_HEADER = ('id', 'type', 'timestamp', 'call_id', 'source', 'destination')
+
+SECONDS_PER_HOUR = 3600
+
+# Relative weights of the hours of the day calls start at.
+TIME_OF_DAY_PROFILES = {
+    'uniform': [1] * 24,
+    'business': [1, 1, 1, 1, 1, 2, 4, 8, 14, 16, 16, 15,
+                 13, 14, 16, 16, 15, 13, 10, 8, 6, 4, 3, 2],
+    'evening': [3, 2, 1, 1, 1, 1, 2, 3, 4, 5, 5, 5,
+                6, 6, 6, 7, 8, 10, 13, 15, 16, 14, 10, 6],
+}
+
+# Seconds of the day where the default tariffs change.
+TARIFF_BOUNDARIES = sorted({get_seconds_of_day(Tariff.start_time)
+                            for Tariff in TARIFFS})
+
+
+def get_subscriber_phone(index):
+    return f'{11 + index % 89:02d}9{index:08d}'
+
+
+def open_output(path):
+    if path.endswith('.gz'):
+        return gzip.open(path, 'wt', newline='')
+    return open(path, 'w', newline='')
+
+
+class CallRecordGenerator:
+    """Writes a synthetic, deterministic set of call records, in the CSV or
+    NDJSON format import_cdrs reads.
+
+    Every subscriber makes the same number of calls, spread over whole
+    months. Records are written in blocks of subscribers, each block sorted
+    by the time its records would reach the API. A share of records is
+    delayed, which puts some end records before their start records, and a
+    share is repeated later in its block.
+    """
+
+    def __init__(self, path, subscribers=1000, calls_per_subscriber=100,
+                 start=None, months=1, mean_duration=180,
+                 time_of_day='business', boundary_rate=0.05,
+                 out_of_order_rate=0.01, duplicate_rate=0.001, seed=0,
+                 first_subscriber=0, first_call_id=1, block_size=1000,
+                 stdout=None):
+        if time_of_day not in TIME_OF_DAY_PROFILES:
+            raise ValueError(f'Unknown time of day profile "{time_of_day}".')
+
+        self.path = path
+        self.subscribers = subscribers
+        self.calls_per_subscriber = calls_per_subscriber
+        self.start = start or date(2018, 1, 1)
+        self.months = months
+        self.mean_duration = mean_duration
+        weights = np.array(TIME_OF_DAY_PROFILES[time_of_day], dtype=float)
+        self.hour_weights = weights / weights.sum()
+        self.boundary_rate = boundary_rate
+        self.out_of_order_rate = out_of_order_rate
+        self.duplicate_rate = duplicate_rate
+        self.seed = seed
+        self.first_subscriber = first_subscriber
+        self.first_call_id = first_call_id
+        self.block_size = block_size
+        self.stdout = stdout
+
+        first_day, _ = get_period_range(self.start)
+        _, last_day = get_period_range(add_months(self.start, months - 1))
+        self.first_day = int(first_day.timestamp())
+        self.days = (last_day - first_day).days
+
+    @property
+    def format(self):
+        path = self.path[:-3] if self.path.endswith('.gz') else self.path
+        return 'csv' if path.endswith('.csv') else 'ndjson'
+
+    def log(self, message):
+        if self.stdout:
+            self.stdout.write(message)
+
+    def generate_block(self, first_subscriber, subscribers):
+        # Seeded per block, so blocks can be generated independently.
+        rng = np.random.default_rng([self.seed, first_subscriber])
+        calls = subscribers * self.calls_per_subscriber
+
+        subscriber_indexes = first_subscriber + np.repeat(
+            np.arange(subscribers), self.calls_per_subscriber)
+        destination_indexes = rng.integers(
+            0, max(self.first_subscriber + self.subscribers, 2), calls)
+
+        hours = rng.choice(24, size=calls, p=self.hour_weights)
+        starts = (self.first_day
+                  + rng.integers(0, self.days, calls) * 86400
+                  + hours * SECONDS_PER_HOUR
+                  + rng.integers(0, SECONDS_PER_HOUR, calls))
+        durations = np.maximum(
+            rng.exponential(self.mean_duration, calls).astype(np.int64), 1)
+
+        # Moves a share of the calls to cross a tariff boundary.
+        crossing = rng.random(calls) < self.boundary_rate
+        boundaries = rng.choice(TARIFF_BOUNDARIES, size=crossing.sum())
+        days = (starts[crossing] - self.first_day) // 86400
+        starts[crossing] = (self.first_day + days * 86400 + boundaries
+                            - rng.integers(0, durations[crossing]))
+        ends = starts + durations
+
+        call_ids = (self.first_call_id
+                    + (first_subscriber - self.first_subscriber)
+                    * self.calls_per_subscriber + np.arange(calls))
+
+        # Start and end records, ordered by the time they are sent.
+        record_call_ids = np.concatenate([call_ids, call_ids])
+        record_ids = np.concatenate([call_ids * 2 - 1, call_ids * 2])
+        is_start = np.arange(calls * 2) < calls
+        timestamps = np.concatenate([starts, ends])
+        sent_at = timestamps.astype(np.float64)
+        delayed = rng.random(calls * 2) < self.out_of_order_rate
+        sent_at[delayed] += rng.exponential(
+            self.mean_duration * 2, delayed.sum())
+
+        duplicated = np.flatnonzero(rng.random(calls * 2)
+                                    < self.duplicate_rate)
+        order = np.concatenate([np.arange(calls * 2), duplicated])
+        sent_at = np.concatenate([
+            sent_at, sent_at[duplicated] + rng.exponential(
+                SECONDS_PER_HOUR, len(duplicated))])
+        order = order[np.argsort(sent_at, kind='stable')]
+
+        for index in order:
+            call_index = index % calls
+            if is_start[index]:
+                yield (int(record_ids[index]), 'start',
+                       int(timestamps[index]), int(record_call_ids[index]),
+                       get_subscriber_phone(subscriber_indexes[call_index]),
+                       get_subscriber_phone(destination_indexes[call_index]))
+            else:
+                yield (int(record_ids[index]), 'end', int(timestamps[index]),
+                       int(record_call_ids[index]), '', '')
+
+    def generate(self):
+        last_subscriber = self.first_subscriber + self.subscribers
+        for first_subscriber in range(self.first_subscriber, last_subscriber,
+                                      self.block_size):
+            subscribers = min(self.block_size,
+                              last_subscriber - first_subscriber)
+            yield from self.generate_block(first_subscriber, subscribers)
+
+    def write(self, file, records):
+        written = 0
+        if self.format == 'csv':
+            writer = csv.writer(file)
+            writer.writerow(CSV_HEADER)
+            for record in records:
+                writer.writerow(record)
+                written += 1
+            return written
+
+        for record in records:
+            data = dict(zip(CSV_HEADER, record))
+            if not data['source']:
+                del data['source'], data['destination']
+            file.write(json.dumps(data) + '\n')
+            written += 1
+        return written
+
+    def run(self):
+        started_at = time.monotonic()
+        with open_output(self.path) as file:
+            written = self.write(file, self.generate())
+
+        elapsed = max(time.monotonic() - started_at, 1e-6)
+        self.log(f'Wrote {written} call records to {self.path} in'
+                 f' {elapsed:.1f}s ({written / elapsed:.0f} rows/s).')
+        return written
@@ -0,0 +1,340 @@
+import csv
+import gzip
+import hashlib
+import io
+import json
+import os
+import re
+import time
+from datetime import datetime
+
+from django.db import connection, transaction
+from django.utils.timezone import utc
+
+from ..bill.receivers import bill_calls, changing_billed_calls
+from ..parallel import parallel_map
+
+from .models import Call, CallRecord, ImportCheckpoint
+
+
+STAGING_COLUMNS = ('id', 'call_id', 'record_type', 'timestamp', 'source',
+                   'destination')
+
+MERGE_CALLS_SQL = '''
+    INSERT INTO call_call (id, source, destination)
+    SELECT DISTINCT ON (call_id) call_id, source, destination
+    FROM {staging}
+    WHERE call_id >= %(start)s AND call_id < %(end)s
+      AND source IS NOT NULL AND destination IS NOT NULL
+    ORDER BY call_id, seq DESC
+    ON CONFLICT (id) DO UPDATE
+    SET source = EXCLUDED.source, destination = EXCLUDED.destination
+'''
+
+# Records keep the create-or-update-by-id semantics of the API: the last
+# version of an id wins, and a (call_id, type) pair already owned by another
+# record id is rejected.
+MERGE_RECORDS_SQL = '''
+    INSERT INTO call_callrecord (id, call_id, record_type, timestamp)
+    SELECT DISTINCT ON (staged.call_id, staged.record_type)
+        staged.id, staged.call_id, staged.record_type, staged.timestamp
+    FROM (
+        SELECT DISTINCT ON (id) *
+        FROM {staging}
+        WHERE call_id >= %(start)s AND call_id < %(end)s
+        ORDER BY id, seq DESC
+    ) staged
+    JOIN call_call ON call_call.id = staged.call_id
+    LEFT JOIN call_callrecord owner
+        ON owner.call_id = staged.call_id
+        AND owner.record_type = staged.record_type
+    WHERE owner.id IS NULL OR owner.id = staged.id
+    ORDER BY staged.call_id, staged.record_type, staged.seq
+    ON CONFLICT (id) DO UPDATE
+    SET call_id = EXCLUDED.call_id, record_type = EXCLUDED.record_type,
+        timestamp = EXCLUDED.timestamp
+'''
+
+# Last versions of the staged records left out by MERGE_RECORDS_SQL, counted
+# by whether their call is missing or their (call_id, type) pair is taken.
+REJECTED_RECORDS_SQL = '''
+    SELECT call_call.id IS NULL, COUNT(*)
+    FROM (
+        SELECT DISTINCT ON (id) *
+        FROM {staging}
+        WHERE call_id >= %(start)s AND call_id < %(end)s
+        ORDER BY id, seq DESC
+    ) staged
+    LEFT JOIN call_call ON call_call.id = staged.call_id
+    LEFT JOIN call_callrecord merged
+        ON merged.id = staged.id
+        AND merged.call_id = staged.call_id
+        AND merged.record_type = staged.record_type
+        AND merged.timestamp = staged.timestamp
+    WHERE merged.id IS NULL
+    GROUP BY 1
+'''
+
+
+def parse_phone(value):
+    value = str(value)
+    if not value.isdigit() or not 10 <= len(value) <= 11:
+        raise ValueError(f'Invalid phone number "{value}".')
+    return value
+
+
+def parse_record(data):
+    if not isinstance(data, dict):
+        raise ValueError('Invalid record.')
+
+    record_type = data['type']
+    if record_type not in dict(CallRecord.RECORD_TYPES):
+        raise ValueError(f'"{record_type}" is not a valid choice.')
+
+    id, call_id = int(data['id']), int(data['call_id'])
+    if id < 0 or call_id < 0:
+        raise ValueError('Ids must be greater than or equal to 0.')
+
+    timestamp = datetime.fromtimestamp(int(float(data['timestamp'])), utc)
+
+    source = data.get('source') or None
+    destination = data.get('destination') or None
+    if source is not None and destination is not None:
+        source, destination = parse_phone(source), parse_phone(destination)
+    elif record_type == 'start':
+        raise ValueError('The fields source and destination are required on'
+                         ' a call start record.')
+    else:
+        source = destination = None
+
+    return (id, call_id, record_type, timestamp.isoformat(), source,
+            destination)
+
+
+def open_file(path):
+    if path.endswith('.gz'):
+        return gzip.open(path, 'rt', newline='')
+    return open(path, newline='')
+
+
+def read_records(path):
+    file_name = path[:-3] if path.endswith('.gz') else path
+
+    with open_file(path) as file:
+        if file_name.endswith('.csv'):
+            yield from csv.DictReader(file)
+            return
+
+        for line in file:
+            if not line.strip():
+                continue
+            try:
+                yield json.loads(line)
+            except ValueError:
+                yield None
+
+
+def get_staging_table(name, suffix=''):
+    return connection.ops.quote_name(f'call_import_{name}{suffix}')
+
+
+def copy_rows(cursor, staging, rows):
+    buffer = io.StringIO()
+    csv.writer(buffer).writerows(rows)
+    buffer.seek(0)
+
+    columns = ', '.join(STAGING_COLUMNS)
+    cursor.copy_expert(
+        f'COPY {staging} ({columns}) FROM STDIN WITH (FORMAT csv)', buffer)
+
+
+def load_file(name, path, chunk_size=100000):
+    staging = get_staging_table(name)
+    loaded = rejected = 0
+
+    with transaction.atomic(), connection.cursor() as cursor:
+        rows = []
+        for data in read_records(path):
+            try:
+                rows.append(parse_record(data))
+            except (KeyError, TypeError, ValueError):
+                rejected += 1
+                continue
+
+            if len(rows) >= chunk_size:
+                copy_rows(cursor, staging, rows)
+                loaded += len(rows)
+                rows = []
+
+        copy_rows(cursor, staging, rows)
+        loaded += len(rows)
+
+        ImportCheckpoint.objects.create(name=name, step=f'load:{path}',
+                                        rows=loaded)
+
+    return loaded, rejected
+
+
+def merge_range(name, start, end):
+    staging = get_staging_table(name)
+    params = {'start': start, 'end': end}
+
+    calls = Call.objects.filter(id__gte=start, id__lt=end)
+
+    with transaction.atomic(), connection.cursor() as cursor:
+        with changing_billed_calls(calls):
+            cursor.execute(MERGE_CALLS_SQL.format(staging=staging), params)
+            cursor.execute(MERGE_RECORDS_SQL.format(staging=staging), params)
+            merged = cursor.rowcount
+            Call.objects.sync_timestamps(calls)
+
+        cursor.execute(REJECTED_RECORDS_SQL.format(staging=staging), params)
+        rejected = dict(cursor.fetchall())
+
+        bill_calls(calls)
+
+        ImportCheckpoint.objects.create(name=name,
+                                        step=f'merge:{start}-{end}',
+                                        rows=merged)
+
+    return merged, rejected.get(True, 0), rejected.get(False, 0)
+
+
+def run_load_file(args):
+    return load_file(*args)
+
+
+def run_merge_range(args):
+    return merge_range(*args)
+
+
+class CallRecordImport:
+    def __init__(self, paths, name=None, workers=1, range_size=100000,
+                 stdout=None):
+        self.paths = [os.path.abspath(path) for path in paths]
+        self.name = name or self.get_default_name()
+        if not re.fullmatch(r'[a-z0-9_]{1,40}', self.name):
+            raise ValueError('Import names must have up to 40 lowercase'
+                             ' letters, digits or underscores.')
+        self.workers = workers
+        self.range_size = range_size
+        self.stdout = stdout
+
+    def get_default_name(self):
+        digest = hashlib.sha1('\n'.join(sorted(self.paths)).encode())
+        return digest.hexdigest()[:16]
+
+    @property
+    def staging_table(self):
+        return get_staging_table(self.name)
+
+    @property
+    def checkpoints(self):
+        return ImportCheckpoint.objects.filter(name=self.name)
+
+    def log(self, message):
+        if self.stdout:
+            self.stdout.write(message)
+
+    def log_throughput(self, action, rows, started_at):
+        elapsed = max(time.monotonic() - started_at, 1e-6)
+        self.log(f'{action} {rows} rows in {elapsed:.1f}s'
+                 f' ({rows / elapsed:.0f} rows/s).')
+
+    def map(self, function, tasks):
+        return parallel_map(function, tasks, self.workers)
+
+    def restart(self):
+        with connection.cursor() as cursor:
+            cursor.execute(f'DROP TABLE IF EXISTS {self.staging_table}')
+        self.checkpoints.delete()
+
+    # The staging table is logged: an unlogged one is emptied by crash
+    # recovery, while the checkpoints of the files loaded into it are kept,
+    # and a resumed import would merge nothing.
+    def create_staging_table(self):
+        with connection.cursor() as cursor:
+            cursor.execute(f'''
+                CREATE TABLE IF NOT EXISTS {self.staging_table} (
+                    seq bigserial,
+                    id bigint NOT NULL,
+                    call_id bigint NOT NULL,
+                    record_type varchar(5) NOT NULL,
+                    timestamp timestamp with time zone NOT NULL,
+                    source varchar(11),
+                    destination varchar(11)
+                )
+            ''')
+
+    def load(self):
+        loaded_steps = set(self.checkpoints.values_list('step', flat=True))
+        tasks = [(self.name, path) for path in self.paths
+                 if f'load:{path}' not in loaded_steps]
+        if len(tasks) < len(self.paths):
+            self.log(f'Skipping {len(self.paths) - len(tasks)} files already'
+                     f' loaded.')
+
+        started_at = time.monotonic()
+        results = self.map(run_load_file, tasks)
+
+        loaded = sum(loaded for loaded, _ in results)
+        rejected = sum(rejected for _, rejected in results)
+        self.log_throughput('Loaded', loaded, started_at)
+        if rejected:
+            self.log(f'Rejected {rejected} invalid rows.')
+
+    def get_ranges(self):
+        with connection.cursor() as cursor:
+            index = get_staging_table(self.name, '_call_id')
+            cursor.execute(f'CREATE INDEX IF NOT EXISTS {index}'
+                           f' ON {self.staging_table} (call_id)')
+            cursor.execute(f'SELECT MIN(call_id), MAX(call_id)'
+                           f' FROM {self.staging_table}')
+            first, last = cursor.fetchone()
+
+        if first is None:
+            return []
+
+        return [(start, start + self.range_size)
+                for start in range(first, last + 1, self.range_size)]
+
+    def merge(self):
+        merged_steps = set(self.checkpoints.values_list('step', flat=True))
+        tasks = [(self.name, start, end) for start, end in self.get_ranges()
+                 if f'merge:{start}-{end}' not in merged_steps]
+
+        started_at = time.monotonic()
+        results = self.map(run_merge_range, tasks)
+
+        merged = sum(merged for merged, _, _ in results)
+        without_call = sum(without_call for _, without_call, _ in results)
+        taken = sum(taken for _, _, taken in results)
+        self.log_throughput('Merged', merged, started_at)
+        if without_call or taken:
+            self.log(f'Rejected {without_call + taken} records:'
+                     f' {without_call} without a start record for their'
+                     f' call, {taken} of a type their call already has'
+                     f' under another id.')
+        return merged, without_call, taken
+
+    def run(self):
+        if self.checkpoints.filter(step='done').exists():
+            self.log(f'Import {self.name} already finished.')
+            return
+
+        self.log(f'Importing as {self.name}.')
+        started_at = time.monotonic()
+
+        self.create_staging_table()
+        self.load()
+        self.merge()
+
+        with transaction.atomic():
+            with connection.cursor() as cursor:
+                cursor.execute(f'DROP TABLE {self.staging_table}')
+            rows = sum(self.checkpoints.filter(
+                step__startswith='load:').values_list('rows', flat=True))
+            ImportCheckpoint.objects.create(name=self.name, step='done',
+                                            rows=rows)
+
+        self.log_throughput('Imported', rows, started_at)
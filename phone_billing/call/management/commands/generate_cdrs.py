@@ -0,0 +1,55 @@
+from datetime import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+
+from ...generator import CallRecordGenerator, TIME_OF_DAY_PROFILES
+
+
+class Command(BaseCommand):
+    help = ('Writes a deterministic synthetic set of call records to a CSV'
+            ' or NDJSON file (optionally gzipped) for import_cdrs.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('path')
+        parser.add_argument('--subscribers', type=int, default=1000)
+        parser.add_argument('--calls-per-subscriber', type=int, default=100)
+        parser.add_argument('--start', metavar='MM/YYYY', default='01/2018',
+                            help='First month of calls.')
+        parser.add_argument('--months', type=int, default=1,
+                            help='Number of months calls are spread over.')
+        parser.add_argument('--mean-duration', type=float, default=180,
+                            help='Mean call duration in seconds, durations'
+                                 ' are exponentially distributed.')
+        parser.add_argument('--time-of-day', default='business',
+                            choices=sorted(TIME_OF_DAY_PROFILES),
+                            help='Distribution of the hours calls start at.')
+        parser.add_argument('--boundary-rate', type=float, default=0.05,
+                            help='Share of calls crossing a tariff boundary.')
+        parser.add_argument('--out-of-order-rate', type=float, default=0.01,
+                            help='Share of records sent late.')
+        parser.add_argument('--duplicate-rate', type=float, default=0.001,
+                            help='Share of records sent twice.')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--first-call-id', type=int, default=1)
+
+    def get_start(self, value):
+        try:
+            return datetime.strptime(value, '%m/%Y').date()
+        except ValueError:
+            raise CommandError('Periods must be formatted as MM/YYYY.')
+
+    def handle(self, *args, **options):
+        if options['first_call_id'] < 1:
+            raise CommandError('Call ids must start at 1 or more.')
+
+        generator = CallRecordGenerator(
+            options['path'], subscribers=options['subscribers'],
+            calls_per_subscriber=options['calls_per_subscriber'],
+            start=self.get_start(options['start']), months=options['months'],
+            mean_duration=options['mean_duration'],
+            time_of_day=options['time_of_day'],
+            boundary_rate=options['boundary_rate'],
+            out_of_order_rate=options['out_of_order_rate'],
+            duplicate_rate=options['duplicate_rate'], seed=options['seed'],
+            first_call_id=options['first_call_id'], stdout=self.stdout)
+        generator.run()
@@ -0,0 +1,40 @@
+import os
+
+from django.core.management.base import BaseCommand, CommandError
+
+from ...importer import CallRecordImport
+
+
+class Command(BaseCommand):
+    help = ('Imports call records from CSV or NDJSON files (optionally'
+            ' gzipped), resuming a previous import of the same files.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('paths', nargs='+', metavar='path')
+        parser.add_argument('--name',
+                            help='Import name used for checkpoints, defaults'
+                                 ' to a hash of the file paths.')
+        parser.add_argument('--workers', type=int, default=os.cpu_count(),
+                            help='Number of worker processes.')
+        parser.add_argument('--range-size', type=int, default=100000,
+                            help='Number of call ids merged per task.')
+        parser.add_argument('--restart', action='store_true',
+                            help='Discard checkpoints of a previous run.')
+
+    def handle(self, *args, **options):
+        for path in options['paths']:
+            if not os.path.isfile(path):
+                raise CommandError(f'File "{path}" does not exist.')
+
+        try:
+            cdr_import = CallRecordImport(
+                options['paths'], name=options['name'],
+                workers=options['workers'],
+                range_size=options['range_size'], stdout=self.stdout)
+        except ValueError as exc:
+            raise CommandError(exc)
+
+        if options['restart']:
+            cdr_import.restart()
+
+        cdr_import.run()
@@ -0,0 +1,43 @@
+# Generated by Django 2.0.4 on 2026-10-18 20:20
+
+from django.db import migrations, models
+
+
+BACKFILL_TIMESTAMPS_SQL = '''
+    UPDATE call_call
+    SET started_at = records.started_at, ended_at = records.ended_at,
+        duration = records.ended_at - records.started_at
+    FROM (
+        SELECT call_id,
+            MAX(timestamp) FILTER (WHERE record_type = 'start') AS started_at,
+            MAX(timestamp) FILTER (WHERE record_type = 'end') AS ended_at
+        FROM call_callrecord
+        GROUP BY call_id
+    ) records
+    WHERE call_call.id = records.call_id
+'''
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('call', '0003_importcheckpoint'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='call',
+            name='duration',
+            field=models.DurationField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='call',
+            name='ended_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='call',
+            name='started_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.RunSQL(BACKFILL_TIMESTAMPS_SQL, migrations.RunSQL.noop),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 2.0.4 on 2026-10-18 20:41
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('call', '0004_call_timestamps'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='callrecord',
+            index=models.Index(fields=['timestamp', 'id'], name='callrecord_timestamp_id'),
+        ),
+    ]
@@ -1,26 +1,95 @@
-from django.db import models
+from django.core.exceptions import EmptyResultSet
+from django.db import connection, models
 from django.urls import reverse_lazy
 
 
+SYNC_TIMESTAMPS_SQL = '''
+    UPDATE call_call
+    SET started_at = records.started_at, ended_at = records.ended_at,
+        duration = records.ended_at - records.started_at
+    FROM call_call calls
+    LEFT JOIN (
+        SELECT call_id,
+            MAX(timestamp) FILTER (WHERE record_type = 'start') AS started_at,
+            MAX(timestamp) FILTER (WHERE record_type = 'end') AS ended_at
+        FROM call_callrecord
+        WHERE call_id IN ({calls})
+        GROUP BY call_id
+    ) records ON records.call_id = calls.id
+    WHERE call_call.id = calls.id AND calls.id IN ({calls})
+'''
+
+# The transactions that last wrote a call record and its call, changing
+# whenever either row does.
+CALL_RECORD_VERSION_SQL = (
+    "call_callrecord.xmin::text || ':' || call_call.xmin::text")
+
+# Creates or updates a call record by id, along with its call when source
+# and destination are given. Nothing is written unless the call exists and
+# no other record of the call has the same type.
+UPSERT_RECORD_SQL = '''
+    WITH checks AS (
+        SELECT %(has_call)s OR EXISTS (
+                SELECT 1 FROM call_call WHERE id = %(call_id)s
+            ) AS call_exists,
+            NOT EXISTS (
+                SELECT 1 FROM call_callrecord
+                WHERE call_id = %(call_id)s AND record_type = %(record_type)s
+                    AND id <> %(id)s
+            ) AS slot_free
+    ), calls AS (
+        INSERT INTO call_call (id, source, destination)
+        SELECT %(call_id)s, %(source)s, %(destination)s
+        FROM checks WHERE %(has_call)s AND slot_free
+        ON CONFLICT (id) DO UPDATE
+        SET source = EXCLUDED.source, destination = EXCLUDED.destination
+    ), records AS (
+        INSERT INTO call_callrecord (id, call_id, record_type, timestamp)
+        SELECT %(id)s, %(call_id)s, %(record_type)s, %(timestamp)s
+        FROM checks WHERE call_exists AND slot_free
+        ON CONFLICT (id) DO UPDATE
+        SET call_id = EXCLUDED.call_id, record_type = EXCLUDED.record_type,
+            timestamp = EXCLUDED.timestamp
+    )
+    SELECT checks.call_exists, checks.slot_free,
+        (SELECT call_id FROM call_callrecord WHERE id = %(id)s),
+        calls.source, calls.destination
+    FROM checks
+    LEFT JOIN call_call calls ON calls.id = %(call_id)s
+'''
+
+
+class CallManager(models.Manager):
+
+    def sync_timestamps(self, calls):
+        if not isinstance(calls, models.QuerySet):
+            calls = self.filter(id__in=list(calls))
+
+        try:
+            calls_sql, params = calls.values('id').query.sql_with_params()
+        except EmptyResultSet:
+            return
+
+        with connection.cursor() as cursor:
+            cursor.execute(SYNC_TIMESTAMPS_SQL.format(calls=calls_sql),
+                           params * 2)
+
+
 class Call(models.Model):
+    TIMESTAMP_FIELDS = ('started_at', 'ended_at', 'duration')
+
+    objects = CallManager()
+
     id = models.PositiveIntegerField(primary_key=True)
     source = models.CharField(max_length=11)
     destination = models.CharField(max_length=11)
+    started_at = models.DateTimeField(null=True, blank=True)
+    ended_at = models.DateTimeField(null=True, blank=True)
+    duration = models.DurationField(null=True, blank=True)
 
-    @property
-    def started_at(self):
-        if self.start_record:
-            return self.start_record.timestamp
-
-    @property
-    def ended_at(self):
-        if self.end_record:
-            return self.end_record.timestamp
-
-    @property
-    def duration(self):
-        if self.started_at and self.ended_at:
-            return self.ended_at - self.started_at
+    def sync_timestamps(self):
+        Call.objects.sync_timestamps(Call.objects.filter(id=self.id))
+        self.refresh_from_db(fields=self.TIMESTAMP_FIELDS)
 
     @property
     def start_record(self):
@@ -31,11 +100,40 @@ class Call(models.Model):
         return self.records.filter(record_type='end').last()
 
 
+class CallRecordManager(models.Manager):
+
+    def upsert(self, id, call_id, record_type, timestamp, source=None,
+               destination=None):
+        has_call = bool(source and destination)
+        with connection.cursor() as cursor:
+            cursor.execute(UPSERT_RECORD_SQL, {
+                'id': id, 'call_id': call_id, 'record_type': record_type,
+                'timestamp': timestamp, 'has_call': has_call,
+                'source': source, 'destination': destination,
+            })
+            (call_exists, slot_free, previous_call_id, current_source,
+             current_destination) = cursor.fetchone()
+
+        if has_call:
+            current_source, current_destination = source, destination
+
+        return {
+            'call_exists': call_exists,
+            'slot_free': slot_free,
+            'previous_call_id': previous_call_id,
+            'source': current_source,
+            'destination': current_destination,
+        }
+
+
 class CallRecord(models.Model):
     RECORD_TYPES = (
         ('start', 'Start'),
         ('end', 'End'),
     )
+
+    objects = CallRecordManager()
+
     id = models.PositiveIntegerField(primary_key=True)
     call = models.ForeignKey(Call, on_delete=True, related_name='records')
     record_type = models.CharField(max_length=5, choices=RECORD_TYPES)
@@ -43,9 +141,38 @@ class CallRecord(models.Model):
 
     class Meta:
         unique_together = ('call', 'record_type')
+        indexes = [
+            models.Index(fields=['timestamp', 'id'],
+                         name='callrecord_timestamp_id'),
+        ]
 
     def save(self, *args, **kwargs):
+        # A record moved to another call changes the timestamps of both.
+        previous_call_id = CallRecord.objects.filter(id=self.id).values_list(
+            'call_id', flat=True).first()
+
         super().save(*args, **kwargs)
+        if previous_call_id not in (None, self.call_id):
+            Call.objects.sync_timestamps([previous_call_id])
+        self.call.sync_timestamps()
 
         from ..bill.receivers import bill_call_record
         bill_call_record(self)
+
+    def delete(self, *args, **kwargs):
+        from ..bill.receivers import changing_billed_calls
+
+        with changing_billed_calls([self.call_id]):
+            deleted = super().delete(*args, **kwargs)
+            self.call.sync_timestamps()
+        return deleted
+
+
+class ImportCheckpoint(models.Model):
+    name = models.CharField(max_length=40)
+    step = models.CharField(max_length=255)
+    rows = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        unique_together = ('name', 'step')
@@ -0,0 +1,89 @@
+import base64
+import json
+from collections import OrderedDict
+from datetime import datetime, timedelta
+
+from django.conf import settings
+from django.db.models import Q
+from django.utils.timezone import utc
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+
+EPOCH = datetime(1970, 1, 1, tzinfo=utc)
+
+
+def encode_cursor(timestamp, id):
+    position = [(timestamp - EPOCH) // timedelta(microseconds=1), id]
+    return base64.urlsafe_b64encode(
+        json.dumps(position).encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    try:
+        padding = '=' * (-len(cursor) % 4)
+        microseconds, id = json.loads(base64.urlsafe_b64decode(
+            cursor + padding))
+        return EPOCH + timedelta(microseconds=int(microseconds)), int(id)
+    # Timestamps out of the datetime range overflow.
+    except (TypeError, ValueError, OverflowError, OSError):
+        raise NotFound('Invalid cursor.')
+
+
+# Keyset pagination of CallRecord values() over (timestamp, id). A cursor
+# holds the position of the last record of a page, so any page is an index
+# range scan instead of an OFFSET walking every record before it.
+class CallRecordPagination(BasePagination):
+    cursor_query_param = 'cursor'
+    page_size_query_param = 'page_size'
+    ordering = ('timestamp', 'id')
+
+    def get_page_size(self, request):
+        try:
+            page_size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return settings.CALL_RECORDS_PAGE_SIZE
+
+        if page_size < 1:
+            return settings.CALL_RECORDS_PAGE_SIZE
+        return min(page_size, settings.CALL_RECORDS_MAX_PAGE_SIZE)
+
+    def filter_after(self, queryset, timestamp, id):
+        # The redundant lower bound lets the (timestamp, id) index start
+        # the scan at the cursor.
+        return queryset.filter(timestamp__gte=timestamp).filter(
+            Q(timestamp__gt=timestamp) | Q(id__gt=id))
+
+    def filter_queryset(self, queryset, request):
+        queryset = queryset.order_by(*self.ordering)
+        cursor = request.query_params.get(self.cursor_query_param)
+        if cursor:
+            queryset = self.filter_after(queryset, *decode_cursor(cursor))
+        return queryset
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        page_size = self.get_page_size(request)
+
+        queryset = self.filter_queryset(queryset, request)
+        records = list(queryset[:page_size + 1])
+        self.has_next = len(records) > page_size
+        self.page = records[:page_size]
+        return self.page
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+
+        last = self.page[-1]
+        url = self.request.build_absolute_uri()
+        cursor = encode_cursor(last['timestamp'], last['id'])
+        return replace_query_param(url, self.cursor_query_param, cursor)
+
+    def get_paginated_response(self, data):
+        return Response(OrderedDict([
+            ('next', self.get_next_link()),
+            ('results', data),
+        ]))
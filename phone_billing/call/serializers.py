@@ -1,12 +1,22 @@
 from datetime import datetime
 
-from rest_framework.reverse import reverse_lazy
+from django.db import transaction
+from rest_framework.reverse import reverse, reverse_lazy
 from rest_framework import serializers
 from rest_framework.validators import UniqueTogetherValidator
 
+from ..bill.receivers import changing_billed_calls, enqueue_billing
+from ..tracing import span
+
 from .models import Call, CallRecord
 
 
+UNIQUE_RECORD_TYPE_MESSAGE = ('This call_id already has this type of call'
+                              ' record.')
+
+MISSING_CALL_MESSAGE = 'Invalid pk "{}" - object does not exist.'
+
+
 class PhoneField(serializers.CharField):
     def __init__(self, *args, max_length=11, min_length=10, **kwargs):
         super().__init__(*args, max_length=max_length,
@@ -50,7 +60,7 @@ class CallRecordSerializer(serializers.ModelSerializer):
             UniqueTogetherValidator(
                 queryset=model.objects.all(),
                 fields=('record_type', 'call_id'),
-                message='This call_id already has this type of call record.')]
+                message=UNIQUE_RECORD_TYPE_MESSAGE)]
 
     def get_url(self, instance):
         return reverse_lazy('call:record_detail', args=[instance.id],
@@ -68,8 +78,13 @@ class CallRecordSerializer(serializers.ModelSerializer):
         return super().validate(data)
 
     def save(self):
-        self.save_related_objects()
-        return super().save()
+        call_ids = [self.validated_data['call_id']]
+        if self.instance is not None:
+            call_ids.append(self.instance.call_id)
+
+        with transaction.atomic(), changing_billed_calls(call_ids):
+            self.save_related_objects()
+            return super().save()
 
     def save_related_objects(self):
         call_data = self.validated_data.pop('call', {})
@@ -82,3 +97,73 @@ class CallRecordSerializer(serializers.ModelSerializer):
             Call.objects.update_or_create(
                 id=call_id, defaults={'source': source,
                                       'destination': destination})
+
+
+class CallRecordBatchItemSerializer(CallRecordSerializer):
+    class Meta(CallRecordSerializer.Meta):
+        # Uniqueness is checked for the whole batch at once by CallRecordBatch.
+        validators = []
+
+
+# Saves a call record in a single upsert, which checks the uniqueness of its
+# type and the existence of its call itself. Returns the record values.
+class CallRecordUpsertSerializer(CallRecordBatchItemSerializer):
+    def save(self):
+        data = self.validated_data
+        call_data = data.get('call', {})
+        call_id = data['call_id']
+
+        with transaction.atomic():
+            with span('ingest.upsert', call_id=call_id, record_id=data['id']):
+                result = CallRecord.objects.upsert(
+                    data['id'], call_id, data['record_type'],
+                    data['timestamp'], call_data.get('source'),
+                    call_data.get('destination'))
+            if not result['slot_free']:
+                raise serializers.ValidationError(
+                    {'non_field_errors': [UNIQUE_RECORD_TYPE_MESSAGE]})
+            if not result['call_exists']:
+                raise serializers.ValidationError(
+                    {'call_id': [MISSING_CALL_MESSAGE.format(call_id)]})
+
+            call_ids = {call_id, result['previous_call_id']} - {None}
+            with span('ingest.sync_bills', call_ids=sorted(call_ids)), \
+                    changing_billed_calls(call_ids):
+                Call.objects.sync_timestamps(call_ids)
+            with span('ingest.enqueue_billing'):
+                enqueue_billing(call_ids)
+
+        return {
+            'id': data['id'],
+            'record_type': data['record_type'],
+            'timestamp': data['timestamp'],
+            'call_id': call_id,
+            'call__source': result['source'],
+            'call__destination': result['destination'],
+        }
+
+
+# Read-only CallRecordSerializer for rows of CallRecord values(), which skips
+# building model instances and reversing the url of every record.
+class CallRecordValuesSerializer:
+    values = ('id', 'record_type', 'timestamp', 'call_id', 'call__source',
+              'call__destination')
+
+    def __init__(self, context):
+        url = reverse('call:record_detail', args=[0],
+                      request=context['request'])
+        self.url_prefix, self.url_suffix = url.rsplit('0', 1)
+
+    def get_queryset(self, queryset):
+        return queryset.values(*self.values)
+
+    def to_representation(self, row):
+        return {
+            'id': row['id'],
+            'type': row['record_type'],
+            'timestamp': int(row['timestamp'].timestamp()),
+            'url': f'{self.url_prefix}{row["id"]}{self.url_suffix}',
+            'call_id': row['call_id'],
+            'source': row['call__source'],
+            'destination': row['call__destination'],
+        }
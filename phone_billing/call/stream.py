@@ -0,0 +1,113 @@
+import gzip
+import json
+import zlib
+
+from .batch import CallRecordBatch
+
+
+CONTENT_ENCODINGS = ('identity', 'gzip')
+
+# Errors raised reading a truncated or corrupt gzip body.
+MALFORMED_BODY_ERRORS = (OSError, EOFError, zlib.error)
+
+READ_CHUNK_SIZE = 64 * 1024
+
+
+class LineTooLong(ValueError):
+    def __init__(self, max_line_size):
+        super().__init__(
+            f'Lines can not be longer than {max_line_size} bytes.')
+        self.line = None
+
+
+def decode_stream(stream, content_encoding='identity'):
+    if content_encoding == 'gzip':
+        return gzip.GzipFile(fileobj=stream, mode='rb')
+    return stream
+
+
+def read_lines(stream, max_line_size, chunk_size=READ_CHUNK_SIZE):
+    """Splits a binary stream into lines, reading it a chunk at a time.
+
+    Raises LineTooLong as soon as a line grows past max_line_size bytes, so
+    no more than a line and a chunk are ever held in memory.
+    """
+    pending = b''
+    while True:
+        data = stream.read(chunk_size)
+        if not data:
+            break
+
+        lines = (pending + data).split(b'\n')
+        pending = lines.pop()
+        for line in lines:
+            if len(line) > max_line_size:
+                raise LineTooLong(max_line_size)
+            yield line
+        if len(pending) > max_line_size:
+            raise LineTooLong(max_line_size)
+
+    if pending:
+        yield pending
+
+
+def parse_lines(lines):
+    number = 0
+    try:
+        for number, line in enumerate(lines, start=1):
+            line = line.strip()
+            if not line:
+                continue
+
+            try:
+                yield number, json.loads(line.decode('utf-8')), None
+            except ValueError as exc:
+                errors = {'non_field_errors': [f'Invalid JSON: {exc}']}
+                yield number, None, errors
+    except LineTooLong as exc:
+        exc.line = number + 1
+        raise
+
+
+def save_chunk(chunk):
+    if not chunk:
+        return
+
+    valid_lines = [(number, item) for number, item, error in chunk
+                   if error is None]
+
+    batch = CallRecordBatch([item for _, item in valid_lines])
+    batch.validate()
+    results = iter(batch.save())
+
+    for number, item, error in chunk:
+        if error is not None:
+            yield {'line': number, 'id': None, 'status': 'error',
+                   'errors': error}
+            continue
+
+        result = next(results)
+        del result['index']
+        yield dict(line=number, **result)
+
+
+def ingest_lines(lines, chunk_size):
+    chunk = []
+    try:
+        for parsed_line in parse_lines(lines):
+            chunk.append(parsed_line)
+            if len(chunk) >= chunk_size:
+                yield from save_chunk(chunk)
+                chunk = []
+    except LineTooLong as exc:
+        yield from save_chunk(chunk)
+        yield {'line': exc.line, 'id': None, 'status': 'error',
+               'errors': {'non_field_errors': [str(exc)]}}
+        return
+    except MALFORMED_BODY_ERRORS:
+        yield from save_chunk(chunk)
+        yield {'line': None, 'id': None, 'status': 'error',
+               'errors': {'non_field_errors': ['Malformed compressed body.']}}
+        return
+
+    yield from save_chunk(chunk)
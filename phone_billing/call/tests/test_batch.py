@@ -0,0 +1,170 @@
+from datetime import timedelta
+
+from django.test import TestCase
+from django.utils import timezone
+
+from ...bill.models import BillingTask, BillRecord
+
+from ..batch import CallRecordBatch
+from ..models import Call, CallRecord
+
+
+class CallRecordBatchTestCase(TestCase):
+    def setUp(self):
+        self.end = timezone.now().replace(microsecond=0)
+        self.start = self.end - timedelta(minutes=5)
+
+        self.start_data = {
+            'id': 1,
+            'type': 'start',
+            'timestamp': self.start.timestamp(),
+            'call_id': 1,
+            'source': '00123456789',
+            'destination': '10123456789'
+        }
+        self.end_data = {
+            'id': 2,
+            'type': 'end',
+            'timestamp': self.end.timestamp(),
+            'call_id': 1,
+        }
+
+    def save_batch(self, data):
+        batch = CallRecordBatch(data)
+        batch.validate()
+        return batch.save()
+
+    def test_creates_calls_and_records(self):
+        results = self.save_batch([self.start_data, self.end_data])
+
+        self.assertEquals(results, [
+            {'index': 0, 'id': 1, 'status': 'created'},
+            {'index': 1, 'id': 2, 'status': 'created'},
+        ])
+
+        call = Call.objects.get()
+        self.assertEquals(call.source, self.start_data['source'])
+        self.assertEquals(call.destination, self.start_data['destination'])
+
+        self.assertEquals(CallRecord.objects.get(id=1).timestamp, self.start)
+        self.assertEquals(CallRecord.objects.get(id=2).timestamp, self.end)
+
+    def test_syncs_call_timestamps(self):
+        self.save_batch([self.start_data, self.end_data])
+
+        call = Call.objects.get()
+        self.assertEquals(call.started_at, self.start)
+        self.assertEquals(call.ended_at, self.end)
+        self.assertEquals(call.duration, self.end - self.start)
+
+    def test_queues_completed_calls_for_billing(self):
+        self.save_batch([self.start_data, self.end_data])
+
+        self.assertEquals(BillingTask.objects.get().call_id, 1)
+        self.assertEquals(BillRecord.objects.count(), 0)
+
+        BillingTask.objects.process(batch_size=10, max_attempts=1)
+        bill_record = BillRecord.objects.get()
+        self.assertEquals(bill_record.call_id, 1)
+        self.assertIsNotNone(bill_record.price)
+
+    def test_does_not_bill_incomplete_calls(self):
+        self.save_batch([self.start_data])
+
+        self.assertEquals(BillingTask.objects.count(), 0)
+
+    def test_updates_existing_records(self):
+        self.save_batch([self.start_data])
+
+        new_start = self.start - timedelta(minutes=1)
+        start_data_copy = self.start_data.copy()
+        start_data_copy['timestamp'] = new_start.timestamp()
+        results = self.save_batch([start_data_copy])
+
+        self.assertEquals(results[0]['status'], 'updated')
+        self.assertEquals(CallRecord.objects.get().timestamp, new_start)
+
+    def test_moving_a_record_syncs_both_calls(self):
+        self.save_batch([self.start_data, self.end_data])
+        BillingTask.objects.process(batch_size=10, max_attempts=1)
+
+        self.save_batch([dict(self.start_data, id=3, call_id=2),
+                         dict(self.end_data, call_id=2)])
+
+        first_call, second_call = Call.objects.order_by('id')
+        self.assertIsNone(first_call.ended_at)
+        self.assertIsNone(first_call.duration)
+        self.assertEquals(second_call.ended_at, self.end)
+        self.assertIsNone(BillRecord.objects.get(call_id=1).period)
+        self.assertEquals(BillingTask.objects.get().call_id, 2)
+
+    def test_last_item_wins_for_repeated_ids(self):
+        start_data_copy = self.start_data.copy()
+        start_data_copy['destination'] = '20123456789'
+
+        results = self.save_batch([self.start_data, start_data_copy])
+
+        self.assertEquals([result['status'] for result in results],
+                          ['created', 'updated'])
+        self.assertEquals(Call.objects.get().destination, '20123456789')
+
+    def test_invalid_items_do_not_reject_the_batch(self):
+        invalid_data = self.end_data.copy()
+        invalid_data['type'] = 'test'
+
+        results = self.save_batch([self.start_data, invalid_data, 'test'])
+
+        self.assertEquals(results[0]['status'], 'created')
+        self.assertEquals(results[1]['status'], 'error')
+        self.assertIn('type', results[1]['errors'])
+        self.assertEquals(results[2]['status'], 'error')
+        self.assertIsNone(results[2]['id'])
+        self.assertEquals(CallRecord.objects.count(), 1)
+
+    def test_start_records_require_source_and_destination(self):
+        start_data_copy = self.start_data.copy()
+        del start_data_copy['source']
+
+        results = self.save_batch([start_data_copy])
+
+        self.assertEquals(results[0]['errors']['non_field_errors'][0],
+                          'The fields source and destination are required on'
+                          ' a call start record.')
+        self.assertEquals(Call.objects.count(), 0)
+
+    def test_type_and_call_id_unique_together(self):
+        self.save_batch([self.start_data])
+
+        start_data_copy = self.start_data.copy()
+        start_data_copy['id'] = 3
+        results = self.save_batch([start_data_copy])
+
+        self.assertEquals(results[0]['status'], 'error')
+        self.assertEquals(results[0]['errors']['non_field_errors'][0],
+                          'This call_id already has this type of call'
+                          ' record.')
+
+    def test_type_and_call_id_unique_together_within_batch(self):
+        start_data_copy = self.start_data.copy()
+        start_data_copy['id'] = 3
+
+        results = self.save_batch([self.start_data, start_data_copy])
+
+        self.assertEquals(results[0]['status'], 'created')
+        self.assertEquals(results[1]['status'], 'error')
+        self.assertEquals(CallRecord.objects.get().id, 1)
+
+    def test_records_require_an_existing_call(self):
+        results = self.save_batch([self.end_data])
+
+        self.assertEquals(results[0]['status'], 'error')
+        self.assertEquals(results[0]['errors']['call_id'][0],
+                          'Invalid pk "1" - object does not exist.')
+
+    def test_validation_query_count(self):
+        data = [dict(self.start_data, id=id, call_id=id)
+                for id in range(1, 51)]
+        batch = CallRecordBatch(data)
+
+        with self.assertNumQueries(2):
+            batch.validate()
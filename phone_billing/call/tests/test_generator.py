@@ -0,0 +1,117 @@
+import csv
+import gzip
+import json
+import os
+import tempfile
+from io import StringIO
+
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.test import TestCase
+
+from ...bill.models import BillRecord
+
+from ..generator import (CallRecordGenerator, TARIFF_BOUNDARIES,
+                         get_subscriber_phone)
+from ..importer import CallRecordImport
+from ..models import Call, CallRecord
+
+
+class CallRecordGeneratorTestCase(TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+
+    def generate(self, name='records.csv', **kwargs):
+        path = os.path.join(self.directory.name, name)
+        kwargs.setdefault('subscribers', 5)
+        kwargs.setdefault('calls_per_subscriber', 4)
+        kwargs.setdefault('block_size', 2)
+        CallRecordGenerator(path, **kwargs).run()
+        return path
+
+    def read(self, path):
+        with open(path, newline='') as file:
+            return list(csv.DictReader(file))
+
+    def read_bytes(self, path):
+        with open(path, 'rb') as file:
+            return file.read()
+
+    def test_is_deterministic(self):
+        first = self.generate('first.csv', seed=1)
+        second = self.generate('second.csv', seed=1)
+        other = self.generate('other.csv', seed=2)
+
+        self.assertEquals(self.read_bytes(first), self.read_bytes(second))
+        self.assertNotEquals(self.read_bytes(first), self.read_bytes(other))
+
+    def test_writes_a_start_and_an_end_per_call(self):
+        records = self.read(self.generate(duplicate_rate=0))
+
+        self.assertEquals(len(records), 40)
+        self.assertEquals(len({record['id'] for record in records}), 40)
+        self.assertEquals(len({record['call_id'] for record in records}), 20)
+        starts = [record for record in records if record['type'] == 'start']
+        self.assertEquals(
+            {record['source'] for record in starts},
+            {get_subscriber_phone(index) for index in range(5)})
+
+    def test_duplicates_and_out_of_order_records(self):
+        records = self.read(self.generate(duplicate_rate=0.5,
+                                          out_of_order_rate=0.5,
+                                          mean_duration=60))
+
+        self.assertGreater(len(records), 40)
+        self.assertEquals(len({record['id'] for record in records}), 40)
+        positions = {(record['call_id'], record['type']): index
+                     for index, record in enumerate(records)}
+        self.assertTrue(any(
+            positions[(call_id, 'end')] < positions[(call_id, 'start')]
+            for call_id, _ in positions))
+
+    def test_tariff_boundary_crossings(self):
+        records = self.read(self.generate(boundary_rate=1, duplicate_rate=0))
+        timestamps = {}
+        for record in records:
+            timestamps.setdefault(record['call_id'], {})[record['type']] = \
+                int(record['timestamp'])
+
+        for call in timestamps.values():
+            start = call['start'] % 86400
+            end = start + call['end'] - call['start']
+            self.assertTrue(any(start < boundary <= end
+                                for boundary in TARIFF_BOUNDARIES))
+
+    def test_ndjson(self):
+        path = self.generate('records.ndjson.gz', duplicate_rate=0)
+
+        with gzip.open(path, 'rt') as file:
+            records = [json.loads(line) for line in file]
+
+        self.assertEquals(len(records), 40)
+        end = next(record for record in records if record['type'] == 'end')
+        self.assertNotIn('source', end)
+
+    def test_import(self):
+        path = self.generate(duplicate_rate=0.2, out_of_order_rate=0.2)
+
+        CallRecordImport([path]).run()
+
+        self.assertEquals(Call.objects.count(), 20)
+        self.assertEquals(CallRecord.objects.count(), 40)
+        self.assertEquals(BillRecord.objects.count(), 20)
+
+    def test_command(self):
+        path = os.path.join(self.directory.name, 'records.csv')
+        stdout = StringIO()
+
+        call_command('generate_cdrs', path, '--subscribers', '2',
+                     '--calls-per-subscriber', '3', '--duplicate-rate', '0',
+                     '--start', '02/2018', stdout=stdout)
+
+        self.assertIn('Wrote 12 call records', stdout.getvalue())
+        self.assertEquals(len(self.read(path)), 12)
+
+        with self.assertRaises(CommandError):
+            call_command('generate_cdrs', path, '--start', '2018-02')
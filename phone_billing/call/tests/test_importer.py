@@ -0,0 +1,175 @@
+import gzip
+import json
+import os
+import tempfile
+from io import StringIO
+
+from django.core.management import call_command
+from django.test import TestCase
+
+from ...bill.models import BillRecord
+
+from ..importer import CallRecordImport, parse_record, read_records
+from ..models import Call, CallRecord, ImportCheckpoint
+
+
+CSV_CONTENT = '''id,type,timestamp,call_id,source,destination
+1,start,1513091233,1,00123456789,10123456789
+2,end,1513091533,1,,
+3,start,1513091233,2,00123456789,10123456789
+4,start,not a timestamp,3,00123456789,10123456789
+'''
+
+NDJSON_RECORDS = [
+    {'id': 5, 'type': 'end', 'timestamp': 1513091533, 'call_id': 2},
+    {'id': 6, 'type': 'start', 'timestamp': 1513091233, 'call_id': 200,
+     'source': '00123456789', 'destination': '10123456789'},
+]
+
+
+class ParseRecordTestCase(TestCase):
+    def test_start_record(self):
+        self.assertEquals(
+            parse_record({'id': '1', 'type': 'start',
+                          'timestamp': '1513091233.5', 'call_id': '2',
+                          'source': '00123456789',
+                          'destination': '10123456789'}),
+            (1, 2, 'start', '2017-12-12T15:07:13+00:00', '00123456789',
+             '10123456789'))
+
+    def test_end_record_without_call_data(self):
+        self.assertEquals(
+            parse_record({'id': 1, 'type': 'end', 'timestamp': 1513091233,
+                          'call_id': 2, 'source': ''}),
+            (1, 2, 'end', '2017-12-12T15:07:13+00:00', None, None))
+
+    def test_start_records_require_source_and_destination(self):
+        with self.assertRaises(ValueError):
+            parse_record({'id': 1, 'type': 'start', 'timestamp': 1513091233,
+                          'call_id': 2, 'source': '00123456789'})
+
+    def test_invalid_records(self):
+        invalid_records = [
+            None,
+            {'id': 1, 'type': 'test', 'timestamp': 0, 'call_id': 2},
+            {'id': -1, 'type': 'end', 'timestamp': 0, 'call_id': 2},
+            {'id': 1, 'type': 'end', 'timestamp': 0},
+            {'id': 1, 'type': 'end', 'timestamp': 0, 'call_id': 2,
+             'source': 'AA123456789', 'destination': '10123456789'},
+        ]
+
+        for data in invalid_records:
+            with self.assertRaises((KeyError, ValueError)):
+                parse_record(data)
+
+
+class CallRecordImportTestCase(TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+
+        self.csv_path = os.path.join(self.directory.name, 'records.csv')
+        with open(self.csv_path, 'w') as file:
+            file.write(CSV_CONTENT)
+
+        self.ndjson_path = os.path.join(self.directory.name,
+                                        'records.ndjson.gz')
+        with gzip.open(self.ndjson_path, 'wt') as file:
+            for record in NDJSON_RECORDS:
+                file.write(json.dumps(record) + '\n')
+            file.write('{"id": \n')
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_read_records(self):
+        self.assertEquals(len(list(read_records(self.csv_path))), 4)
+        self.assertEquals(list(read_records(self.ndjson_path)),
+                          NDJSON_RECORDS + [None])
+
+    def test_imports_and_bills_calls(self):
+        CallRecordImport([self.csv_path, self.ndjson_path],
+                         range_size=100).run()
+
+        self.assertEquals(sorted(Call.objects.values_list('id', flat=True)),
+                          [1, 2, 200])
+        self.assertEquals(
+            sorted(CallRecord.objects.values_list('id', flat=True)),
+            [1, 2, 3, 5, 6])
+        self.assertEquals(
+            sorted(BillRecord.objects.values_list('call_id', flat=True)),
+            [1, 2])
+
+    def test_records_checkpoints(self):
+        cdr_import = CallRecordImport([self.csv_path, self.ndjson_path],
+                                      range_size=100)
+        cdr_import.run()
+
+        steps = set(cdr_import.checkpoints.values_list('step', flat=True))
+        self.assertEquals(steps, {
+            f'load:{self.csv_path}', f'load:{self.ndjson_path}',
+            'merge:1-101', 'merge:101-201', 'done'})
+        self.assertEquals(cdr_import.checkpoints.get(step='done').rows, 5)
+
+    def test_resumes_from_checkpoints(self):
+        cdr_import = CallRecordImport([self.csv_path, self.ndjson_path],
+                                      range_size=100)
+        ImportCheckpoint.objects.create(name=cdr_import.name,
+                                        step=f'load:{self.csv_path}')
+
+        cdr_import.run()
+
+        self.assertEquals(
+            sorted(CallRecord.objects.values_list('id', flat=True)), [6])
+
+    def test_keeps_existing_record_type_owners(self):
+        call = Call.objects.create(id=2, source='00123456789',
+                                   destination='10123456789')
+        CallRecord.objects.create(id=30, call=call, record_type='start',
+                                  timestamp='2017-12-12T15:07:13Z')
+
+        CallRecordImport([self.csv_path]).run()
+
+        self.assertFalse(CallRecord.objects.filter(id=3).exists())
+        self.assertTrue(CallRecord.objects.filter(id=30).exists())
+
+    def test_reports_records_of_taken_types(self):
+        call = Call.objects.create(id=1, source='00123456789',
+                                   destination='10123456789')
+        CallRecord.objects.create(id=10, call=call, record_type='end',
+                                  timestamp='2017-12-12T15:12:13Z')
+        stdout = StringIO()
+
+        CallRecordImport([self.csv_path], stdout=stdout).run()
+
+        self.assertFalse(CallRecord.objects.filter(id=2).exists())
+        self.assertIn('Rejected 1 records: 0 without a start record for'
+                      ' their call, 1 of a type their call already has under'
+                      ' another id.', stdout.getvalue())
+
+    def test_reports_records_without_call(self):
+        stdout = StringIO()
+
+        CallRecordImport([self.ndjson_path], stdout=stdout).run()
+
+        self.assertFalse(CallRecord.objects.filter(id=5).exists())
+        self.assertIn('Rejected 1 records: 1 without a start record for'
+                      ' their call, 0 of a type', stdout.getvalue())
+
+    def test_invalid_name(self):
+        with self.assertRaises(ValueError):
+            CallRecordImport([self.csv_path], name='Robert\'); DROP TABLE')
+
+    def test_command(self):
+        stdout = StringIO()
+
+        call_command('import_cdrs', self.csv_path, '--workers', '1',
+                     '--name', 'test', stdout=stdout)
+
+        self.assertIn('Loaded 3 rows', stdout.getvalue())
+        self.assertIn('Rejected 1 invalid rows.', stdout.getvalue())
+        self.assertEquals(CallRecord.objects.count(), 3)
+
+        call_command('import_cdrs', self.csv_path, '--workers', '1',
+                     '--name', 'test', stdout=stdout)
+
+        self.assertIn('Import test already finished.', stdout.getvalue())
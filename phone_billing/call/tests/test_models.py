@@ -154,6 +154,47 @@ class CallModelTestCase(TestCase):
         self.assertIsNone(call.duration)
 
 
+class CallManagerTestCase(TestCase):
+
+    def setUp(self):
+        self.end = timezone.now()
+        self.start = self.end - timedelta(minutes=5)
+
+        call = Call.objects.create(id=1, source='00123456789',
+                                   destination='00123456789')
+        Call.objects.create(id=2, source='00123456789',
+                            destination='00123456789')
+        CallRecord.objects.bulk_create([
+            CallRecord(id=1, call=call, record_type='start',
+                       timestamp=self.start),
+            CallRecord(id=2, call=call, record_type='end',
+                       timestamp=self.end),
+        ])
+
+    def test_sync_timestamps(self):
+        Call.objects.sync_timestamps([1, 2])
+
+        call = Call.objects.get(id=1)
+        self.assertEquals(call.started_at, self.start)
+        self.assertEquals(call.ended_at, self.end)
+        self.assertEquals(call.duration, self.end - self.start)
+
+        other_call = Call.objects.get(id=2)
+        self.assertIsNone(other_call.started_at)
+        self.assertIsNone(other_call.ended_at)
+        self.assertIsNone(other_call.duration)
+
+    def test_sync_timestamps_with_queryset(self):
+        Call.objects.sync_timestamps(Call.objects.filter(id__lt=2))
+
+        self.assertEquals(Call.objects.get(id=1).duration,
+                          self.end - self.start)
+
+    def test_sync_timestamps_with_no_calls(self):
+        with self.assertNumQueries(0):
+            Call.objects.sync_timestamps([])
+
+
 class CallRecordModelTestCase(TestCase):
 
     def setUp(self):
@@ -234,3 +275,25 @@ class CallRecordModelTestCase(TestCase):
         record.save()
 
         mocked_receiver.assert_called_once_with(record)
+
+    def test_save_syncs_call_timestamps(self):
+        record = CallRecord(id=1,
+                            call=self.call,
+                            record_type='start',
+                            timestamp=self.now)
+
+        record.save()
+
+        self.assertEquals(Call.objects.get().started_at, self.now)
+        self.assertEquals(self.call.started_at, self.now)
+
+    def test_delete_syncs_call_timestamps(self):
+        record = CallRecord.objects.create(id=1,
+                                           call=self.call,
+                                           record_type='end',
+                                           timestamp=self.now)
+
+        record.delete()
+
+        self.assertIsNone(Call.objects.get().ended_at)
+        self.assertIsNone(self.call.ended_at)
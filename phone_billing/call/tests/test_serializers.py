@@ -4,10 +4,12 @@ from unittest.mock import patch
 from django.test import TestCase, RequestFactory
 from django.utils import timezone
 from rest_framework import serializers
+from rest_framework.renderers import JSONRenderer
 from rest_framework.reverse import reverse
 
 from ..models import Call, CallRecord
-from ..serializers import PhoneField, TimestampField, CallRecordSerializer
+from ..serializers import (PhoneField, TimestampField, CallRecordSerializer,
+                           CallRecordValuesSerializer)
 
 
 class PhoneFieldTestCase(TestCase):
@@ -185,3 +187,35 @@ class CallRecordSerializerTestCase(TestCase):
         self.assertEquals(str(serializer.get_url(record)),
                           str(reverse('call:record_detail', args=[record.id],
                                       request=request)))
+
+
+class CallRecordValuesSerializerTestCase(TestCase):
+    def setUp(self):
+        call = Call.objects.create(id=1, source='10123456789',
+                                   destination='0012345678')
+        now = timezone.now()
+        CallRecord.objects.create(id=1, call=call, record_type='start',
+                                  timestamp=now.replace(microsecond=999999))
+        CallRecord.objects.create(id=20, call=call, record_type='end',
+                                  timestamp=now)
+        request = RequestFactory().get('/api/call/records/')
+        self.context = {'request': request}
+
+    def test_matches_call_record_serializer(self):
+        serializer = CallRecordValuesSerializer(self.context)
+        queryset = CallRecord.objects.order_by('id')
+
+        rows = [serializer.to_representation(row)
+                for row in serializer.get_queryset(queryset)]
+
+        data = CallRecordSerializer(queryset, many=True,
+                                    context=self.context).data
+        self.assertEquals(JSONRenderer().render(rows),
+                          JSONRenderer().render(data))
+
+    def test_query_count(self):
+        serializer = CallRecordValuesSerializer(self.context)
+
+        with self.assertNumQueries(1):
+            rows = list(serializer.get_queryset(CallRecord.objects.all()))
+        self.assertEquals(len(rows), 2)
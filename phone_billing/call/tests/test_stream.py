@@ -0,0 +1,106 @@
+import gzip
+import io
+
+from django.test import TestCase
+
+from ..models import CallRecord
+from ..stream import (LineTooLong, decode_stream, ingest_lines, parse_lines,
+                      read_lines)
+
+
+START_LINE = (b'{"id": 1, "type": "start", "timestamp": 1513091233,'
+              b' "call_id": 1, "source": "00123456789",'
+              b' "destination": "10123456789"}\n')
+END_LINE = (b'{"id": 2, "type": "end", "timestamp": 1513092233,'
+            b' "call_id": 1}\n')
+
+
+class DecodeStreamTestCase(TestCase):
+    def test_identity(self):
+        stream = io.BytesIO(START_LINE)
+
+        self.assertIs(decode_stream(stream), stream)
+
+    def test_gzip(self):
+        stream = io.BytesIO(gzip.compress(START_LINE + END_LINE))
+
+        self.assertEquals(list(decode_stream(stream, 'gzip')),
+                          [START_LINE, END_LINE])
+
+
+class ReadLinesTestCase(TestCase):
+    def test_splits_lines_across_chunks(self):
+        stream = io.BytesIO(START_LINE + b'\n' + END_LINE.rstrip())
+
+        self.assertEquals(list(read_lines(stream, 1000, chunk_size=7)),
+                          [START_LINE.rstrip(), b'', END_LINE.rstrip()])
+
+    def test_rejects_long_lines(self):
+        stream = io.BytesIO(START_LINE + b'x' * 1000)
+        lines = read_lines(stream, 200, chunk_size=64)
+
+        self.assertEquals(next(lines), START_LINE.rstrip())
+        with self.assertRaises(LineTooLong):
+            next(lines)
+
+    def test_rejects_long_lines_without_reading_them(self):
+        stream = io.BytesIO(b'x' * 10000)
+
+        with self.assertRaises(LineTooLong):
+            list(read_lines(stream, 100, chunk_size=64))
+        self.assertEquals(stream.tell(), 128)
+
+
+class ParseLinesTestCase(TestCase):
+    def test_skips_blank_lines_keeping_line_numbers(self):
+        parsed = list(parse_lines([START_LINE, b'\n', END_LINE]))
+
+        self.assertEquals([number for number, _, _ in parsed], [1, 3])
+        self.assertEquals(parsed[0][1]['id'], 1)
+        self.assertIsNone(parsed[0][2])
+
+    def test_reports_invalid_json(self):
+        number, item, errors = next(parse_lines([b'{"id": 1']))
+
+        self.assertEquals(number, 1)
+        self.assertIsNone(item)
+        self.assertIn('Invalid JSON', errors['non_field_errors'][0])
+
+
+class IngestLinesTestCase(TestCase):
+    def test_reports_status_per_line(self):
+        results = list(ingest_lines([START_LINE, b'test\n', END_LINE], 2))
+
+        self.assertEquals([result['line'] for result in results], [1, 2, 3])
+        self.assertEquals([result['status'] for result in results],
+                          ['created', 'error', 'created'])
+        self.assertEquals(CallRecord.objects.count(), 2)
+
+    def test_persists_in_chunks(self):
+        lines = ingest_lines([START_LINE, END_LINE], 1)
+
+        next(lines)
+        self.assertEquals(CallRecord.objects.count(), 1)
+
+        next(lines)
+        self.assertEquals(CallRecord.objects.count(), 2)
+
+    def test_long_line(self):
+        lines = read_lines(io.BytesIO(START_LINE + b'x' * 1000), 200)
+
+        results = list(ingest_lines(lines, 10))
+
+        self.assertEquals(results[-1]['line'], 2)
+        self.assertEquals(results[-1]['errors']['non_field_errors'][0],
+                          'Lines can not be longer than 200 bytes.')
+        self.assertEquals(CallRecord.objects.count(), 1)
+
+    def test_malformed_compressed_body(self):
+        body = gzip.compress(START_LINE + END_LINE)[:-10]
+        lines = decode_stream(io.BytesIO(body), 'gzip')
+
+        results = list(ingest_lines(lines, 10))
+
+        self.assertEquals(results[-1]['status'], 'error')
+        self.assertEquals(results[-1]['errors']['non_field_errors'][0],
+                          'Malformed compressed body.')
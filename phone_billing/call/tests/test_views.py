@@ -1,10 +1,17 @@
+import base64
+import gzip
 import json
+from datetime import timedelta
 from model_mommy import mommy
 
+from django.db import transaction
+from django.test import override_settings
 from django.urls import reverse
 from django.utils import timezone
 from rest_framework.test import APITestCase, APIRequestFactory
 
+from ...bill.models import BillingTask
+
 from ..models import Call, CallRecord
 from ..serializers import CallRecordSerializer
 
@@ -35,12 +42,13 @@ class CallRecordsListCreateTestCase(SerializerContextTestCase):
         response = self.client.get(self.url)
 
         self.assertEquals(response.status_code, 200)
+        self.assertIsNone(response.data['next'])
 
         for record in records:
             serialized_record = CallRecordSerializer(
                 record, context=self.serializer_context
             ).data
-            self.assertIn(serialized_record, response.data)
+            self.assertIn(serialized_record, response.data['results'])
 
     def test_post_creates_a_new_record(self):
         self.assertEquals(Call.objects.count(), 0)
@@ -75,6 +83,244 @@ class CallRecordsListCreateTestCase(SerializerContextTestCase):
         record = CallRecord.objects.get()
         self.assertEquals(record.timestamp, right_now.replace(microsecond=0))
 
+    def test_post_query_count(self):
+        end_post_data = {'id': 2, 'type': 'end', 'call_id': 1,
+                         'timestamp': timezone.now().timestamp() + 60}
+
+        # A savepoint, the upsert, the billed periods lookup, the call
+        # timestamps and bill records syncs, the billing enqueue and the
+        # savepoint release.
+        for data in (self.start_record_post_data, end_post_data,
+                     self.start_record_post_data):
+            with self.assertNumQueries(7):
+                response = self.client.post(self.url, data)
+            self.assertEquals(response.status_code, 201)
+
+        self.assertEquals(BillingTask.objects.get().call_id, 1)
+        self.assertEquals(response['Location'], response.data['url'])
+
+    def test_post_rejects_a_repeated_type(self):
+        self.client.post(self.url, self.start_record_post_data)
+        post_data_copy = self.start_record_post_data.copy()
+        post_data_copy['id'] = 2
+        post_data_copy['source'] = '20123456789'
+
+        response = self.client.post(self.url, post_data_copy)
+
+        self.assertEquals(response.status_code, 400)
+        self.assertEquals(response.data['non_field_errors'][0],
+                          'This call_id already has this type of call'
+                          ' record.')
+        self.assertEquals(CallRecord.objects.get().id, 1)
+        self.assertEquals(Call.objects.get().source, '00123456789')
+
+    def test_post_requires_an_existing_call(self):
+        response = self.client.post(self.url, {
+            'id': 2, 'type': 'end', 'call_id': 1,
+            'timestamp': timezone.now().timestamp()})
+
+        self.assertEquals(response.status_code, 400)
+        self.assertEquals(response.data['call_id'][0],
+                          'Invalid pk "1" - object does not exist.')
+        self.assertEquals(CallRecord.objects.count(), 0)
+
+    def test_post_moving_a_record_syncs_both_calls(self):
+        now = timezone.now().replace(microsecond=0)
+        self.client.post(self.url, dict(self.start_record_post_data,
+                                        timestamp=now.timestamp()))
+        post_data_copy = dict(self.start_record_post_data, call_id=2,
+                              timestamp=now.timestamp())
+
+        self.client.post(self.url, post_data_copy)
+
+        self.assertIsNone(Call.objects.get(id=1).started_at)
+        self.assertEquals(Call.objects.get(id=2).started_at, now)
+
+
+@override_settings(CALL_RECORDS_PAGE_SIZE=2, CALL_RECORDS_MAX_PAGE_SIZE=3)
+class CallRecordsPaginationTestCase(APITestCase):
+    def setUp(self):
+        self.url = reverse('call:records')
+        now = timezone.now()
+        # Records 3 and 4 share a timestamp and straddle a page boundary.
+        timestamps = [now, now - timedelta(minutes=2), now - timedelta(
+            minutes=1), now - timedelta(minutes=1), now + timedelta(minutes=1)]
+        for id, timestamp in enumerate(timestamps, start=1):
+            mommy.make(CallRecord, id=id, timestamp=timestamp,
+                       record_type='start', call__id=id)
+
+    def get_ids(self, response):
+        return [record['id'] for record in response.data['results']]
+
+    def test_pages_are_ordered_by_timestamp_and_id(self):
+        ids = []
+        url = self.url
+        while url:
+            response = self.client.get(url)
+            self.assertEquals(response.status_code, 200)
+            ids.extend(self.get_ids(response))
+            url = response.data['next']
+
+        self.assertEquals(ids, [2, 3, 4, 1, 5])
+
+    def test_page_size(self):
+        response = self.client.get(self.url, {'page_size': 1})
+        self.assertEquals(self.get_ids(response), [2])
+
+        response = self.client.get(self.url, {'page_size': 10})
+        self.assertEquals(self.get_ids(response), [2, 3, 4])
+
+    def test_next_link_keeps_page_size(self):
+        response = self.client.get(self.url, {'page_size': 3})
+        response = self.client.get(response.data['next'])
+
+        self.assertEquals(self.get_ids(response), [1, 5])
+        self.assertIsNone(response.data['next'])
+
+    def test_invalid_cursor(self):
+        response = self.client.get(self.url, {'cursor': 'invalid'})
+
+        self.assertEquals(response.status_code, 404)
+
+    def test_out_of_range_cursor(self):
+        for position in ([10 ** 20, 1], [float('inf'), 1], [1, float('inf')]):
+            cursor = base64.urlsafe_b64encode(
+                json.dumps(position).encode()).decode()
+
+            response = self.client.get(self.url, {'cursor': cursor})
+
+            self.assertEquals(response.status_code, 404)
+
+    def test_page_query_count(self):
+        next_url = self.client.get(self.url).data['next']
+
+        with self.assertNumQueries(1):
+            response = self.client.get(next_url)
+        self.assertEquals(len(response.data['results']), 2)
+
+    @override_settings(STREAMING_RESPONSE_CHUNK_SIZE=2,
+                       CALL_RECORDS_MAX_PAGE_SIZE=10)
+    def test_stream_every_record(self):
+        response = self.client.get(self.url, {'page_size': 10})
+        streamed = self.client.get(self.url, {'stream': 'true'})
+
+        self.assertEquals(streamed.status_code, 200)
+        self.assertTrue(streamed.streaming)
+        results = response.content.split(b'"results":', 1)[1][:-1]
+        self.assertEquals(b''.join(streamed.streaming_content), results)
+
+    def test_stream_after_cursor(self):
+        next_url = self.client.get(self.url).data['next']
+
+        streamed = self.client.get(next_url + '&stream=true')
+
+        records = json.loads(b''.join(streamed.streaming_content))
+        self.assertEquals([record['id'] for record in records], [4, 1, 5])
+
+
+class CallRecordsBatchCreateTestCase(APITestCase):
+    def setUp(self):
+        self.url = reverse('call:records_batch')
+        self.post_data = [{
+            'id': 1,
+            'type': 'start',
+            'timestamp': timezone.now().timestamp(),
+            'call_id': 1,
+            'source': '00123456789',
+            'destination': '10123456789'
+        }, {
+            'id': 2,
+            'type': 'end',
+            'timestamp': timezone.now().timestamp(),
+        }]
+
+    def test_post_responds_results_per_record(self):
+        response = self.client.post(self.url, self.post_data, format='json')
+
+        self.assertEquals(response.status_code, 200)
+        self.assertEquals(response.data[0],
+                          {'index': 0, 'id': 1, 'status': 'created'})
+        self.assertEquals(response.data[1]['status'], 'error')
+        self.assertIn('call_id', response.data[1]['errors'])
+
+        self.assertEquals(CallRecord.objects.count(), 1)
+
+    def test_post_requires_a_list(self):
+        response = self.client.post(self.url, self.post_data[0],
+                                    format='json')
+
+        self.assertEquals(response.status_code, 400)
+        self.assertEquals(response.data['non_field_errors'][0],
+                          'Expected a list of call records.')
+
+    def test_post_limits_batch_size(self):
+        with self.settings(CALL_RECORDS_BATCH_MAX_SIZE=1):
+            response = self.client.post(self.url, self.post_data,
+                                        format='json')
+
+        self.assertEquals(response.status_code, 400)
+        self.assertEquals(CallRecord.objects.count(), 0)
+
+
+class CallRecordsStreamCreateTestCase(APITestCase):
+    def setUp(self):
+        self.url = reverse('call:records_stream')
+        self.body = (
+            b'{"id": 1, "type": "start", "timestamp": 1513091233,'
+            b' "call_id": 1, "source": "00123456789",'
+            b' "destination": "10123456789"}\n'
+            b'{"id": 2, "type": "end", "timestamp": 1513092233,'
+            b' "call_id": 1}\n'
+        )
+
+    def read_results(self, response):
+        content = b''.join(response.streaming_content)
+        return [json.loads(line) for line in content.splitlines()]
+
+    def test_post_streams_results_per_line(self):
+        response = self.client.post(self.url, self.body,
+                                    content_type='application/x-ndjson')
+
+        self.assertEquals(response.status_code, 200)
+        self.assertEquals(response['Content-Type'], 'application/x-ndjson')
+        self.assertEquals(self.read_results(response), [
+            {'line': 1, 'id': 1, 'status': 'created'},
+            {'line': 2, 'id': 2, 'status': 'created'},
+        ])
+        self.assertEquals(CallRecord.objects.count(), 2)
+
+    def test_post_gzip_body(self):
+        response = self.client.post(self.url, gzip.compress(self.body),
+                                    content_type='application/x-ndjson',
+                                    HTTP_CONTENT_ENCODING='gzip')
+
+        self.assertEquals(response.status_code, 200)
+        self.assertEquals(len(self.read_results(response)), 2)
+        self.assertEquals(CallRecord.objects.count(), 2)
+
+    @override_settings(CALL_RECORDS_STREAM_MAX_LINE_SIZE=100)
+    def test_post_first_line_too_long(self):
+        response = self.client.post(self.url, self.body,
+                                    content_type='application/x-ndjson')
+
+        self.assertEquals(response.status_code, 413)
+        self.assertEquals(CallRecord.objects.count(), 0)
+
+    def test_post_malformed_gzip_body(self):
+        response = self.client.post(self.url, b'not gzip',
+                                    content_type='application/x-ndjson',
+                                    HTTP_CONTENT_ENCODING='gzip')
+
+        self.assertEquals(response.status_code, 400)
+
+    def test_post_unsupported_content_encoding(self):
+        response = self.client.post(self.url, self.body,
+                                    content_type='application/x-ndjson',
+                                    HTTP_CONTENT_ENCODING='br')
+
+        self.assertEquals(response.status_code, 415)
+        self.assertEquals(CallRecord.objects.count(), 0)
+
 
 class CallRecordRetrieveUpdateTestCase(SerializerContextTestCase):
     def setUp(self):
@@ -93,6 +339,55 @@ class CallRecordRetrieveUpdateTestCase(SerializerContextTestCase):
         ).data
         self.assertEquals(serialized_record, response.data)
 
+    def test_get_not_modified(self):
+        etag = self.client.get(self.url)['ETag']
+
+        with self.assertNumQueries(1):
+            response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEquals(response.status_code, 304)
+        self.assertEquals(response['ETag'], etag)
+
+    # Rows keep the transaction id that wrote them, so changes are made in a
+    # savepoint to be told apart from the ones made by setUp.
+    def test_get_changed_record(self):
+        etag = self.client.get(self.url)['ETag']
+        with transaction.atomic():
+            Call.objects.filter(id=self.record.call_id).update(
+                destination='10987654321')
+
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEquals(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertEquals(response.data['destination'], '10987654321')
+
+    def test_put_moving_a_record_syncs_both_calls(self):
+        end = timezone.now().replace(microsecond=0)
+        start = end - timedelta(minutes=5)
+        for call_id in (1001, 1002):
+            Call.objects.create(id=call_id, source='00123456789',
+                                destination='10123456789')
+        CallRecord.objects.create(id=1010, call_id=1001, record_type='start',
+                                  timestamp=start)
+        CallRecord.objects.create(id=1011, call_id=1001, record_type='end',
+                                  timestamp=end)
+        CallRecord.objects.create(id=1020, call_id=1002, record_type='start',
+                                  timestamp=start)
+
+        response = self.client.put(
+            reverse('call:record_detail', args=[1011]),
+            {'id': 1011, 'type': 'end', 'timestamp': end.timestamp(),
+             'call_id': 1002})
+
+        self.assertEquals(response.status_code, 200)
+        first_call = Call.objects.get(id=1001)
+        second_call = Call.objects.get(id=1002)
+        self.assertIsNone(first_call.ended_at)
+        self.assertIsNone(first_call.duration)
+        self.assertEquals(second_call.ended_at, end)
+        self.assertEquals(second_call.duration, timedelta(minutes=5))
+
     def test_put_should_update_record(self):
         put_data = {
             'id': self.record.id,
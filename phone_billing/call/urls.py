@@ -1,10 +1,15 @@
 from django.urls import path
 
 
-from .views import CallRecordsListCreate, CallRecordRetrieveUpdate
+from .views import (CallRecordsListCreate, CallRecordsBatchCreate,
+                    CallRecordsStreamCreate, CallRecordRetrieveUpdate)
 
 urlpatterns = [
     path('records/', CallRecordsListCreate.as_view(), name='records'),
+    path('records/batch/', CallRecordsBatchCreate.as_view(),
+         name='records_batch'),
+    path('records/stream/', CallRecordsStreamCreate.as_view(),
+         name='records_stream'),
     path('record/<int:pk>/', CallRecordRetrieveUpdate.as_view(),
          name='record_detail'),
 ]
@@ -1,7 +1,31 @@
-from rest_framework.generics import ListCreateAPIView, RetrieveUpdateAPIView
+import io
+import json
+from itertools import chain
 
-from .models import CallRecord
-from .serializers import CallRecordSerializer
+from django.conf import settings
+from django.db.models.expressions import RawSQL
+from django.http import StreamingHttpResponse
+from rest_framework.generics import (ListCreateAPIView, RetrieveUpdateAPIView,
+                                     get_object_or_404)
+from rest_framework.response import Response
+from rest_framework.status import (HTTP_201_CREATED, HTTP_400_BAD_REQUEST,
+                                   HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+                                   HTTP_415_UNSUPPORTED_MEDIA_TYPE)
+from rest_framework.views import APIView
+
+from ..conditional import (get_etag, get_not_modified_response,
+                           set_validators)
+from ..streaming import (get_streaming_response, is_stream_requested,
+                         stream_json_array)
+from ..tracing import span
+
+from .batch import CallRecordBatch
+from .models import CALL_RECORD_VERSION_SQL, CallRecord
+from .pagination import CallRecordPagination
+from .serializers import (CallRecordSerializer, CallRecordUpsertSerializer,
+                          CallRecordValuesSerializer)
+from .stream import (CONTENT_ENCODINGS, MALFORMED_BODY_ERRORS, LineTooLong,
+                     decode_stream, ingest_lines, read_lines)
 
 
 class CallRecordMixin:
@@ -15,15 +39,118 @@ class CallRecordMixin:
 
 
 class CallRecordsListCreate(CallRecordMixin, ListCreateAPIView):
-    def get_serializer(self, *args, **kwargs):
-        if 'data' in kwargs and 'id' in kwargs['data']:
-            id = kwargs['data']['id']
-            qs = self.get_queryset().filter(id=id)
-            if qs.exists():
-                kwargs['instance'] = qs.get()
+    queryset = CallRecord.objects.select_related('call')
+    pagination_class = CallRecordPagination
+
+    def list(self, request, *args, **kwargs):
+        serializer = CallRecordValuesSerializer(self.get_serializer_context())
+        queryset = serializer.get_queryset(
+            self.filter_queryset(self.get_queryset()))
+
+        if is_stream_requested(request):
+            # Streams every record after the cursor, read through a
+            # server-side cursor instead of being loaded at once.
+            rows = self.paginator.filter_queryset(queryset, request).iterator(
+                chunk_size=settings.STREAMING_RESPONSE_CHUNK_SIZE)
+            return get_streaming_response(stream_json_array(
+                rows, serializer.to_representation))
+
+        page = self.paginate_queryset(queryset)
+        return self.get_paginated_response(
+            [serializer.to_representation(row) for row in page])
 
-        return super().get_serializer(*args, **kwargs)
+    # Creates the record, or updates it if one with the same id exists.
+    def create(self, request, *args, **kwargs):
+        serializer = CallRecordUpsertSerializer(data=request.data)
+        with span('ingest.validate'):
+            serializer.is_valid(raise_exception=True)
+        row = serializer.save()
+
+        with span('ingest.render'):
+            data = CallRecordValuesSerializer(
+                self.get_serializer_context()).to_representation(row)
+        return Response(data, status=HTTP_201_CREATED,
+                        headers=self.get_success_headers(data))
 
 
 class CallRecordRetrieveUpdate(CallRecordMixin, RetrieveUpdateAPIView):
-    pass
+    def retrieve(self, request, *args, **kwargs):
+        serializer = CallRecordValuesSerializer(self.get_serializer_context())
+        queryset = serializer.get_queryset(
+            self.filter_queryset(self.get_queryset()))
+        lookup_url_kwarg = self.lookup_url_kwarg or self.lookup_field
+        queryset = queryset.annotate(
+            version=RawSQL(CALL_RECORD_VERSION_SQL, ()))
+        row = get_object_or_404(
+            queryset, **{self.lookup_field: kwargs[lookup_url_kwarg]})
+
+        # Records are rendered with absolute URLs, which the ETag depends on.
+        etag = get_etag(request, serializer.url_prefix, row['id'],
+                        row['version'])
+        response = get_not_modified_response(request, etag)
+        if response is not None:
+            return response
+
+        return set_validators(
+            Response(serializer.to_representation(row)), etag)
+
+
+class CallRecordsBatchCreate(APIView):
+    def validate_batch_data(self, data):
+        if not isinstance(data, list):
+            return 'Expected a list of call records.'
+
+        max_size = settings.CALL_RECORDS_BATCH_MAX_SIZE
+        if len(data) > max_size:
+            return f'A batch can not have more than {max_size} call records.'
+
+    def post(self, request, format=None):
+        error = self.validate_batch_data(request.data)
+        if error:
+            return Response({'non_field_errors': [error]},
+                            status=HTTP_400_BAD_REQUEST)
+
+        batch = CallRecordBatch(request.data)
+        with span('ingest_batch.validate', records=len(request.data)):
+            batch.validate()
+        with span('ingest_batch.save'):
+            results = batch.save()
+        return Response(results)
+
+
+class CallRecordsStreamCreate(APIView):
+    def stream_results(self, lines):
+        chunk_size = settings.CALL_RECORDS_STREAM_CHUNK_SIZE
+        for result in ingest_lines(lines, chunk_size):
+            yield json.dumps(result) + '\n'
+
+    def post(self, request, format=None):
+        content_encoding = request.META.get('HTTP_CONTENT_ENCODING',
+                                            'identity')
+        if content_encoding not in CONTENT_ENCODINGS:
+            return Response(
+                {'non_field_errors': [
+                    f'Unsupported Content-Encoding "{content_encoding}".']},
+                status=HTTP_415_UNSUPPORTED_MEDIA_TYPE)
+
+        lines = read_lines(
+            decode_stream(request.stream or io.BytesIO(), content_encoding),
+            settings.CALL_RECORDS_STREAM_MAX_LINE_SIZE)
+
+        # The first line is read before responding, so bodies that are not
+        # line-delimited records at all are rejected with an error status.
+        # Later errors are reported as the results of the lines.
+        try:
+            first_line = next(lines, None)
+        except LineTooLong as exc:
+            return Response({'non_field_errors': [str(exc)]},
+                            status=HTTP_413_REQUEST_ENTITY_TOO_LARGE)
+        except MALFORMED_BODY_ERRORS:
+            return Response(
+                {'non_field_errors': ['Malformed compressed body.']},
+                status=HTTP_400_BAD_REQUEST)
+        if first_line is not None:
+            lines = chain([first_line], lines)
+
+        return StreamingHttpResponse(self.stream_results(lines),
+                                     content_type='application/x-ndjson')
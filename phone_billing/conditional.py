@@ -0,0 +1,37 @@
+import hashlib
+
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
+
+
+def get_etag(request, *version):
+    """Returns a strong ETag for a resource from a version stamp of it.
+
+    The renderer is part of the tag, as the same version of a resource is
+    rendered differently as JSON or as the browsable API.
+    """
+    key = ':'.join(str(part) for part in
+                   (request.accepted_renderer.format, *version))
+    return quote_etag(hashlib.sha1(key.encode()).hexdigest())
+
+
+def set_validators(response, etag, last_modified=None):
+    response['ETag'] = etag
+    if last_modified is not None:
+        response['Last-Modified'] = http_date(last_modified.timestamp())
+    return response
+
+
+def get_not_modified_response(request, etag, last_modified=None):
+    """Answers the conditional headers of a request before rendering it.
+
+    Returns a 304 Not Modified (or 412 Precondition Failed) response when the
+    headers match, or None when the resource has to be sent.
+    """
+    timestamp = (int(last_modified.timestamp())
+                 if last_modified is not None else None)
+    response = get_conditional_response(request, etag=etag,
+                                        last_modified=timestamp)
+    if response is not None:
+        set_validators(response, etag, last_modified)
+    return response
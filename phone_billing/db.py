@@ -0,0 +1,76 @@
+from django.db import connection
+
+
+def get_columns(model, fields):
+    return [model._meta.get_field(field).column for field in fields]
+
+
+def bulk_insert(model, fields, rows, on_conflict='', page_size=1000):
+    table = connection.ops.quote_name(model._meta.db_table)
+    columns = ', '.join(connection.ops.quote_name(column)
+                        for column in get_columns(model, fields))
+    template = '({})'.format(', '.join(['%s'] * len(fields)))
+
+    with connection.cursor() as cursor:
+        for offset in range(0, len(rows), page_size):
+            page = rows[offset:offset + page_size]
+            values = ', '.join(cursor.mogrify(template, row).decode()
+                               for row in page)
+            cursor.execute(f'INSERT INTO {table} ({columns}) VALUES {values}'
+                           f' {on_conflict}')
+
+
+def bulk_upsert(model, fields, rows, conflict_fields=('id',),
+                update_fields=None, page_size=1000):
+    if update_fields is None:
+        update_fields = [f for f in fields if f not in conflict_fields]
+
+    quote = connection.ops.quote_name
+    conflict = ', '.join(quote(column) for column in
+                         get_columns(model, conflict_fields))
+    updates = ', '.join(f'{quote(column)} = EXCLUDED.{quote(column)}'
+                        for column in get_columns(model, update_fields))
+
+    on_conflict = f'ON CONFLICT ({conflict}) DO UPDATE SET {updates}'
+    bulk_insert(model, fields, rows, on_conflict, page_size)
+
+
+def bulk_insert_ignore(model, fields, rows, conflict_fields=('id',),
+                       page_size=1000):
+    quote = connection.ops.quote_name
+    conflict = ', '.join(quote(column) for column in
+                         get_columns(model, conflict_fields))
+
+    on_conflict = f'ON CONFLICT ({conflict}) DO NOTHING'
+    bulk_insert(model, fields, rows, on_conflict, page_size)
+
+
+def bulk_update(model, key_fields, fields, rows, page_size=1000):
+    """Updates fields of the rows matching the key fields, given as rows of
+    key field values followed by field values."""
+    quote = connection.ops.quote_name
+    table = quote(model._meta.db_table)
+    all_fields = (*key_fields, *fields)
+    columns = get_columns(model, all_fields)
+    # Values are cast to the column types, as NULL would not be otherwise.
+    new_values = [f'new.{quote(column)}::'
+                  f'{model._meta.get_field(field).db_type(connection)}'
+                  for field, column in zip(all_fields, columns)]
+    keys = len(key_fields)
+    where = ' AND '.join(f'{table}.{quote(column)} = {value}'
+                         for column, value in zip(columns[:keys],
+                                                  new_values[:keys]))
+    updates = ', '.join(f'{quote(column)} = {value}'
+                        for column, value in zip(columns[keys:],
+                                                 new_values[keys:]))
+    aliases = ', '.join(quote(column) for column in columns)
+    template = '({})'.format(', '.join(['%s'] * len(all_fields)))
+
+    with connection.cursor() as cursor:
+        for offset in range(0, len(rows), page_size):
+            page = rows[offset:offset + page_size]
+            values = ', '.join(cursor.mogrify(template, row).decode()
+                               for row in page)
+            cursor.execute(f'UPDATE {table} SET {updates}'
+                           f' FROM (VALUES {values}) AS new ({aliases})'
+                           f' WHERE {where}')
@@ -0,0 +1,355 @@
+import atexit
+import glob
+import json
+import os
+from bisect import bisect_left
+from threading import Lock
+from time import monotonic, perf_counter
+from uuid import uuid4
+
+from django.conf import settings
+from django.db import connection
+from django.http import HttpResponse, HttpResponseForbidden
+from django.utils.crypto import constant_time_compare
+
+
+PROMETHEUS_CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+UNMATCHED_ENDPOINT = 'unmatched'
+
+
+def escape_label_value(value):
+    return (str(value).replace('\\', '\\\\').replace('"', '\\"')
+            .replace('\n', '\\n'))
+
+
+def format_labels(names, values):
+    return ','.join(f'{name}="{escape_label_value(value)}"'
+                    for name, value in zip(names, values))
+
+
+def format_value(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Histogram:
+    """Observations counted in buckets per set of labels, kept in memory."""
+
+    def __init__(self, name, documentation, label_names, buckets):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(label_names)
+        self.buckets = tuple(sorted(buckets))
+        self.counts = {}
+        self.sums = {}
+        self.lock = Lock()
+
+    def observe(self, label_values, value):
+        index = bisect_left(self.buckets, value)
+        with self.lock:
+            counts = self.counts.get(label_values)
+            if counts is None:
+                counts = self.counts[label_values] = \
+                    [0] * (len(self.buckets) + 1)
+                self.sums[label_values] = 0
+            counts[index] += 1
+            self.sums[label_values] += value
+
+    def clear(self):
+        with self.lock:
+            self.counts.clear()
+            self.sums.clear()
+
+    def get_series(self):
+        """Returns the bucket counts and sum of each set of labels."""
+        with self.lock:
+            return {label_values: (list(counts), self.sums[label_values])
+                    for label_values, counts in self.counts.items()}
+
+    def merge_series(self, series, other):
+        """Adds the series of another process to series, in place."""
+        for label_values, (counts, total) in other.items():
+            if len(counts) != len(self.buckets) + 1:
+                # Written with other buckets, which can not be added up.
+                continue
+            if label_values in series:
+                own_counts, own_total = series[label_values]
+                counts = [a + b for a, b in zip(own_counts, counts)]
+                total += own_total
+            series[label_values] = (counts, total)
+
+    def dump_series(self, series):
+        return [[list(label_values), counts, total]
+                for label_values, (counts, total) in series.items()]
+
+    def load_series(self, rows):
+        return {tuple(label_values): (counts, total)
+                for label_values, counts, total in rows}
+
+    def render(self, series=None):
+        if series is None:
+            series = self.get_series()
+        series = sorted((label_values, counts, total)
+                        for label_values, (counts, total) in series.items())
+
+        bounds = [format_value(bound) for bound in self.buckets] + ['+Inf']
+        lines = [f'# HELP {self.name} {self.documentation}',
+                 f'# TYPE {self.name} histogram']
+        for label_values, counts, total in series:
+            labels = format_labels(self.label_names, label_values)
+            cumulative_count = 0
+            for bound, count in zip(bounds, counts):
+                cumulative_count += count
+                lines.append(f'{self.name}_bucket{{{labels},le="{bound}"}}'
+                             f' {cumulative_count}')
+            lines.append(f'{self.name}_sum{{{labels}}} {format_value(total)}')
+            lines.append(f'{self.name}_count{{{labels}}} {cumulative_count}')
+        return '\n'.join(lines) + '\n'
+
+
+class Counter:
+    """Counts per set of labels, kept in memory."""
+
+    def __init__(self, name, documentation, label_names):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(label_names)
+        self.counts = {}
+        self.lock = Lock()
+
+    def inc(self, label_values, amount=1):
+        with self.lock:
+            self.counts[label_values] = \
+                self.counts.get(label_values, 0) + amount
+
+    def clear(self):
+        with self.lock:
+            self.counts.clear()
+
+    def get_series(self):
+        with self.lock:
+            return dict(self.counts)
+
+    def merge_series(self, series, other):
+        """Adds the series of another process to series, in place."""
+        for label_values, count in other.items():
+            series[label_values] = series.get(label_values, 0) + count
+
+    def dump_series(self, series):
+        return [[list(label_values), count]
+                for label_values, count in series.items()]
+
+    def load_series(self, rows):
+        return {tuple(label_values): count for label_values, count in rows}
+
+    def render(self, series=None):
+        if series is None:
+            series = self.get_series()
+
+        lines = [f'# HELP {self.name} {self.documentation}',
+                 f'# TYPE {self.name} counter']
+        for label_values, count in sorted(series.items()):
+            labels = format_labels(self.label_names, label_values)
+            lines.append(f'{self.name}{{{labels}}} {count}')
+        return '\n'.join(lines) + '\n'
+
+
+class RequestMetrics:
+    """Request metrics of a process, added up with the other processes.
+
+    Each process writes its metrics to a file of its own in METRICS_DIR, at
+    most every METRICS_FLUSH_INTERVAL seconds and when it exits, and the
+    metrics of every file are added up when read. Files of processes that
+    exited are kept, so the totals never go down as workers restart.
+    """
+
+    label_names = ('endpoint', 'method')
+
+    def __init__(self):
+        self.request_duration = Histogram(
+            'phone_billing_request_duration_seconds',
+            'Time spent handling requests, database time included.',
+            self.label_names, settings.METRICS_DURATION_BUCKETS)
+        self.db_duration = Histogram(
+            'phone_billing_db_duration_seconds',
+            'Time spent in database queries per request.',
+            self.label_names, settings.METRICS_DURATION_BUCKETS)
+        self.db_queries = Histogram(
+            'phone_billing_db_queries',
+            'Database queries per request.',
+            self.label_names, settings.METRICS_QUERY_BUCKETS)
+        self.bill_cache_lookups = Counter(
+            'phone_billing_bill_cache_lookups_total',
+            'Lookups of bills of closed periods in the bills cache.',
+            ('result',))
+        self.lock = Lock()
+        self.reset_process()
+
+    def reset_process(self):
+        # Forked processes start over, with files of their own.
+        self.pid = os.getpid()
+        self.path = None
+        self.flushed_at = monotonic()
+        self.pending = False
+
+    @property
+    def metrics(self):
+        return (self.request_duration, self.db_duration, self.db_queries,
+                self.bill_cache_lookups)
+
+    def observe(self, endpoint, method, duration, queries):
+        self.check_process()
+
+        label_values = (endpoint, method)
+        self.request_duration.observe(label_values, duration)
+        self.db_duration.observe(label_values, queries.duration)
+        self.db_queries.observe(label_values, queries.count)
+
+        self.changed()
+
+    def count_bill_cache_lookup(self, hit):
+        self.check_process()
+        self.bill_cache_lookups.inc(('hit' if hit else 'miss',))
+        self.changed()
+
+    def check_process(self):
+        if os.getpid() != self.pid:
+            self.clear()
+
+    def changed(self):
+        self.pending = True
+        if monotonic() - self.flushed_at >= settings.METRICS_FLUSH_INTERVAL:
+            self.flush()
+
+    def clear(self):
+        for metric in self.metrics:
+            metric.clear()
+        self.reset_process()
+
+    def get_path(self):
+        if self.path is None:
+            os.makedirs(settings.METRICS_DIR, exist_ok=True)
+            self.path = os.path.join(
+                settings.METRICS_DIR,
+                f'metrics-{self.pid}-{uuid4().hex[:8]}.json')
+        return self.path
+
+    def flush(self):
+        if not settings.METRICS_DIR or not self.pending:
+            return
+
+        with self.lock:
+            self.pending = False
+            self.flushed_at = monotonic()
+            data = {metric.name: metric.dump_series(metric.get_series())
+                    for metric in self.metrics}
+            path = self.get_path()
+            with open(f'{path}.tmp', 'w') as file:
+                json.dump(data, file)
+            os.replace(f'{path}.tmp', path)
+
+    def read_other_processes(self):
+        if not settings.METRICS_DIR:
+            return []
+
+        processes = []
+        pattern = os.path.join(glob.escape(settings.METRICS_DIR),
+                               'metrics-*.json')
+        for path in glob.glob(pattern):
+            if path == self.path:
+                continue
+            try:
+                with open(path) as file:
+                    processes.append(json.load(file))
+            except (OSError, ValueError):
+                continue
+        return processes
+
+    def get_series(self, metric, processes=None):
+        """Returns the series of a metric added up over every process."""
+        if processes is None:
+            processes = self.read_other_processes()
+
+        series = metric.get_series()
+        for data in processes:
+            metric.merge_series(
+                series, metric.load_series(data.get(metric.name, [])))
+        return series
+
+    def render(self):
+        processes = self.read_other_processes()
+        return ''.join(metric.render(self.get_series(metric, processes))
+                       for metric in self.metrics)
+
+
+request_metrics = RequestMetrics()
+atexit.register(request_metrics.flush)
+
+
+class QueryTimer:
+    """Database execute wrapper counting and timing the queries it runs."""
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        started_at = perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.duration += perf_counter() - started_at
+            self.count += 1
+
+
+def get_endpoint(request):
+    resolver_match = getattr(request, 'resolver_match', None)
+    if resolver_match is None:
+        return UNMATCHED_ENDPOINT
+    return resolver_match.view_name
+
+
+class RequestMetricsMiddleware:
+    """Reports the queries and time spent handling every request.
+
+    The totals are sent in the X-DB-Queries and Server-Timing headers and
+    added to the request metrics histograms. Queries run while a streaming
+    response is consumed happen after the headers are sent, so only the
+    queries until the response is returned are counted.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        queries = QueryTimer()
+        started_at = perf_counter()
+        with connection.execute_wrapper(queries):
+            response = self.get_response(request)
+        duration = perf_counter() - started_at
+
+        response['X-DB-Queries'] = str(queries.count)
+        response['Server-Timing'] = (f'db;dur={queries.duration * 1000:.3f}, '
+                                     f'view;dur={duration * 1000:.3f}')
+        request_metrics.observe(get_endpoint(request), request.method,
+                                duration, queries)
+        return response
+
+
+def is_metrics_request_allowed(request):
+    authorization = request.META.get('HTTP_AUTHORIZATION', '')
+    if authorization.startswith('Bearer '):
+        token = authorization[len('Bearer '):]
+        if any(constant_time_compare(token, allowed)
+               for allowed in settings.METRICS_TOKENS):
+            return True
+
+    return request.META.get('REMOTE_ADDR') in settings.METRICS_ALLOWED_IPS
+
+
+def metrics_view(request):
+    if not is_metrics_request_allowed(request):
+        return HttpResponseForbidden()
+
+    return HttpResponse(request_metrics.render(),
+                        content_type=PROMETHEUS_CONTENT_TYPE)
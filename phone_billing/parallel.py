@@ -0,0 +1,20 @@
+from multiprocessing import Pool
+
+from django.db import connections
+
+
+def parallel_map(function, tasks, workers):
+    if workers <= 1 or len(tasks) <= 1:
+        return [function(task) for task in tasks]
+
+    # Forked workers must open their own database connections.
+    connections.close_all()
+    with Pool(workers) as pool:
+        return pool.map(function, tasks)
+
+
+def get_id_ranges(first, last, count):
+    """Splits ids from first to last into up to count (after, last] ranges."""
+    size = -(-(last - first + 1) // count)
+    return [(after, min(after + size, last))
+            for after in range(first - 1, last, size)]
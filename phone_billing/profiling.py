@@ -0,0 +1,157 @@
+import cProfile
+import glob
+import json
+import os
+import pstats
+import random
+from time import perf_counter
+from uuid import uuid4
+
+from django.conf import settings
+from django.utils import timezone
+from django.utils.crypto import constant_time_compare
+
+from .metrics import get_endpoint
+
+
+# Positions of the times in the (function, primitive calls, calls, tottime,
+# cumtime) rows of a summary.
+PROFILE_SORT_KEYS = {'tottime': 3, 'cumtime': 4}
+
+
+def get_header_key(header):
+    return 'HTTP_' + header.upper().replace('-', '_')
+
+
+def get_profiling_trigger(request):
+    token = request.META.get(get_header_key(settings.PROFILING_HEADER))
+    if token and any(constant_time_compare(token, allowed)
+                     for allowed in settings.PROFILING_TOKENS):
+        return 'header'
+
+    rate = settings.PROFILING_SAMPLE_RATE
+    if rate and random.random() < rate:
+        return 'sample'
+
+
+def save_profile(profiler, metadata, directory=None):
+    directory = directory or settings.PROFILING_DIR
+    os.makedirs(directory, exist_ok=True)
+
+    name = (f'{timezone.now():%Y%m%dT%H%M%S%f}-{os.getpid()}'
+            f'-{uuid4().hex[:8]}')
+    path = os.path.join(directory, name)
+    profiler.dump_stats(f'{path}.prof')
+    with open(f'{path}.json', 'w') as file:
+        json.dump(metadata, file, indent=2)
+    return name
+
+
+class ProfilingMiddleware:
+    """Runs requests under cProfile and saves their profiles.
+
+    Requests sending one of PROFILING_TOKENS in the PROFILING_HEADER header
+    are profiled, along with a PROFILING_SAMPLE_RATE share of all requests.
+    Each profile is written to PROFILING_DIR as a .prof file, next to a .json
+    file describing the request it was taken from. Requests are described by
+    their endpoint only, as their paths and query strings hold phone numbers.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        trigger = get_profiling_trigger(request)
+        if trigger is None:
+            return self.get_response(request)
+
+        profiler = cProfile.Profile()
+        try:
+            profiler.enable()
+        except ValueError:
+            # Another profiler is already running in this process.
+            return self.get_response(request)
+
+        started_at = perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            profiler.disable()
+        duration = perf_counter() - started_at
+
+        response['X-Profile-Id'] = save_profile(profiler, {
+            'method': request.method,
+            'endpoint': get_endpoint(request),
+            'status': response.status_code,
+            'duration': duration,
+            'trigger': trigger,
+            'profiled_at': timezone.now().isoformat(),
+            'pid': os.getpid(),
+        })
+        return response
+
+
+def read_metadata(profile_path):
+    try:
+        with open(profile_path[:-len('.prof')] + '.json') as file:
+            return json.load(file)
+    except (OSError, ValueError):
+        return {}
+
+
+class ProfileSummary:
+    """Adds up the profiles saved by ProfilingMiddleware."""
+
+    def __init__(self, directory=None, endpoint=None, sort='tottime',
+                 limit=20, stdout=None):
+        self.directory = directory or settings.PROFILING_DIR
+        self.endpoint = endpoint
+        self.sort = sort
+        self.limit = limit
+        self.stdout = stdout
+
+    def log(self, message):
+        if self.stdout:
+            self.stdout.write(message)
+
+    def get_profiles(self):
+        profiles = []
+        for path in sorted(glob.glob(os.path.join(self.directory, '*.prof'))):
+            metadata = read_metadata(path)
+            if self.endpoint and metadata.get('endpoint') != self.endpoint:
+                continue
+            profiles.append((path, metadata))
+        return profiles
+
+    def run(self):
+        profiles = self.get_profiles()
+        if not profiles:
+            self.log('No profiles found.')
+            return []
+
+        endpoints = {}
+        for _, metadata in profiles:
+            endpoint = metadata.get('endpoint', 'unknown')
+            count, duration = endpoints.get(endpoint, (0, 0))
+            endpoints[endpoint] = (count + 1,
+                                   duration + metadata.get('duration', 0))
+        self.log(f'{len(profiles)} profiles:')
+        for endpoint, (count, duration) in sorted(endpoints.items()):
+            self.log(f'  {endpoint}: {count} requests,'
+                     f' {duration / count * 1000:.1f} ms on average')
+
+        stats = pstats.Stats(*[path for path, _ in profiles])
+        key = PROFILE_SORT_KEYS[self.sort]
+        rows = sorted(((function,) + values[:4]
+                       for function, values in stats.stats.items()),
+                      key=lambda row: row[key], reverse=True)
+        rows = rows[:self.limit]
+
+        self.log(f'\n{"ncalls":>12} {"tottime":>10} {"cumtime":>10}'
+                 f'  function')
+        for function, primitive_calls, calls, tottime, cumtime in rows:
+            ncalls = (str(calls) if calls == primitive_calls
+                      else f'{calls}/{primitive_calls}')
+            self.log(f'{ncalls:>12} {tottime:>10.4f} {cumtime:>10.4f}'
+                     f'  {pstats.func_std_string(function)}')
+        return rows
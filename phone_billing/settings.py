@@ -42,6 +42,9 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'phone_billing.metrics.RequestMetricsMiddleware',
+    'phone_billing.profiling.ProfilingMiddleware',
+    'phone_billing.tracing.TracingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -106,6 +109,25 @@ AUTH_PASSWORD_VALIDATORS = [
 ]
 
 
+# Caches
+# https://docs.djangoproject.com/en/2.0/topics/cache/
+
+# Bills are invalidated by the billing workers and management commands, so
+# their cache is shared by every process through the database. Its table is
+# created by createcachetable.
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'bills': {
+        'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
+        'LOCATION': 'bill_cache',
+        # Two entries per bill searched, its data and version.
+        'OPTIONS': {'MAX_ENTRIES': 100000},
+    },
+}
+
+
 # Internationalization
 # https://docs.djangoproject.com/en/2.0/topics/i18n/
 
@@ -125,6 +147,103 @@ USE_TZ = True
 
 STATIC_URL = '/static/'
 
+
+# Call records ingestion
+
+CALL_RECORDS_BATCH_MAX_SIZE = 10000
+
+CALL_RECORDS_STREAM_CHUNK_SIZE = 1000
+
+# Longest line, in bytes, accepted by the streaming ingestion endpoint.
+CALL_RECORDS_STREAM_MAX_LINE_SIZE = 16 * 1024
+
+# Call records listed per page, unless a page_size up to the maximum is given.
+CALL_RECORDS_PAGE_SIZE = 100
+
+CALL_RECORDS_MAX_PAGE_SIZE = 1000
+
+
+# Streaming responses
+
+# Rows fetched from the database and rendered per chunk of a streamed list.
+STREAMING_RESPONSE_CHUNK_SIZE = 1000
+
+
+# Billing
+
+# Calls billed per transaction by run_billing_workers.
+BILLING_QUEUE_BATCH_SIZE = 500
+
+# Seconds an idle billing worker waits before polling the queue again.
+BILLING_QUEUE_POLL_INTERVAL = 1
+
+# Failed attempts after which a queued call is left aside for inspection.
+BILLING_QUEUE_MAX_ATTEMPTS = 5
+
+# Cache holding the bills of closed periods.
+BILL_CACHE_ALIAS = 'bills'
+
+# Seconds a cached bill is kept, in case it misses an invalidation.
+BILL_CACHE_TIMEOUT = 24 * 60 * 60
+
+# Upcoming months ensure_partitions creates bill record partitions for.
+BILL_RECORD_PARTITIONS_AHEAD = 3
+
+# Months of bill record partitions to keep attached, None keeps them all.
+BILL_RECORD_RETENTION_MONTHS = None
+
+
+# Request metrics
+
+# Upper bounds, in seconds, of the request and database time histograms.
+METRICS_DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5,
+                            5, 10)
+
+# Upper bounds of the database queries per request histogram.
+METRICS_QUERY_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200)
+
+# Directory every process writes its histograms to, for /metrics to add
+# them up. Empty it when deploying, None keeps each process to its own.
+METRICS_DIR = os.path.join(BASE_DIR, 'metrics')
+
+# Seconds a process waits before writing its histograms again.
+METRICS_FLUSH_INTERVAL = 1
+
+# /metrics is served to these addresses, and to requests sending one of the
+# tokens in an "Authorization: Bearer <token>" header.
+METRICS_ALLOWED_IPS = ['127.0.0.1', '::1']
+
+METRICS_TOKENS = []
+
+
+# Request profiling
+
+# Directory the profiles of profiled requests are saved to.
+PROFILING_DIR = os.path.join(BASE_DIR, 'profiles')
+
+# Requests sending one of these tokens in this header are profiled.
+PROFILING_HEADER = 'X-Profile'
+
+PROFILING_TOKENS = []
+
+# Share of all requests profiled, between 0 and 1.
+PROFILING_SAMPLE_RATE = 0
+
+
+# Tracing
+
+# Share of requests and billing batches whose spans are written, from 0 to 1.
+TRACING_SAMPLE_RATE = 0
+
+# JSON lines file the spans are written to, rotated past TRACING_MAX_BYTES.
+TRACING_FILE = os.path.join(BASE_DIR, 'traces', 'spans.jsonl')
+
+TRACING_MAX_BYTES = 10 * 1024 * 1024
+
+# Rotated trace files kept.
+TRACING_BACKUP_COUNT = 5
+
+
 # Activate Django-Heroku.
 import django_heroku
 django_heroku.settings(locals())
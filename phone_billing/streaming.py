@@ -0,0 +1,48 @@
+from django.conf import settings
+from django.http import StreamingHttpResponse
+from rest_framework.renderers import JSONRenderer
+
+
+STREAM_QUERY_PARAM = 'stream'
+
+
+def is_stream_requested(request):
+    value = request.query_params.get(STREAM_QUERY_PARAM, '')
+    return value.lower() in ('1', 'true')
+
+
+def render_json(data):
+    return JSONRenderer().render(data)
+
+
+# Renders items one chunk at a time into the same bytes JSONRenderer would
+# produce for the whole list.
+def stream_json_array(items, to_representation, chunk_size=None):
+    chunk_size = chunk_size or settings.STREAMING_RESPONSE_CHUNK_SIZE
+
+    yield b'['
+    chunk = []
+    separator = b''
+    for item in items:
+        chunk.append(render_json(to_representation(item)))
+        if len(chunk) >= chunk_size:
+            yield separator + b','.join(chunk)
+            chunk = []
+            separator = b','
+
+    if chunk:
+        yield separator + b','.join(chunk)
+    yield b']'
+
+
+# Streams data as a JSON object whose last key holds the streamed items.
+def stream_json_object(data, key, items, to_representation, chunk_size=None):
+    head, tail = render_json(dict(data, **{key: []})).rsplit(b'[]', 1)
+
+    yield head
+    yield from stream_json_array(items, to_representation, chunk_size)
+    yield tail
+
+
+def get_streaming_response(chunks):
+    return StreamingHttpResponse(chunks, content_type='application/json')
@@ -0,0 +1,130 @@
+import json
+import os
+from tempfile import TemporaryDirectory
+
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from rest_framework.test import APITestCase
+
+from ..metrics import Counter, Histogram, request_metrics
+
+
+class HistogramTestCase(TestCase):
+    def test_render(self):
+        histogram = Histogram('test_seconds', 'Test.', ('endpoint',),
+                              (0.1, 1))
+        histogram.observe(('a"b',), 0.05)
+        histogram.observe(('a"b',), 0.1)
+        histogram.observe(('a"b',), 5)
+
+        self.assertEquals(histogram.render(), '\n'.join([
+            '# HELP test_seconds Test.',
+            '# TYPE test_seconds histogram',
+            'test_seconds_bucket{endpoint="a\\"b",le="0.1"} 2',
+            'test_seconds_bucket{endpoint="a\\"b",le="1"} 2',
+            'test_seconds_bucket{endpoint="a\\"b",le="+Inf"} 3',
+            'test_seconds_sum{endpoint="a\\"b"} 5.15',
+            'test_seconds_count{endpoint="a\\"b"} 3',
+        ]) + '\n')
+
+    def test_clear(self):
+        histogram = Histogram('test', 'Test.', ('endpoint',), (1,))
+        histogram.observe(('a',), 1)
+        histogram.clear()
+
+        self.assertNotIn('test_count', histogram.render())
+
+
+class CounterTestCase(TestCase):
+    def test_render(self):
+        counter = Counter('test_total', 'Test.', ('result',))
+        counter.inc(('hit',))
+        counter.inc(('hit',))
+        counter.inc(('miss',))
+
+        self.assertEquals(counter.render(), '\n'.join([
+            '# HELP test_total Test.',
+            '# TYPE test_total counter',
+            'test_total{result="hit"} 2',
+            'test_total{result="miss"} 1',
+        ]) + '\n')
+
+    def test_merge_series(self):
+        counter = Counter('test_total', 'Test.', ('result',))
+        counter.inc(('hit',))
+        series = counter.get_series()
+
+        counter.merge_series(series, counter.load_series([[['hit'], 3]]))
+
+        self.assertEquals(series, {('hit',): 4})
+
+
+@override_settings(METRICS_DIR=None)
+class RequestMetricsMiddlewareTestCase(APITestCase):
+    def setUp(self):
+        request_metrics.clear()
+        self.addCleanup(request_metrics.clear)
+
+    def test_headers(self):
+        response = self.client.get(reverse('call:records'))
+
+        self.assertEquals(response.status_code, 200)
+        self.assertEquals(response['X-DB-Queries'], '1')
+        db, view = response['Server-Timing'].split(', ')
+        self.assertTrue(db.startswith('db;dur='))
+        self.assertTrue(view.startswith('view;dur='))
+
+    def test_metrics(self):
+        self.client.get(reverse('call:records'))
+        self.client.get(reverse('call:records'))
+        self.client.get('/unknown/')
+
+        response = self.client.get(reverse('metrics'))
+
+        self.assertEquals(response.status_code, 200)
+        self.assertTrue(response['Content-Type'].startswith('text/plain'))
+        content = response.content.decode()
+        self.assertIn('phone_billing_db_queries_bucket'
+                      '{endpoint="call:records",method="GET",le="1"} 2',
+                      content)
+        self.assertIn('phone_billing_request_duration_seconds_count'
+                      '{endpoint="call:records",method="GET"} 2', content)
+        self.assertIn('phone_billing_db_duration_seconds_count'
+                      '{endpoint="unmatched",method="GET"} 1', content)
+
+    def test_adds_up_processes(self):
+        self.client.get(reverse('call:records'))
+
+        with TemporaryDirectory() as directory, \
+                override_settings(METRICS_DIR=directory,
+                                  METRICS_FLUSH_INTERVAL=0):
+            other_process = {'phone_billing_db_queries': [
+                [['call:records', 'GET'], [0, 3] + [0] * 8, 3],
+            ]}
+            with open(os.path.join(directory, 'metrics-1-a.json'),
+                      'w') as file:
+                json.dump(other_process, file)
+
+            self.client.get(reverse('call:records'))
+            with open(request_metrics.path) as file:
+                flushed = json.load(file)
+            response = self.client.get(reverse('metrics'))
+            request_metrics.clear()
+
+        self.assertEquals(len(flushed['phone_billing_db_queries']), 1)
+        self.assertIn('phone_billing_db_queries_bucket'
+                      '{endpoint="call:records",method="GET",le="1"} 5',
+                      response.content.decode())
+
+    @override_settings(METRICS_ALLOWED_IPS=[], METRICS_TOKENS=['secret'])
+    def test_access(self):
+        self.assertEquals(self.client.get(reverse('metrics')).status_code,
+                          403)
+        response = self.client.get(reverse('metrics'),
+                                   HTTP_AUTHORIZATION='Bearer wrong')
+        self.assertEquals(response.status_code, 403)
+
+        response = self.client.get(reverse('metrics'),
+                                   HTTP_AUTHORIZATION='Bearer secret')
+
+        self.assertEquals(response.status_code, 200)
@@ -0,0 +1,91 @@
+import glob
+import json
+import os
+import tempfile
+from io import StringIO
+from unittest.mock import patch
+
+from django.core.management import call_command
+from django.test import override_settings
+from django.urls import reverse
+from rest_framework.test import APITestCase
+
+
+class ProfilingMiddlewareTestCase(APITestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+
+        settings = override_settings(PROFILING_DIR=self.directory,
+                                     PROFILING_TOKENS=['secret'])
+        settings.enable()
+        self.addCleanup(settings.disable)
+
+    def get_profiles(self):
+        return sorted(glob.glob(os.path.join(self.directory, '*.prof')))
+
+    def test_not_profiled_by_default(self):
+        response = self.client.get(reverse('call:records'))
+
+        self.assertNotIn('X-Profile-Id', response)
+        self.assertEquals(self.get_profiles(), [])
+
+    def test_profiled_with_allowed_token(self):
+        response = self.client.get(reverse('call:records'),
+                                   HTTP_X_PROFILE='secret')
+
+        self.assertEquals(response.status_code, 200)
+        profile, = self.get_profiles()
+        self.assertEquals(os.path.basename(profile),
+                          response['X-Profile-Id'] + '.prof')
+        with open(profile[:-len('.prof')] + '.json') as file:
+            metadata = json.load(file)
+        self.assertEquals(metadata['endpoint'], 'call:records')
+        self.assertEquals(metadata['method'], 'GET')
+        self.assertEquals(metadata['status'], 200)
+        self.assertEquals(metadata['trigger'], 'header')
+
+    def test_phone_numbers_are_not_saved(self):
+        self.client.get(reverse('bill:search', args=['00123456789']),
+                        {'period': '02/2018'}, HTTP_X_PROFILE='secret')
+
+        profile, = self.get_profiles()
+        with open(profile[:-len('.prof')] + '.json') as file:
+            metadata = file.read()
+        self.assertIn('"bill:search"', metadata)
+        self.assertNotIn('00123456789', metadata)
+
+    def test_not_profiled_with_other_token(self):
+        self.client.get(reverse('call:records'), HTTP_X_PROFILE='other')
+
+        self.assertEquals(self.get_profiles(), [])
+
+    @patch('phone_billing.profiling.random.random', return_value=0.2)
+    def test_sampled(self, mock_random):
+        with override_settings(PROFILING_SAMPLE_RATE=0.5):
+            self.client.get(reverse('call:records'))
+        with override_settings(PROFILING_SAMPLE_RATE=0.1):
+            self.client.get(reverse('call:records'))
+
+        self.assertEquals(len(self.get_profiles()), 1)
+
+    def test_summarize_profiles(self):
+        self.client.get(reverse('call:records'), HTTP_X_PROFILE='secret')
+        self.client.get(reverse('call:records'), HTTP_X_PROFILE='secret')
+        stdout = StringIO()
+
+        call_command('summarize_profiles', '--sort', 'cumtime', '--limit',
+                     '5', stdout=stdout)
+
+        output = stdout.getvalue()
+        self.assertIn('2 profiles:', output)
+        self.assertIn('call:records: 2 requests', output)
+        functions = output.split('  function\n')[1].splitlines()
+        self.assertEquals(len(functions), 5)
+        self.assertIn('_get_response', output)
+
+        stdout = StringIO()
+        call_command('summarize_profiles', '--endpoint', 'bill:search',
+                     stdout=stdout)
+        self.assertIn('No profiles found.', stdout.getvalue())
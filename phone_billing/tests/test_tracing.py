@@ -0,0 +1,110 @@
+import json
+import os
+import tempfile
+from io import StringIO
+
+from django.core.management import call_command
+from django.test import override_settings
+from django.urls import reverse
+from rest_framework.test import APITestCase
+
+from ..tracing import get_trace_path, span, trace
+
+
+class TracingTestCase(APITestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, 'spans.jsonl')
+
+        settings = override_settings(TRACING_FILE=self.path,
+                                     TRACING_SAMPLE_RATE=1)
+        settings.enable()
+        self.addCleanup(settings.disable)
+
+    def read_spans(self):
+        path = get_trace_path(self.path)
+        if not os.path.exists(path):
+            return []
+        with open(path) as file:
+            return [json.loads(line) for line in file]
+
+    def test_spans(self):
+        with trace('root', size=2) as root:
+            with span('child', call_id=1) as child:
+                with span('grandchild'):
+                    pass
+                child.set_attributes(status='done')
+
+        grandchild, child, root = self.read_spans()
+        self.assertEquals(root['name'], 'root')
+        self.assertIsNone(root['parent_id'])
+        self.assertEquals(root['attributes'], {'size': 2})
+        self.assertEquals(child['parent_id'], root['span_id'])
+        self.assertEquals(child['attributes'],
+                          {'call_id': 1, 'status': 'done'})
+        self.assertEquals(grandchild['parent_id'], child['span_id'])
+        self.assertEquals({span['trace_id'] for span in (root, child)},
+                          {root['trace_id']})
+        self.assertGreaterEqual(root['duration_ms'], child['duration_ms'])
+
+    def test_error(self):
+        with self.assertRaises(ValueError):
+            with trace('root'):
+                raise ValueError
+
+        root, = self.read_spans()
+        self.assertEquals(root['attributes'], {'error': 'ValueError'})
+
+    def test_not_sampled(self):
+        with override_settings(TRACING_SAMPLE_RATE=0):
+            with trace('root') as root:
+                root.set_attributes(size=1)
+                with span('child'):
+                    pass
+
+        with span('orphan'):
+            pass
+
+        self.assertEquals(self.read_spans(), [])
+
+    def test_request(self):
+        response = self.client.post(reverse('call:records'), {
+            'id': 1, 'type': 'start', 'timestamp': 1514764800, 'call_id': 1,
+            'source': '00123456789', 'destination': '10123456789',
+        }, format='json')
+
+        self.assertEquals(response.status_code, 201)
+        spans = {span['name']: span for span in self.read_spans()}
+        self.assertEquals(spans['request']['attributes'],
+                          {'method': 'POST', 'endpoint': 'call:records',
+                           'status': 201})
+        self.assertEquals(spans['ingest.upsert']['attributes'],
+                          {'call_id': 1, 'record_id': 1})
+        self.assertEquals(spans['ingest.validate']['parent_id'],
+                          spans['request']['span_id'])
+        self.assertIn('ingest.sync_bills', spans)
+
+    def test_bill_search_leaves_subscriber_out(self):
+        response = self.client.get(
+            reverse('bill:search', args=['00123456789']),
+            {'period': '01/2018'})
+
+        self.assertEquals(response.status_code, 200)
+        spans = self.read_spans()
+        self.assertIn('bill_search.cache', {span['name'] for span in spans})
+        self.assertNotIn('00123456789', json.dumps(spans))
+
+    def test_summarize_traces(self):
+        for _ in range(3):
+            with trace('root'):
+                with span('child'):
+                    pass
+        stdout = StringIO()
+
+        call_command('summarize_traces', '--file', self.path,
+                     '--name', 'child', stdout=stdout)
+
+        lines = stdout.getvalue().splitlines()
+        self.assertEquals(len(lines), 2)
+        self.assertEquals(lines[1].split()[:2], ['child', '3'])
@@ -0,0 +1,212 @@
+import glob
+import json
+import logging
+import os
+import random
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import lru_cache
+from logging.handlers import RotatingFileHandler
+from time import perf_counter, time
+from uuid import uuid4
+
+from django.conf import settings
+
+from .metrics import get_endpoint
+
+
+_current_span = ContextVar('current_span', default=None)
+
+
+class Span:
+    def __init__(self, name, parent=None, attributes=None):
+        self.name = name
+        self.span_id = uuid4().hex[:16]
+        if parent is None:
+            self.trace_id = uuid4().hex
+            self.parent_id = None
+            self.root = self
+            # Finished spans of the trace, written once the root finishes.
+            self.spans = []
+        else:
+            self.trace_id = parent.trace_id
+            self.parent_id = parent.span_id
+            self.root = parent.root
+        self.attributes = dict(attributes or {})
+        self.started_at = time()
+        self.started_at_counter = perf_counter()
+        self.duration = None
+
+    def set_attributes(self, **attributes):
+        self.attributes.update(attributes)
+
+    def finish(self):
+        self.duration = perf_counter() - self.started_at_counter
+
+    def to_dict(self):
+        return {
+            'trace_id': self.trace_id,
+            'span_id': self.span_id,
+            'parent_id': self.parent_id,
+            'name': self.name,
+            'started_at': self.started_at,
+            'duration_ms': self.duration * 1000,
+            'attributes': self.attributes,
+        }
+
+
+class UnsampledSpan:
+    """Stands for the spans of traces that are not recorded, at no cost."""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+    def set_attributes(self, **attributes):
+        pass
+
+
+UNSAMPLED_SPAN = UnsampledSpan()
+
+
+@contextmanager
+def run_span(span):
+    token = _current_span.set(span)
+    try:
+        yield span
+    except Exception as exc:
+        span.set_attributes(error=type(exc).__name__)
+        raise
+    finally:
+        _current_span.reset(token)
+        span.finish()
+        span.root.spans.append(span)
+        if span is span.root:
+            write_spans(span.root.spans)
+
+
+def trace(name, **attributes):
+    """Starts a trace, recorded for a TRACING_SAMPLE_RATE share of them.
+
+    Within a recorded trace, starts a span of it instead.
+    """
+    if _current_span.get() is not None:
+        return span(name, **attributes)
+
+    rate = settings.TRACING_SAMPLE_RATE
+    if not rate or random.random() >= rate:
+        return UNSAMPLED_SPAN
+
+    return run_span(Span(name, attributes=attributes))
+
+
+def span(name, **attributes):
+    """Starts a span of the current trace, if it is recorded."""
+    parent = _current_span.get()
+    if parent is None:
+        return UNSAMPLED_SPAN
+
+    return run_span(Span(name, parent, attributes))
+
+
+@lru_cache(maxsize=None)
+def get_trace_handler(path, max_bytes, backup_count):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    return RotatingFileHandler(path, maxBytes=max_bytes,
+                               backupCount=backup_count)
+
+
+def get_trace_path(path):
+    # Each process rotates a file of its own, as rotation is not shared.
+    return f'{path}.{os.getpid()}'
+
+
+def write_spans(spans):
+    handler = get_trace_handler(get_trace_path(settings.TRACING_FILE),
+                                settings.TRACING_MAX_BYTES,
+                                settings.TRACING_BACKUP_COUNT)
+    for finished in spans:
+        handler.handle(logging.makeLogRecord(
+            {'msg': json.dumps(finished.to_dict(), default=str)}))
+
+
+class TracingMiddleware:
+    """Traces requests as the root span of the spans run to handle them.
+
+    Paths are left out as they may hold subscribers' phone numbers.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        with trace('request', method=request.method) as root:
+            response = self.get_response(request)
+            root.set_attributes(endpoint=get_endpoint(request),
+                                status=response.status_code)
+        return response
+
+
+def percentile(values, percent):
+    values = sorted(values)
+    index = min(len(values) - 1, int(round(percent / 100 * len(values))))
+    return values[index]
+
+
+class TraceSummary:
+    """Adds up the spans written to the trace files, per span name."""
+
+    def __init__(self, path=None, names=None, stdout=None):
+        self.path = path or settings.TRACING_FILE
+        self.names = names
+        self.stdout = stdout
+
+    def log(self, message):
+        if self.stdout:
+            self.stdout.write(message)
+
+    def get_paths(self):
+        # The files of every process and the ones rotated out of them.
+        paths = glob.glob(glob.escape(self.path) + '.*')
+        if os.path.exists(self.path):
+            paths.append(self.path)
+        return sorted(paths)
+
+    def read_durations(self):
+        durations = {}
+        for path in self.get_paths():
+            with open(path) as file:
+                for line in file:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        continue
+                    if self.names and record['name'] not in self.names:
+                        continue
+                    durations.setdefault(record['name'], []).append(
+                        record['duration_ms'])
+        return durations
+
+    def run(self):
+        durations = self.read_durations()
+        if not durations:
+            self.log('No spans found.')
+            return {}
+
+        stages = {}
+        self.log(f'{"span":<32} {"count":>8} {"p50 ms":>10} {"p95 ms":>10}'
+                 f' {"p99 ms":>10}')
+        for name, values in sorted(durations.items()):
+            stages[name] = {
+                'count': len(values),
+                'p50': percentile(values, 50),
+                'p95': percentile(values, 95),
+                'p99': percentile(values, 99),
+            }
+            self.log(f'{name:<32} {len(values):>8}'
+                     f' {stages[name]["p50"]:>10.3f}'
+                     f' {stages[name]["p95"]:>10.3f}'
+                     f' {stages[name]["p99"]:>10.3f}')
+        return stages
@@ -18,10 +18,12 @@ from django.urls import path, include
 
 from .call import urls as call_urls
 from .bill import urls as bill_urls
+from .metrics import metrics_view
 
 
 urlpatterns = [
     path('api/call/', include((call_urls, 'call'))),
     path('api/bill/', include((bill_urls, 'bill'))),
     path('admin/', admin.site.urls),
+    path('metrics', metrics_view, name='metrics'),
 ]